@@ -0,0 +1,121 @@
+"""Anomaly detection of weekly revenue with cached models"""
+
+import threading
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Optional, List
+
+from funcs import data_version, normalize_filter_key, revenue_per_period
+from metrics import METRICS
+
+if TYPE_CHECKING:
+    from sklearn.ensemble import IsolationForest
+
+ANOMALY_METHODS = ["isolation_forest", "rolling_mad", "ewma"]
+
+def rolling_mad_anomalies(weeks: pd.DataFrame, window: int = 8, threshold: float = 3.0) -> np.ndarray:
+    """
+    Marks weeks deviating from rolling median of previous weeks by more than
+    threshold robust standard deviations (1.4826 * MAD)
+    :return: array of 1 (normal) and -1 (anomaly) as IsolationForest.predict
+    """
+    revenue = weeks["revenue"].astype(np.float64)
+    history = revenue.shift(1).rolling(window, min_periods=3)
+    median = history.median()
+    mad = (revenue.shift(1) - median).abs().rolling(window, min_periods=3).median()
+    score = (revenue - median).abs() / (1.4826 * mad.replace(0, np.nan))
+    return np.where(score.to_numpy() > threshold, -1, 1)
+
+def ewma_anomalies(weeks: pd.DataFrame, span: int = 8, threshold: float = 3.0) -> np.ndarray:
+    """
+    Marks weeks outside of band of threshold exponentially weighted standard
+    deviations around exponentially weighted mean of previous weeks
+    :return: array of 1 (normal) and -1 (anomaly) as IsolationForest.predict
+    """
+    history = weeks["revenue"].astype(np.float64).shift(1)
+    mean = history.ewm(span=span, min_periods=3).mean()
+    std = history.ewm(span=span, min_periods=3).std()
+    score = (weeks["revenue"] - mean).abs() / std.replace(0, np.nan)
+    return np.where(score.to_numpy() > threshold, -1, 1)
+
+class AnomalyService:
+    """
+    Detects anomalous weeks of weekly revenue
+    
+    IsolationForest models are fitted on the whole weekly history of a dropdown
+    selection and cached by the selection and data version, so changing the date
+    range only scores the selected weeks with an already fitted model. Models are
+    seeded, identical requests mark identical weeks. rolling_mad and ewma methods
+    are streaming detectors without fitting.
+    """
+    def __init__(self, contamination: float = 0.07, random_state: int = 0, max_models: int = 128):
+        """
+        :param contamination: contamination parameter for IsolationForest
+        :param random_state: seed of IsolationForest
+        :param max_models: maximal number of cached models
+        """
+        self.contamination = contamination
+        self.random_state = random_state
+        self.max_models = max_models
+        self._models = OrderedDict()
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+
+    def _fit(self, weeks: pd.DataFrame) -> "IsolationForest":
+        # sklearn takes a second to import, it is loaded when the first model is fitted
+        from sklearn.ensemble import IsolationForest
+        return IsolationForest(contamination=self.contamination, random_state=self.random_state).fit(weeks[["revenue"]])
+
+    def get_model(self, df: pd.DataFrame, category: Optional[List[str]] = None, region: Optional[List[str]] = None,
+                  shipcountry: Optional[List[str]] = None, period: str = "week") -> Optional["IsolationForest"]:
+        """
+        Returns IsolationForest fitted on all periods of the selection or None if there are no orders
+        :param df: indexed dataframe or query backend
+        :param period: period of revenue the model is fitted on, see revenue_per_period
+        """
+        version = data_version(df)
+        key = (normalize_filter_key(None, None, category, region, shipcountry), period, version)
+        with self._lock:
+            if version is not None and key in self._models:
+                self._models.move_to_end(key)
+                return self._models[key]
+        with METRICS.stage("aggregate") as stage:
+            history = revenue_per_period(df, period, None, None, category, region, shipcountry)
+            stage.rows(len(history))
+        model = self._fit(history) if len(history) != 0 else None
+        if version is not None:
+            with self._lock:
+                self._models[key] = model
+                while len(self._models) > self.max_models:
+                    self._models.popitem(last=False)
+        return model
+
+    def detect(self, df: pd.DataFrame, weeks: pd.DataFrame, category: Optional[List[str]] = None,
+               region: Optional[List[str]] = None, shipcountry: Optional[List[str]] = None,
+               method: str = "isolation_forest", period: str = "week") -> pd.DataFrame:
+        """
+        Returns weekly revenue with anomaly column (-1 for anomalies, 1 otherwise)
+        :param df: order data weeks were computed from
+        :param weeks: revenue per period of df for the selection, see revenue_per_period
+        :param method: one of ANOMALY_METHODS
+        :param period: period of weeks, weekly revenue by default
+        """
+        weeks = weeks.copy()
+        if len(weeks) == 0:
+            weeks["anomaly"] = pd.Series(dtype=np.int64)
+        elif method == "rolling_mad":
+            weeks["anomaly"] = rolling_mad_anomalies(weeks)
+        elif method == "ewma":
+            weeks["anomaly"] = ewma_anomalies(weeks)
+        elif method == "isolation_forest":
+            model = self.get_model(df, category, region, shipcountry, period)
+            weeks["anomaly"] = model.predict(weeks[["revenue"]]) if model is not None else 1
+        else:
+            raise ValueError(f"unknown anomaly detection method '{method}', expected one of {ANOMALY_METHODS}")
+        return weeks
+
+ANOMALY_SERVICE = AnomalyService()
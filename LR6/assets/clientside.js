@@ -0,0 +1,215 @@
+// Clientside callbacks of dashboard: link of export and, in clientside mode, filters and aggregations of
+// weekly revenue cube returned by drawer.get_clientside_cube in the browser
+
+(function () {
+    var DAY_MS = 24 * 3600 * 1000;
+    var DATA_BARS_MAX_RULES = 32;
+
+    // day number of 'YYYY-MM-DD' date
+    function dayNumber(date) {
+        return Math.round(Date.parse(date.slice(0, 10)) / DAY_MS);
+    }
+
+    function weekLabel(cube, week) {
+        return new Date((cube.first_week + 7 * week) * DAY_MS).toISOString().slice(0, 10);
+    }
+
+    function roundCents(value) {
+        return Math.round(value * 100) / 100;
+    }
+
+    // positions of cells matching filters as filter_dataframe, date range is applied
+    // to whole weeks: week is selected if it has at least one day in the range
+    function selectCells(cube, start_date, end_date, filters) {
+        var first = -Infinity, last = Infinity;
+        if (start_date && end_date) {
+            first = Math.ceil((dayNumber(start_date) - cube.first_week) / 7);
+            last = Math.floor((dayNumber(end_date) + 6 - cube.first_week) / 7);
+        }
+        var allowed = [];
+        Object.keys(filters).forEach(function (column) {
+            var values = filters[column];
+            if (values && values.length) {
+                var codes = new Set();
+                values.forEach(function (value) {
+                    codes.add(cube[column + '_values'].indexOf(value));
+                });
+                allowed.push([cube[column], codes]);
+            }
+        });
+        var cells = [];
+        for (var i = 0; i < cube.week.length; i++) {
+            var week = cube.week[i];
+            if (week < first || week > last) {
+                continue;
+            }
+            var selected = true;
+            for (var j = 0; j < allowed.length && selected; j++) {
+                selected = allowed[j][1].has(allowed[j][0][i]);
+            }
+            if (selected) {
+                cells.push(i);
+            }
+        }
+        return cells;
+    }
+
+    // evenly spaced numbers as np.linspace
+    function linspace(start, stop, num) {
+        var values = [];
+        for (var i = 0; i < num; i++) {
+            values.push(num === 1 ? start : start + (stop - start) * i / (num - 1));
+        }
+        return values;
+    }
+
+    // style_data_conditional with diverging data bars as drawer.data_bars_diverging
+    function dataBarsDiverging(values, column, maxRules) {
+        var colorAbove = '#0074D9', colorBelow = '#FF4136';
+        values = values.concat([0]).sort(function (a, b) { return a - b; });
+        var negCount = values.filter(function (value) { return value <= 0; }).length;
+        var bounds = linspace(0, 0.5, negCount).concat(linspace(0.5, 1, values.length - negCount));
+        var ranks = values.map(function (_, i) { return i; });
+        if (values.length > maxRules + 1) {
+            var edges = new Set(linspace(0, values.length - 1, maxRules).map(Math.round).concat([negCount - 1]));
+            ranks = Array.from(edges).sort(function (a, b) { return a - b; });
+        }
+        var styles = [];
+        for (var i = 1; i < ranks.length; i++) {
+            var minBound = values[ranks[i - 1]], maxBound = values[ranks[i]];
+            var query = '{' + column + '} >= ' + minBound;
+            if (i < ranks.length - 1) {
+                query += ' && {' + column + '} < ' + maxBound;
+            }
+            var style = {'if': {'filter_query': query, 'column_id': column}, 'paddingBottom': 8, 'paddingTop': 8};
+            var bound;
+            if (maxBound > 0) {
+                bound = bounds[ranks[i]] * 100;
+                style.background = 'linear-gradient(90deg, white 0%, white 50%, ' + colorAbove + ' 50%, ' + colorAbove +
+                    ' ' + bound + '%, white ' + bound + '%, white 100%)';
+            } else {
+                bound = bounds[ranks[i - 1]] * 100;
+                style.background = 'linear-gradient(90deg, white 0%, white ' + bound + '%, ' + colorBelow + ' ' + bound +
+                    '%, ' + colorBelow + ' 50%, white 50%, white 100%)';
+            }
+            styles.push(style);
+        }
+        return styles;
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        northwind: {
+            // url of export.install_export route with current filters, list filters are repeated arguments
+            export_href: function (path, dataset, format, start_date, end_date, category, region, shipcountry) {
+                var params = new URLSearchParams();
+                if (start_date && end_date) {
+                    params.append('start_date', start_date.slice(0, 10));
+                    params.append('end_date', end_date.slice(0, 10));
+                }
+                [['category', category], ['region', region], ['shipcountry', shipcountry]].forEach(function (filter) {
+                    (filter[1] || []).forEach(function (value) {
+                        params.append(filter[0], value);
+                    });
+                });
+                var query = params.toString();
+                return path + '/' + dataset + '.' + format + (query ? '?' + query : '');
+            },
+
+            // revenue per week with anomalous weeks found by server, as drawer.revenue_figure
+            revenue_figure: function (cube, anomalies, start_date, end_date, category, region, shipcountry) {
+                if (!cube) {
+                    return window.dash_clientside.no_update;
+                }
+                var cells = selectCells(cube, start_date, end_date,
+                                        {categoryname: category, region: region, shipcountry: shipcountry});
+                var revenue = {}, first = Infinity, last = -Infinity;
+                cells.forEach(function (i) {
+                    var week = cube.week[i];
+                    revenue[week] = (revenue[week] || 0) + cube.revenue[i];
+                    first = Math.min(first, week);
+                    last = Math.max(last, week);
+                });
+                // weeks without orders between the first and the last one have zero revenue
+                var x = [], y = [], labels = {};
+                for (var week = first; week <= last; week++) {
+                    var label = weekLabel(cube, week);
+                    labels[label] = roundCents(revenue[week] || 0);
+                    x.push(label);
+                    y.push(labels[label]);
+                }
+                var anomalous = (anomalies || []).filter(function (label) { return label in labels; });
+                return {
+                    data: [
+                        {type: 'scatter', mode: 'lines', name: 'Revenue', x: x, y: y},
+                        {type: 'scatter', mode: 'markers', name: 'Anomaly', x: anomalous,
+                         y: anomalous.map(function (label) { return labels[label]; })}
+                    ],
+                    layout: cube.layouts.revenue
+                };
+            },
+
+            // mean revenue of order line per week for each region, as drawer.box_figure
+            // with quartiles and outliers computed by plotly.js
+            box_figure: function (cube, start_date, end_date, category, shipcountry) {
+                if (!cube) {
+                    return window.dash_clientside.no_update;
+                }
+                var cells = selectCells(cube, start_date, end_date, {categoryname: category, shipcountry: shipcountry});
+                var sums = new Map(), regions = [];
+                cells.forEach(function (i) {
+                    var key = cube.region[i] + ',' + cube.week[i];
+                    var sum = sums.get(key);
+                    if (sum === undefined) {
+                        sum = {region: cube.region[i], revenue: 0, count: 0};
+                        sums.set(key, sum);
+                    }
+                    sum.revenue += cube.revenue[i];
+                    sum.count += cube.count[i];
+                });
+                // regions in order of their first week, weeks are sorted
+                var means = {};
+                sums.forEach(function (sum) {
+                    var region = cube.region_values[sum.region];
+                    if (!(region in means)) {
+                        means[region] = [];
+                        regions.push(region);
+                    }
+                    means[region].push(roundCents(sum.revenue / sum.count));
+                });
+                var traces = regions.map(function (region, i) {
+                    return {
+                        type: 'box', orientation: 'h', name: region, legendgroup: region, showlegend: true,
+                        marker: {color: cube.colors[i % cube.colors.length]}, boxpoints: 'outliers', notched: false,
+                        offsetgroup: region, alignmentgroup: 'True', x: means[region],
+                        y: means[region].map(function () { return region; }),
+                        hovertemplate: 'region=%{y}<br>revenue=%{x}<extra></extra>'
+                    };
+                });
+                var layout = Object.assign({}, cube.layouts.box, {
+                    yaxis: Object.assign({}, cube.layouts.box.yaxis,
+                                         {categoryorder: 'array', categoryarray: regions.slice().reverse()})
+                });
+                return {data: traces, layout: layout};
+            },
+
+            // revenue of ship countries with data bars, table sorts and pages them itself
+            shipcountries_table: function (cube, start_date, end_date, category, region) {
+                if (!cube) {
+                    return [window.dash_clientside.no_update, window.dash_clientside.no_update];
+                }
+                var cells = selectCells(cube, start_date, end_date, {categoryname: category, region: region});
+                var revenue = {};
+                cells.forEach(function (i) {
+                    var country = cube.shipcountry_values[cube.shipcountry[i]];
+                    revenue[country] = (revenue[country] || 0) + cube.revenue[i];
+                });
+                var records = Object.keys(revenue).map(function (country) {
+                    return {shipcountry: country, revenue: roundCents(revenue[country])};
+                });
+                records.sort(function (a, b) { return b.revenue - a.revenue; });
+                var values = records.map(function (record) { return record.revenue; });
+                return [records, dataBarsDiverging(values, 'revenue', DATA_BARS_MAX_RULES)];
+            }
+        }
+    });
+})();
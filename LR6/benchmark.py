@@ -0,0 +1,480 @@
+"""Benchmarks of dashboard data functions on synthetic data"""
+
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+from contextlib import closing
+from functools import partial
+from typing import Callable, List, Optional, Tuple
+
+from funcs import (get_dataframe, build_indexes, filter_dataframe, weekly_revenue, revenue_by,
+                   weekly_mean_revenue_by_region, revenue_per_period, load_orders, compact_schema,
+                   anomaly_detection, FILTER_CACHE)
+from drawer import (data_bars_diverging, get_table_page, revenue_figure, sunburst_figure, box_figure, top_products,
+                    TEXT_STYLE, TEXT_SIZE, TEXT_COLOR, BACKGROUND_COLOR, REVENUE_MAX_POINTS)
+from anomaly import ANOMALY_SERVICE
+
+def make_orders(n_rows: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Returns indexed dataframe of n_rows order lines resampled from northwind.db
+    Order dates are spread uniformly over ten years.
+    """
+    rng = np.random.default_rng(seed)
+    source = get_dataframe()
+    df = source.iloc[rng.integers(0, len(source), n_rows)].reset_index(drop=True)
+    df["orderdate"] = pd.to_datetime("2010-01-01") + pd.to_timedelta(rng.integers(0, 3650, n_rows), unit="D")
+    df = df.sort_values("orderdate", kind="stable", ignore_index=True)
+    build_indexes(df)
+    return df
+
+def measure(func: Callable, repeat: int = 5) -> float:
+    """
+    Returns best of repeat wall times of func() in seconds
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def bench_filter(rows: List[int]):
+    """
+    Compares indexed filter_dataframe with the isin chain on unindexed copy
+    """
+    print(f"{'rows':>10} {'case':<28} {'isin, ms':>10} {'index, ms':>10}")
+    for n_rows in rows:
+        df = make_orders(n_rows)
+        plain = df.copy()  # copy has no indexes, filter_dataframe scans it with masks and isin
+        categories = df.categoryname.unique()[:2].tolist()
+        regions = df.region.unique()[:2].tolist()
+        countries = df.shipcountry.unique()[:3].tolist()
+        cases = {
+            "date range": ("2012-01-01", "2014-12-31", None, None, None),
+            "date + category": ("2012-01-01", "2014-12-31", categories, None, None),
+            "date + all dropdowns": ("2012-01-01", "2014-12-31", categories, regions, countries),
+            "all dropdowns": (None, None, categories, regions, countries),
+        }
+        for name, args in cases.items():
+            isin_time = measure(lambda: filter_dataframe(plain, *args))
+            index_time = measure(lambda: filter_dataframe(df, *args))
+            print(f"{n_rows:>10} {name:<28} {isin_time * 1000:>10.1f} {index_time * 1000:>10.1f}")
+
+def bench_data_bars(rows: List[int]):
+    """
+    Compares one data bar rule per row with bucketed rules: generation time and JSON payload
+    """
+    rng = np.random.default_rng(0)
+    print(f"{'rows':>10} {'rules':>8} {'per row, ms':>12} {'per row, KB':>12} {'rules':>6} {'bucketed, ms':>13} {'bucketed, KB':>13}")
+    for n_rows in rows:
+        df = pd.DataFrame({"revenue": rng.lognormal(8, 1.5, n_rows) * rng.choice([-1, 1], n_rows, p=[0.05, 0.95])})
+        per_row = data_bars_diverging(df, "revenue", max_rules=None)
+        bucketed = data_bars_diverging(df, "revenue")
+        per_row_time = measure(lambda: data_bars_diverging(df, "revenue", max_rules=None), repeat=3)
+        bucketed_time = measure(lambda: data_bars_diverging(df, "revenue"))
+        print(f"{n_rows:>10} {len(per_row):>8} {per_row_time * 1000:>12.1f} {len(json.dumps(per_row)) / 1024:>12.1f} "
+              f"{len(bucketed):>6} {bucketed_time * 1000:>13.1f} {len(json.dumps(bucketed)) / 1024:>13.1f}")
+
+def bench_tables(rows: List[int], page_size: int = 20):
+    """
+    Compares sending the whole sorted table with sending one page selected by get_table_page
+    """
+    rng = np.random.default_rng(0)
+    sort_by = [{"column_id": "revenue", "direction": "desc"}]
+    print(f"{'rows':>10} {'full, ms':>10} {'full, KB':>10} {'page, ms':>10} {'page, KB':>10}")
+    for n_rows in rows:
+        df = pd.DataFrame({"customerid": [f"C{i:07d}" for i in range(n_rows)],
+                           "revenue": rng.lognormal(8, 1.5, n_rows) * rng.choice([-1, 1], n_rows, p=[0.05, 0.95])})
+
+        def full_table():
+            sorted_df = df.sort_values("revenue", ascending=False)
+            return sorted_df.to_dict("records"), data_bars_diverging(sorted_df, "revenue")
+
+        full_time = measure(full_table, repeat=3)
+        page_time = measure(lambda: get_table_page(df, sort_by, 10, page_size))
+        print(f"{n_rows:>10} {full_time * 1000:>10.1f} {len(json.dumps(full_table())) / 1024:>10.1f} "
+              f"{page_time * 1000:>10.1f} {len(json.dumps(get_table_page(df, sort_by, 10, page_size))) / 1024:>10.1f}")
+
+def bench_prefix_sums(rows: List[int]):
+    """
+    Compares revenue_by answered by prefix sum indexes with grouping of filtered order lines
+    """
+    from funcs import PREFIX_SUM_COLUMNS, PrefixSumIndex, get_indexes
+    print(f"{'rows':>10} {'build, s':>9} {'groups':<28} {'scan, ms':>9} {'index, ms':>10}")
+    for n_rows in rows:
+        df = make_orders(n_rows)
+        plain = df.copy()  # copy has no indexes, revenue_by filters and groups its lines
+        start = time.perf_counter()
+        for columns in PREFIX_SUM_COLUMNS:
+            PrefixSumIndex(df, columns, get_indexes(df)["orderdate"])
+        build_time = time.perf_counter() - start
+        cases = {
+            "categoryname, productname": (['categoryname', 'productname'], "2012-01-01", "2014-12-31", None, None, None),
+            "shipcountry": (['shipcountry'], "2012-01-01", "2014-12-31", None, None, None),
+            "customerid": (['customerid'], "2012-03-15", "2018-06-30", None, None, None),
+        }
+        for name, args in cases.items():
+            scan_time = measure(lambda: revenue_by(plain, *args, sort=False))
+            index_time = measure(lambda: revenue_by(df, *args, sort=False))
+            print(f"{n_rows:>10} {build_time:>9.1f} {name:<28} {scan_time * 1000:>9.1f} {index_time * 1000:>10.1f}")
+
+def bench_map_reduce(rows: List[int], processes: List[int]):
+    """
+    Scaling of MAP_REDUCE_ENGINE aggregations of the dashboard with number of worker processes
+    One process aggregates the same partitions in process. Shared columns are created before timing.
+    """
+    from funcs import select_page
+    from mapreduce import MAP_REDUCE_ENGINE
+    cases = {
+        "revenue per day": ([], "day", None),
+        "region, week mean": (["region"], "week", None),
+        "category, product sums": (["categoryname", "productname"], None, None),
+        "top 10 customers": (["customerid"], None, 10),
+    }
+    print(f"{'rows':>10} {'case':<24} {'pandas, ms':>11}" + "".join(f"{f'{n} proc, ms':>13}" for n in processes))
+    for n_rows in rows:
+        df = make_orders(n_rows)
+        plain = df.copy()
+        for name, (by, period, limit) in cases.items():
+            keys = by + (["orderdate"] if period is not None else [])
+            def pandas_aggregate():
+                lines = plain if period is None else plain.assign(orderdate=plain["orderdate"].dt.to_period(
+                    {"day": "D", "week": "W-MON"}[period]).dt.end_time.dt.normalize())
+                result = lines.groupby(keys, sort=False, observed=True)["revenue"].agg(["sum", "count"]).reset_index()
+                return result if limit is None else select_page(result, "sum", ascending=False, page_size=limit)
+            times = []
+            for n_processes in processes:
+                MAP_REDUCE_ENGINE.start(n_processes)
+                def engine_aggregate():
+                    result = MAP_REDUCE_ENGINE.aggregate(df, 0, len(df), by, period)
+                    return result if limit is None else select_page(result, "revenue", ascending=False, page_size=limit)
+                engine_aggregate()  # starts pool and shares columns
+                times.append(measure(engine_aggregate))
+            print(f"{n_rows:>10} {name:<24} {measure(pandas_aggregate, repeat=3) * 1000:>11.1f}"
+                  + "".join(f"{t * 1000:>13.1f}" for t in times))
+    MAP_REDUCE_ENGINE.start(1)
+
+def px_revenue_figure(weeks: pd.DataFrame):
+    """
+    Revenue figure built with go.Figure and update_layout on every update, as before figure templates
+    """
+    import plotly.graph_objects as go
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=weeks['orderdate'], y=weeks['revenue'], mode='lines', name='Revenue'))
+    fig.add_trace(go.Scatter(x=weeks.loc[weeks['anomaly'] == -1, 'orderdate'], y=weeks.loc[weeks['anomaly'] == -1, 'revenue'],
+                             mode='markers', name='Anomaly'))
+    fig.update_layout(font=dict(family=TEXT_STYLE, size=TEXT_SIZE, color=TEXT_COLOR), plot_bgcolor=BACKGROUND_COLOR,
+                      paper_bgcolor=BACKGROUND_COLOR, title='Revenue per week', title_x=0.5)
+    fig.update_xaxes(title_text='Date')
+    fig.update_yaxes(title_text='Revenue')
+    return fig
+
+def px_sunburst_figure(products: pd.DataFrame):
+    """
+    Sunburst figure built with px.sunburst, as before figure templates
+    """
+    import plotly.express as px
+    fig = px.sunburst(products, path=['categoryname', 'productname'], values='revenue',
+                      title='Top 3 categories by sum of revenue of selected time period',
+                      color='categoryname', color_discrete_sequence=px.colors.qualitative.Pastel)
+    fig.update_layout(margin=dict(t=10, l=0, r=0, b=50), title_y=0.05, title_x=0.5,
+                      font=dict(family=TEXT_STYLE, size=TEXT_SIZE, color=TEXT_COLOR),
+                      plot_bgcolor=BACKGROUND_COLOR, paper_bgcolor=BACKGROUND_COLOR)
+    return fig
+
+def px_box_figure(weeks: pd.DataFrame):
+    """
+    Box figure built with px.box, as before figure templates
+    """
+    import plotly.express as px
+    fig = px.box(weeks, x="revenue", y="region", orientation='h', color='region',
+                 title='Mean revenue per week for each region', color_discrete_sequence=px.colors.qualitative.Pastel)
+    fig.update_layout(title_x=0.5, font=dict(family=TEXT_STYLE, size=TEXT_SIZE, color=TEXT_COLOR),
+                      plot_bgcolor=BACKGROUND_COLOR, paper_bgcolor=BACKGROUND_COLOR)
+    return fig
+
+def bench_figures(rows: List[int]):
+    """
+    Compares build and serialization of figures with plotly.express/go.Figure and with figure templates
+    Figures are serialized with to_json_plotly as dash does, inputs of builders are precomputed.
+    """
+    from plotly.io.json import to_json_plotly
+    print(f"{'rows':>10} {'figure':<10} {'px, ms':>8} {'px, KB':>8} {'template, ms':>13} {'template, KB':>13}")
+    for n_rows in rows:
+        df = make_orders(n_rows)
+        weeks = ANOMALY_SERVICE.detect(df, weekly_revenue(df), method="rolling_mad")
+        products = revenue_by(df, ['categoryname', 'productname'])
+        region_weeks = weekly_mean_revenue_by_region(df)
+        cases = {
+            "revenue": (px_revenue_figure, revenue_figure, weeks),
+            "sunburst": (px_sunburst_figure, sunburst_figure, products),
+            "box": (px_box_figure, box_figure, region_weeks),
+        }
+        for name, (px_builder, builder, data) in cases.items():
+            px_time = measure(lambda: to_json_plotly(px_builder(data)))
+            template_time = measure(lambda: to_json_plotly(builder(data)))
+            print(f"{n_rows:>10} {name:<10} {px_time * 1000:>8.1f} {len(to_json_plotly(px_builder(data))) / 1024:>8.1f} "
+                  f"{template_time * 1000:>13.1f} {len(to_json_plotly(builder(data))) / 1024:>13.1f}")
+
+# filters of dashboard views timed by bench_pipeline: start_date, end_date, category, region, shipcountry
+PIPELINE_VIEWS = {
+    "default": ("2016-01-01", "2019-01-01", None, None, None),
+    "filtered": ("2017-01-01", "2018-06-30", ["Beverages", "Dairy Products"], ["Western Europe", "North America"],
+                 ["Germany", "USA", "France"]),
+}
+
+# stages of callbacks as drawer.get_* compute them, stage function takes dataframe,
+# view filters and output of previous stage, output of the last stage is serialized
+PIPELINES = {
+    "revenue_plot": [
+        ("aggregate", lambda df, view, _: revenue_per_period(df, "week", *view)),
+        ("model", lambda df, view, weeks: ANOMALY_SERVICE.detect(df, weeks, *view[2:], method="isolation_forest")),
+        ("figure", lambda df, view, weeks: revenue_figure(weeks, "week", REVENUE_MAX_POINTS)),
+    ],
+    "sunburst": [
+        ("aggregate", lambda df, view, _: revenue_by(df, ["categoryname", "productname"], *view[:2], None, *view[3:])),
+        ("figure", lambda df, view, products: sunburst_figure(top_products(products))),
+    ],
+    "box_plot": [
+        ("aggregate", lambda df, view, _: weekly_mean_revenue_by_region(df, *view[:3], view[4])),
+        ("figure", lambda df, view, weeks: box_figure(weeks)),
+    ],
+    "shipcountries_table": [
+        ("aggregate", lambda df, view, _: revenue_by(df, ["shipcountry"], *view[:4], sort=False)),
+        ("figure", lambda df, view, table: get_table_page(table, [], 0, 20)),
+    ],
+    "clients_table": [
+        ("aggregate", lambda df, view, _: revenue_by(df, ["customerid"], *view, sort=False)),
+        ("figure", lambda df, view, table: get_table_page(table, [], 0, 20)),
+    ],
+    "anomaly_detection": [
+        ("filter", lambda df, view, _: filter_dataframe(df, *view)),
+        ("aggregate", lambda df, view, lines: weekly_revenue(lines)),
+        ("model", lambda df, view, weeks: anomaly_detection(weeks)),
+        ("figure", lambda df, view, weeks: revenue_figure(weeks, "week", REVENUE_MAX_POINTS)),
+    ],
+}
+
+def clear_caches():
+    FILTER_CACHE.clear()
+    ANOMALY_SERVICE.clear()
+
+def run_stages(stages: List[Tuple[str, Callable]], trace_memory: bool = False) -> Tuple[List[dict], object]:
+    """
+    Runs stages, each of them gets output of the previous one
+    :param stages: (name, function of previous output)
+    :param trace_memory: record peak of memory allocated by stage with tracemalloc, it slows stages down
+    :return: time, peak memory and rows of output of each stage, output of the last stage
+    """
+    results = []
+    output = None
+    for name, stage in stages:
+        if trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        output = stage(output)
+        seconds = time.perf_counter() - start
+        result = {"stage": name, "seconds": seconds, "rows_out": len(output) if isinstance(output, pd.DataFrame) else None}
+        if trace_memory:
+            result["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        results.append(result)
+    return results, output
+
+def pipeline_stages(df: pd.DataFrame, stages: list, view: tuple) -> List[Tuple[str, Callable]]:
+    """
+    Returns stages of callback bound to dataframe and view, followed by serialization of the result as dash does
+    """
+    from plotly.io.json import to_json_plotly
+    bound = [(name, partial(stage, df, view)) for name, stage in stages]
+    return bound + [("serialize", lambda output: to_json_plotly(output))]
+
+def load_stages(path: str, compact: bool = False) -> List[Tuple[str, Callable]]:
+    """
+    Returns stages of get_dataframe without snapshot: reading order lines and building indexes
+    """
+    def read(_):
+        with closing(sqlite3.connect(path)) as con:
+            df = load_orders(con, compact=compact)
+        return compact_schema(df) if compact else df
+    def index(df):
+        build_indexes(df)
+        return df
+    return [("read", read), ("index", index)]
+
+def bench_pipeline(sizes: List[str], output: Optional[str], compare: Optional[str], repeat: int = 5,
+                   compact: bool = False, data_dir: str = ".benchmark_data") -> List[dict]:
+    """
+    Times callbacks stage by stage on generated databases and records peak memory of stages
+    Every pipeline runs cold (caches cleared), then under tracemalloc for peak memory,
+    then repeat times warm, the best warm time is reported.
+    :param sizes: sizes of generated databases, see generator.SIZES
+    :param output: path to json file with results, stored in benchmark_results by default
+    :param compare: path to results of previous run, warm times are compared with it
+    """
+    from generator import SIZES, database_path
+    import sklearn.ensemble  # imported by the first fitted model, it is not a cost of the model stage
+    results = []
+    print(f"{'lines':>10} {'callback':<20} {'view':<9} {'stage':<10} {'rows out':>9} {'cold, ms':>9} {'warm, ms':>9} {'peak, MB':>9}")
+    def record(n_lines, callback, view_name, cold, traced, warm):
+        for i, stage in enumerate(cold):
+            result = {"lines": n_lines, "callback": callback, "view": view_name, "stage": stage["stage"],
+                      "rows_out": stage["rows_out"], "cold_ms": stage["seconds"] * 1000,
+                      "warm_ms": min(run[i]["seconds"] for run in warm) * 1000,
+                      "peak_mb": traced[i]["peak_bytes"] / 2**20}
+            results.append(result)
+            print(f"{n_lines:>10} {callback:<20} {view_name:<9} {result['stage']:<10} "
+                  f"{'' if result['rows_out'] is None else result['rows_out']:>9} {result['cold_ms']:>9.1f} "
+                  f"{result['warm_ms']:>9.1f} {result['peak_mb']:>9.1f}")
+
+    for size in sizes:
+        path = database_path(size, data_dir)
+        n_lines = SIZES[size] if size in SIZES else int(size)
+        # loading has no caches, it runs once and once more for memory
+        load = load_stages(path, compact)
+        cold, df = run_stages(load)
+        traced, _ = run_stages(load, trace_memory=True)
+        record(n_lines, "load", "all", cold, traced, [cold])
+        for view_name, view in PIPELINE_VIEWS.items():
+            for callback, stages in PIPELINES.items():
+                stages = pipeline_stages(df, stages, view)
+                clear_caches()
+                cold, _ = run_stages(stages)
+                clear_caches()
+                traced, _ = run_stages(stages, trace_memory=True)
+                record(n_lines, callback, view_name, cold, traced, [run_stages(stages)[0] for _ in range(repeat)])
+        del df
+    if output is None:
+        os.makedirs("benchmark_results", exist_ok=True)
+        output = os.path.join("benchmark_results", f"pipeline-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    meta = {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(), "pandas": pd.__version__,
+            "numpy": np.__version__, "machine": platform.machine(), "cpus": os.cpu_count(), "compact": compact,
+            "commit": git_commit()}
+    with open(output, "w") as f:
+        json.dump({"meta": meta, "results": results}, f, indent=1)
+    print(f"\nresults are saved to {output}")
+    if compare is not None:
+        compare_results(compare, results)
+    return results
+
+def git_commit() -> Optional[str]:
+    process = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True)
+    return process.stdout.strip() if process.returncode == 0 else None
+
+def compare_results(path: str, results: List[dict]):
+    """
+    Prints warm times and peak memory of results next to those of previous run
+    """
+    with open(path) as f:
+        previous = json.load(f)
+    key = lambda result: (result["lines"], result["callback"], result["view"], result["stage"])
+    previous_results = {key(result): result for result in previous["results"]}
+    print(f"\ncompared with {path} ({previous['meta']['time']}, commit {previous['meta']['commit']})")
+    print(f"{'lines':>10} {'callback':<20} {'view':<9} {'stage':<10} {'was, ms':>9} {'now, ms':>9} {'ratio':>6} "
+          f"{'was, MB':>8} {'now, MB':>8}")
+    for result in results:
+        old = previous_results.get(key(result))
+        if old is None:
+            continue
+        print(f"{result['lines']:>10} {result['callback']:<20} {result['view']:<9} {result['stage']:<10} "
+              f"{old['warm_ms']:>9.1f} {result['warm_ms']:>9.1f} {result['warm_ms'] / max(old['warm_ms'], 1e-3):>6.2f} "
+              f"{old['peak_mb']:>8.1f} {result['peak_mb']:>8.1f}")
+
+# statements timed in fresh interpreters by bench_startup
+STARTUP_STAGES = {
+    "import dash_app": "import dash_app",
+    "create_app": "import dash_app; dash_app.create_app(warm_up=False)",
+    "first page": "import dash_app; dash_app.create_app(warm_up=False).server.test_client().get('/')",
+}
+
+# seconds of import dash_app, server workers boot within it
+STARTUP_BUDGET = 1.0
+
+def import_times(statement: str) -> List[tuple]:
+    """
+    Returns (cumulative seconds, module) of modules imported by statement, from python -X importtime
+    """
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", statement],
+                             capture_output=True, text=True, check=True)
+    times = []
+    for line in process.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line and "cumulative" not in line:
+            _, cumulative, module = line.split("|")
+            times.append((int(cumulative) / 10**6, module.rstrip()))
+    return times
+
+def total_import_time(times: List[tuple]) -> float:
+    """
+    Returns seconds of all imports of import_times, sum of top level ones
+    """
+    # top level imports have no indentation in module name
+    return sum(seconds for seconds, module in times if not module.startswith("  "))
+
+def bench_startup(budget: float, top: int = 10) -> bool:
+    """
+    Time of worker boot stages in fresh interpreters and the slowest imports of dash_app
+    :param budget: maximal time of import dash_app in seconds
+    :return: import time of dash_app is within budget
+    """
+    print(f"{'stage':<16} {'time, ms':>9}")
+    for name, statement in STARTUP_STAGES.items():
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", statement], check=True, capture_output=True)
+        print(f"{name:<16} {(time.perf_counter() - start) * 1000:>9.1f}")
+    times = import_times("import dash_app")
+    total = total_import_time(times)
+    print(f"\n{'module':<40} {'cumulative, ms':>15}")
+    for seconds, module in sorted(times, reverse=True)[:top]:
+        print(f"{module.strip():<40} {seconds * 1000:>15.1f}")
+    print(f"\nimport dash_app: {total * 1000:.1f} ms, budget {budget * 1000:.0f} ms")
+    return total <= budget
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+    filter_parser = subparsers.add_parser("filter", help="filter_dataframe: indexes vs isin chain")
+    filter_parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000, 10_000_000])
+    data_bars_parser = subparsers.add_parser("databars", help="data_bars_diverging: rule per row vs bucketed rules")
+    data_bars_parser.add_argument("--rows", type=int, nargs="+", default=[100, 10_000, 100_000])
+    tables_parser = subparsers.add_parser("tables", help="top tables: all rows vs one page")
+    tables_parser.add_argument("--rows", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    figures_parser = subparsers.add_parser("figures", help="figure build and serialization: plotly.express vs templates")
+    figures_parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000])
+    prefix_parser = subparsers.add_parser("prefix", help="revenue_by: prefix sum indexes vs grouping of order lines")
+    prefix_parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000, 10_000_000])
+    map_reduce_parser = subparsers.add_parser("mapreduce", help="map-reduce aggregation: scaling with worker processes")
+    map_reduce_parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000, 10_000_000])
+    map_reduce_parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4, 8])
+    startup_parser = subparsers.add_parser("startup", help="worker boot: import time of dash_app, exits with 1 over budget")
+    startup_parser.add_argument("--budget", type=float, default=STARTUP_BUDGET, help="budget of import dash_app in seconds")
+    pipeline_parser = subparsers.add_parser("pipeline", help="callbacks stage by stage on generated databases, results are saved")
+    pipeline_parser.add_argument("--sizes", nargs="+", default=["10k", "1m"], help="10k, 1m, 10m or numbers of order lines")
+    pipeline_parser.add_argument("--output", help="json file with results, benchmark_results/pipeline-<time>.json by default")
+    pipeline_parser.add_argument("--compare", help="json file with results of previous run")
+    pipeline_parser.add_argument("--repeat", type=int, default=5)
+    pipeline_parser.add_argument("--compact", action="store_true", help="use compact_schema")
+    args = parser.parse_args()
+    if args.benchmark == "filter":
+        bench_filter(args.rows)
+    elif args.benchmark == "databars":
+        bench_data_bars(args.rows)
+    elif args.benchmark == "tables":
+        bench_tables(args.rows)
+    elif args.benchmark == "figures":
+        bench_figures(args.rows)
+    elif args.benchmark == "prefix":
+        bench_prefix_sums(args.rows)
+    elif args.benchmark == "mapreduce":
+        bench_map_reduce(args.rows, args.processes)
+    elif args.benchmark == "pipeline":
+        bench_pipeline(args.sizes, args.output, args.compare, args.repeat, args.compact)
+    elif args.benchmark == "startup":
+        sys.exit(0 if bench_startup(args.budget) else 1)
@@ -1,17 +1,25 @@
+"""Dashboard of Northwind sales, apps are created by create_app"""
+
 import dash
 from dash import html
 from dash import dcc
 from dash import dash_table
+from dash.development.base_component import Component
 from dash.dash_table.Format import Format, Scheme, Symbol
-import dash_bootstrap_components as dbc
-from dash.dependencies import Input, Output
-import pandas as pd
+from dash.dependencies import Input, Output, ClientsideFunction
 import json
+import sys
+import threading
+import time
+import warnings
+from functools import partial
+from typing import Optional
 from datetime import date
-from jupyter_dash import JupyterDash
 
-from funcs import get_dataframe, columns_rus
-from drawer import *
+from response_cache import ResponseCache, install_response_cache, normalize_value, prewarm
+from metrics import METRICS, install_metrics
+
+__all__ = ["create_app", "load_config", "Dashboard", "app", "server"]
 
 SMALL_CARD_HEIGHT = '18rem'
 MEDIUM_CARD_HEIGHT = '34rem'
@@ -19,482 +27,873 @@ TITLE_TEXT_SIZE = 24
 TEXT_SIZE = 14
 TEXT_COLOR = '#808080'
 MARGIN_BOTTOM = "8px"
+TABLE_PAGE_SIZE = 20
+BACKGROUND_CACHE_DIR = '.background_cache'
+# poll interval of background callbacks
+BACKGROUND_INTERVAL = 250
+CONFIG_PATH = 'config.json'
+
+# responses of these components depend only on callback inputs and data
+CACHED_OUTPUTS = ['revenue_plot_id', 'top_categories_id', 'mean_bill_per_region_id',
+                  'top-shipcountries-revenue', 'top-clients-revenue',
+                  'weekly_cube_store', 'revenue_anomalies_store']
+
+# datasets of export.DATASETS offered on dashboard
+EXPORT_DATASET_LABELS = {
+    'lines': 'Строки заказов',
+    'weekly_revenue': 'Динамика продаж по неделям',
+    'mean_bill_per_region': 'Средний чек по регионам',
+    'shipcountries': 'Страны поставки',
+    'customers': 'Клиенты',
+    'products': 'Категории и товары',
+}
+
+def load_config(path: str = CONFIG_PATH) -> dict:
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def no_progress(value):
+    pass
+
+class Dashboard:
+    """
+    Dash app of dashboard with its data, layout and callbacks
+    Only dash is imported when app is created. Data, pandas, plotly figures,
+    sklearn and bootstrap components are loaded on the first request of layout
+    or data, or by warm_up, so that server workers boot fast.
+    """
+    def __init__(self, config: dict):
+        """
+        :param config: contents of config.json
+        """
+        self.config = config
+        # filters and aggregations of revenue plot, box plot and ship countries table run in browser
+        # on weekly cube shipped once per page load, only anomaly detection is left on server
+        self.clientside = config['engine_settings']['clientside']
+        # line items and data of charts are downloaded from export route
+        self.export = config['engine_settings']['export']
+        self._get_data = None
+        self._layout = None
+        self._lock = threading.RLock()
+        self.app = self._create_dash()
+        # dash builds validation layout by calling layout function when it is set,
+        # placeholder defers it until layout is built on the first request
+        self.app.validation_layout = self.layout
+        self.app.layout = self.layout
+
+        # figures are computed by jobs in forked processes, dash terminates a running job
+        # when its callback is triggered again, so stale figures are not computed to the end
+        self.background_manager = None
+        if config['engine_settings']['background_callbacks']:
+            try:
+                import diskcache
+                self.background_manager = dash.DiskcacheManager(diskcache.Cache(BACKGROUND_CACHE_DIR))
+            except ImportError as error:
+                warnings.warn(f"background callbacks require dash[diskcache], callbacks run in request thread: {error}")
+        self.register_callbacks()
+
+        # stage timings of callbacks are served on /metrics, slow callbacks are logged with their inputs
+        METRICS.configure(config['engine_settings']['metrics'], config['engine_settings']['slow_callback_ms'])
+        if config['engine_settings']['metrics']:
+            install_metrics(self.app.server)
+
+        if config['engine_settings']['response_cache']:
+            # cache database is shared by all workers, the default view is computed once after data changes
+            install_response_cache(self.app.server, ResponseCache(), self.get_cache_version, CACHED_OUTPUTS)
+
+        if self.export:
+            from export import ExportService, install_export
+            # exports are written by threads of their own and streamed from disk, downloads are resumable
+            install_export(self.app.server, ExportService(max_workers=config['engine_settings']['export_workers']),
+                           self.get_data, self.get_cache_version, self.app.config.routes_pathname_prefix + 'export')
+
+    @staticmethod
+    def _create_dash() -> dash.Dash:
+        # JupyterDash serves the app inline in notebook, it is not needed by server workers
+        if 'ipykernel' in sys.modules:
+            try:
+                from jupyter_dash import JupyterDash
+                return JupyterDash('app')
+            except ImportError as error:
+                warnings.warn(f"jupyter_dash is not installed, app is not shown inline: {error}")
+        return dash.Dash('app')
+
+    def get_data(self):
+        """
+        Returns current order data for callbacks, database is loaded on the first call
+        """
+        if self._get_data is None:
+            with self._lock:
+                if self._get_data is None:
+                    self._get_data = self._load_data()
+        return self._get_data()
+
+    def _load_data(self):
+        from mapreduce import MAP_REDUCE_ENGINE
+        # large aggregations are split between worker processes, 1 keeps them in request thread
+        MAP_REDUCE_ENGINE.start(self.config['engine_settings']['map_reduce_processes'])
+        if self.config['engine_settings']['sqlite_wal']:
+            from funcs import enable_wal
+            # readers of pooled read-only connections do not block writer of new orders and vice versa
+            enable_wal()
+        if self.config['engine_settings']['backend'] == 'sqlite':
+            from sql_backend import SqlOrders
+            # filters and aggregations are executed by database, nothing is held in memory
+            sql_orders = SqlOrders()
+            return lambda: sql_orders
+        from funcs import OrdersLoader
+        # sorted by orderdate and indexed for filtering, new orders are appended by refresh
+        orders = OrdersLoader(compact=self.config['engine_settings']['compact_schema'])
+        if self.config['engine_settings']['refresh_interval'] > 0:
+            orders.start(self.config['engine_settings']['refresh_interval'])
+        return lambda: orders.df
+
+    def debounce(self):
+        """
+        Waits before computing figure in background job, job is terminated during the wait
+        if inputs change again, so rapid changes of filters do not start computations
+        """
+        if self.background_manager is not None:
+            time.sleep(self.config['engine_settings']['debounce_ms'] / 1000)
+
+    def callback(self, *args, **kwargs):
+        """
+        Registers server callback as app.callback, stages of callback are recorded by METRICS
+        """
+        def decorator(func):
+            return self.app.callback(*args, **kwargs)(METRICS.timed(func.__name__)(func))
+        return decorator
+
+    def figure_callback(self, graph_id: str, inputs: list, progress_id: Optional[str] = None):
+        """
+        Registers callback of figure, it runs as background job if background manager is available
+        Decorated function itself is registered, dash identifies background functions by their source.
+        :param graph_id: id of dcc.Graph, it is dimmed while job runs
+        :param progress_id: id of dbc.Progress, decorated function takes set_progress as first argument then
+        """
+        def decorator(func):
+            func = METRICS.timed(func.__name__)(func)
+            if self.background_manager is None:
+                if progress_id is not None:
+                    func = partial(func, no_progress)
+                return self.app.callback(Output(graph_id, 'figure'), inputs)(func)
+            running = [(Output(graph_id, 'style'), {'opacity': 0.5}, {})]
+            progress = {}
+            if progress_id is not None:
+                running.append((Output(progress_id, 'style'), {'visibility': 'visible'}, {'visibility': 'hidden'}))
+                progress = dict(progress=[Output(progress_id, 'value')], progress_default=[0])
+            return self.app.callback(Output(graph_id, 'figure'), inputs, background=True, manager=self.background_manager,
+                                     interval=BACKGROUND_INTERVAL, running=running, **progress)(func)
+        return decorator
+
+    def layout(self) -> Component:
+        """
+        Returns layout of dashboard, it is built once on the first request
+        """
+        if self._layout is None:
+            with self._lock:
+                if self._layout is None:
+                    import dash_bootstrap_components as dbc
+                    # dash writes stylesheets into index page after it gets layout of the first request
+                    self.app.config.external_stylesheets = [dbc.themes.BOOTSTRAP]
+                    self._layout = self.make_layout()
+                    self.app.validation_layout = self._layout
+        return self._layout
+
+    def make_layout(self) -> Component:
+        import dash_bootstrap_components as dbc
+        from funcs import unique_values, columns_rus
+        from drawer import REVENUE_PLOT_STAGES
+        from export import available_formats
+        data = self.get_data()
+
+        #######################################
+        ########## Data constants #############
+        #######################################
+
+        shipcountries_list = unique_values(data, 'shipcountry')
+        region_list = unique_values(data, 'region')
+        categories_list = unique_values(data, 'categoryname')
+
+        #######################################
+        ######## Interactive forms ############
+        #######################################
+
+        date_form = dbc.Form([
+                        dcc.DatePickerRange(
+                            id="date-form",
+                            start_date=date(2016, 1, 1),
+                            end_date=date(2019, 1, 1),
+                            display_format='D MMM YYYY',
+                            # style={
+                            #     'color': "#e5e5e5 !important",
+                            # },
+                        )
+        ])
 
-app = JupyterDash('app', external_stylesheets=[dbc.themes.BOOTSTRAP])
-# app = dash.Dash(external_stylesheets=[dbc.themes.BOOTSTRAP])
-
-server = app.server
+        category_form = dbc.Form([
+            html.Div([
+                dcc.Dropdown(
+                    id="category_dropdown",
+                    placeholder='Категория товара',
+                    value=None,
+                    options=[{'label': category, 'value': category} for category in categories_list],
+                    multi=True
+                )
+            ])
+        ])
 
-# load config file
-with open('config.json', 'r') as f:
-    config_file = json.load(f)
+        region_form = dbc.Form([
+            html.Div([
+                dcc.Dropdown(
+                    id="region_dropdown",
+                    placeholder='Регион продаж',
+                    value=None,
+                    options=[{'label': category, 'value': category} for category in region_list],
+                    multi=True
+                )
+            ])
+        ])
+    
+        shipcountry_form = dbc.Form([
+            html.Div([
+                dcc.Dropdown(
+                    id="shipcountry_dropdown",
+                    placeholder='Страна поставки',
+                    value=None,
+                    options=[{'label': category, 'value': category} for category in shipcountries_list],
+                    multi=True
+                )
+            ])
+        ])
 
-df = get_dataframe()
-df.orderdate = pd.to_datetime(df.orderdate)
-df = df.sort_values('orderdate')
+        #######################################
+        ############## Elements ###############
+        #######################################
+
+        # Forms for interactive card
+        interactive_cards = dbc.CardGroup(
+            [
+                dbc.Card([
+                    dbc.CardHeader("Период"),
+                    dbc.CardBody(
+                        [
+                            date_form
+                        ]
+                    )
+                ]),
+                dbc.Card([
+                    dbc.CardHeader("Выбор категории товара"),
+                    dbc.CardBody(
+                        [
+                            category_form
+                        ]
+                    )
+                ]),
+                dbc.Card([
+                    dbc.CardHeader("Выбор региона продаж"),
+                    dbc.CardBody(
+                        [
+                            region_form
+                        ]
+                    )
+                ]),
+                dbc.Card([
+                    dbc.CardHeader("Выбор страны поставки"),
+                    dbc.CardBody(
+                        [
+                           shipcountry_form
+                        ]
+                    )
+                ]),
+            ]
+        )
 
-#######################################
-########## Data constants #############
-#######################################
+        # Interactive card
+        interactive_froms = dbc.Card([
+            dbc.CardBody([
+                html.Label(
+                    "Выбор параметров",
+                    style={ 
+                            "test-align": "left",
+                            "font-size": TITLE_TEXT_SIZE,
+                            "margin-bottom": MARGIN_BOTTOM,
+                        }
+                ),
+                interactive_cards
+            ])
+        ])
 
-shipcountries_list = df.shipcountry.unique()
-region_list = df.region.unique()
-categories_list = df.categoryname.unique()
+        # Export card, link to export of current filters is built in browser
+        export_card = dbc.Card([
+            dbc.CardHeader("Выгрузка данных"),
+            dbc.CardBody([
+                dbc.Row([
+                    dbc.Col(dcc.Dropdown(
+                        id="export_dataset_dropdown",
+                        value='lines',
+                        options=[{'label': label, 'value': dataset} for dataset, label in EXPORT_DATASET_LABELS.items()],
+                        clearable=False
+                    )),
+                    dbc.Col(dcc.RadioItems(
+                        id="export_format_radio",
+                        value='csv',
+                        options=[{'label': fmt.upper(), 'value': fmt} for fmt in available_formats()],
+                        inline=True,
+                        inputStyle={'margin-right': '4px', 'margin-left': '12px'}
+                    ), width='auto'),
+                    dbc.Col(html.A("Скачать", id='export_link', className='btn btn-primary'), width='auto'),
+                ], align='center'),
+                dcc.Store(id='export_path_store', data=self.app.get_relative_path('/export')),
+            ])
+        ]) if self.export else None
+
+        # Description card
+        description_card = dbc.Card([
+            dbc.CardBody([
+                html.Label(
+                        self.config['themeSettings'][0]['title'],
+                        style={ 
+                            "test-align": "left",
+                            "font-size": TITLE_TEXT_SIZE, 
+                            "margin-bottom": MARGIN_BOTTOM
+                        }
+                    ),
+                html.Br(),
+                html.Label(
+                    self.config['themeSettings'][0]['description'],
+                    style={
+                        "text-align": "left",
+                        "font-size": TEXT_SIZE,
+                        "color": TEXT_COLOR
+                    }
+                ),
+            ],)
+        ], className="w-100 h-100")
+
+        #graph 1
+        revenue_plot = dbc.Card([
+            dbc.CardBody([
+                html.Label(
+                        "Динамика суммарных продаж с шагом одна неделя",
+                        style={ 
+                            "test-align": "left",
+                            "font-size": TITLE_TEXT_SIZE, 
+                            "margin-bottom": MARGIN_BOTTOM,
+                        }
+                    ),
+                html.Br(),
+                dbc.Progress(
+                    id='revenue_plot_progress',
+                    value=0,
+                    max=REVENUE_PLOT_STAGES,
+                    style={'visibility': 'hidden'},
+                ),
+                dcc.Graph(
+                    id='revenue_plot_id',
+                    style={}
+                )
+        
+            ])
+        ])
 
-#######################################
-######## Interactive forms ############
-#######################################
+        # graph 2
+        top_categories = dbc.Card([
+            dbc.CardBody([
+                html.Label(
+                        "Топ 3 категории с тремя самыми продаваемыми товарами в категории",
+                        style={ 
+                            "test-align": "left",
+                            "font-size": TITLE_TEXT_SIZE, 
+                            "margin-bottom": MARGIN_BOTTOM,
+                        }
+                    ),
+                html.Br(),
+                dcc.Graph(
+                    id='top_categories_id',
+                    style={}
+                )
+            ])
+        ])
 
-date_form = dbc.Form([
-                dcc.DatePickerRange(
-                    id="date-form",
-                    start_date=date(2016, 1, 1),
-                    end_date=date(2019, 1, 1),
-                    display_format='D MMM YYYY',
-                    # style={
-                    #     'color': "#e5e5e5 !important",
-                    # },
+        # graph 4
+        mean_bill_per_region = dbc.Card([
+            dbc.CardBody([
+                html.Label(
+                        "Средний чек по региону продаж (Западная Европа, США, и т.д.) за каждую неделю на всем периоде продаж",
+                        style={ 
+                            "test-align": "left",
+                            "font-size": TITLE_TEXT_SIZE, 
+                            "margin-bottom": MARGIN_BOTTOM,
+                        }
+                    ),
+                html.Br(),
+                dcc.Graph(
+                    id='mean_bill_per_region_id',
+                    style={}
                 )
-])
-
-category_form = dbc.Form([
-    html.Div([
-        dcc.Dropdown(
-            id="category_dropdown",
-            placeholder='Категория товара',
-            value=None,
-            options=[{'label': category, 'value': category} for category in categories_list],
-            multi=True
-        )
-    ])
-])
-
-region_form = dbc.Form([
-    html.Div([
-        dcc.Dropdown(
-            id="region_dropdown",
-            placeholder='Регион продаж',
-            value=None,
-            options=[{'label': category, 'value': category} for category in region_list],
-            multi=True
-        )
-    ])
-])
-    
-shipcountry_form = dbc.Form([
-    html.Div([
-        dcc.Dropdown(
-            id="shipcountry_dropdown",
-            placeholder='Страна поставки',
-            value=None,
-            options=[{'label': category, 'value': category} for category in shipcountries_list],
-            multi=True
-        )
-    ])
-])
+            ])
+        ])
 
-#######################################
-############## Elements ###############
-#######################################
+        # graph table 3.1
+        top_shipcountries = dbc.Card([
+            dbc.CardBody([
+                html.Label("Топ стран поставки по сумме заказов за выбранный период",
+                           style={'font-size': TITLE_TEXT_SIZE,
+                                  'text-align': 'left',
+                                  "margin-bottom": MARGIN_BOTTOM,
+                                  },
+                           ),
+                html.Br(),
+                html.Label("Страны отсортированы по прибыли. Можно изменять сортировку с помощью заголовков столбцов.",
+                           style={'font-size': TEXT_SIZE,
+                                  'text-align': 'left',
+                                  'color': TEXT_COLOR,
+                                  "margin-bottom": MARGIN_BOTTOM,
+                                  },
+                           ),
+                html.Br(),
+                dash_table.DataTable(
+                    id='top-shipcountries-revenue',
+                    # all countries are sent to browser in clientside mode, table sorts and pages them itself
+                    sort_action='native' if self.clientside else 'custom',
+                    sort_by=[{'column_id': "revenue", 'direction': 'desc'}],
+                    columns=[{'name': columns_rus[i], 'id': i, 'type': 'numeric', 'format': Format(precision=2, scheme=Scheme.fixed,
+                                                                                               symbol=Symbol.yes,
+                                                                                               symbol_prefix=u'$')}
+                             for i in ["shipcountry", "revenue"]],
+                    style_cell={
+                        'width': '100px',
+                        'minWidth': '100px',
+                        'maxWidth': '100px',
+                        'overflow': 'hidden',
+                        'textOverflow': 'ellipsis',
+                        'text-align': 'left',
+                        'font-family': 'sans-serif',
+                        'font-size': '14px',
+                    },
+                    style_header={
+                        'backgroundColor': 'white',
+                        'fontWeight': 'bold',
+                        'text-align': 'left',
+                        'font-family': 'sans-serif',
+                        'font-size': '14px',
+                    },
+                    page_action='native' if self.clientside else 'custom',
+                    page_current=0,
+                    page_size=TABLE_PAGE_SIZE,
+                    style_table={'height': '24rem', 'overflowY': 'auto'},
+                )
 
-# Forms for interactive card
-interactive_cards = dbc.CardGroup(
-    [
-        dbc.Card([
-            dbc.CardHeader("Период"),
-            dbc.CardBody(
-                [
-                    date_form
-                ]
-            )
-        ]),
-        dbc.Card([
-            dbc.CardHeader("Выбор категории товара"),
-            dbc.CardBody(
-                [
-                    category_form
-                ]
-            )
-        ]),
-        dbc.Card([
-            dbc.CardHeader("Выбор региона продаж"),
-            dbc.CardBody(
-                [
-                    region_form
-                ]
+            ],
+                style={
+                    'height': MEDIUM_CARD_HEIGHT,
+                }
             )
-        ]),
-        dbc.Card([
-            dbc.CardHeader("Выбор страны поставки"),
-            dbc.CardBody(
-                [
-                   shipcountry_form
-                ]
+        ])
+
+        # graph table 3.2
+        top_clients = dbc.Card([
+            dbc.CardBody([
+                html.Label("Топ клиентов по сумме заказов за выбранный период",
+                           style={'font-size': TITLE_TEXT_SIZE,
+                                  'text-align': 'left',
+                                  "margin-bottom": MARGIN_BOTTOM,
+                                  },
+                           ),
+                html.Br(),
+                html.Label("Клиенты отсортированы по прибыли. Можно изменять сортировку с помощью заголовков столбцов.",
+                           style={'font-size': TEXT_SIZE,
+                                  'text-align': 'left',
+                                  'color': TEXT_COLOR,
+                                  "margin-bottom": MARGIN_BOTTOM,
+                                  },
+                           ),
+                html.Br(),
+                dash_table.DataTable(
+                    id='top-clients-revenue',
+                    sort_action='custom',
+                    sort_by=[{'column_id': "revenue", 'direction': 'desc'}],
+                    columns=[{'name': columns_rus[i], 'id': i, 'type': 'numeric', 'format': Format(precision=2, scheme=Scheme.fixed,
+                                                                                               symbol=Symbol.yes,
+                                                                                               symbol_prefix=u'$')}
+                             for i in ["customerid", "revenue"]],
+                    style_cell={
+                        'width': '100px',
+                        'minWidth': '100px',
+                        'maxWidth': '100px',
+                        'overflow': 'hidden',
+                        'textOverflow': 'ellipsis',
+                        'text-align': 'left',
+                        'font-family': 'sans-serif',
+                        'font-size': '14px',
+                    },
+                    style_header={
+                        'backgroundColor': 'white',
+                        'fontWeight': 'bold',
+                        'text-align': 'left',
+                        'font-family': 'sans-serif',
+                        'font-size': '14px',
+                    },
+                    page_action='custom',
+                    page_current=0,
+                    page_size=TABLE_PAGE_SIZE,
+                    style_table={'height': '24rem', 'overflowY': 'auto'},
+                )
+
+            ],
+                style={
+                    'height': MEDIUM_CARD_HEIGHT,
+                }
             )
-        ]),
-    ]
-)
-
-# Interactive card
-interactive_froms = dbc.Card([
-    dbc.CardBody([
-        html.Label(
-            "Выбор параметров",
-            style={ 
-                    "test-align": "left",
-                    "font-size": TITLE_TEXT_SIZE,
-                    "margin-bottom": MARGIN_BOTTOM,
+        ])
+
+        # graph 3 tables
+        top_tables = dbc.CardGroup([
+            top_shipcountries,
+            top_clients
+        ])
+
+
+
+        #######################################
+        ############### Layout ################
+        #######################################
+
+        return html.Div(children=[
+            # description
+            dbc.Row([
+                dbc.Col(description_card, 
+                        style={'margin-top': '8px'}),
+            ], style={
+                'margin-top': '8px',
+                'margin-bottom': '0px',
                 }
-        ),
-        interactive_cards
-    ])
-])
-
-# Description card
-description_card = dbc.Card([
-    dbc.CardBody([
-        html.Label(
-                config_file['themeSettings'][0]['title'],
-                style={ 
-                    "test-align": "left",
-                    "font-size": TITLE_TEXT_SIZE, 
-                    "margin-bottom": MARGIN_BOTTOM
+            ),
+    
+            # interactive forms
+            dbc.Row([
+                dbc.Col([
+                    interactive_froms
+                ])
+            ], style={
+                'margin-top': '8px',
+                'margin-bottom': '0px',
                 }
             ),
-        html.Br(),
-        html.Label(
-            config_file['themeSettings'][0]['description'],
-            style={
-                "text-align": "left",
-                "font-size": TEXT_SIZE,
-                "color": TEXT_COLOR
-            }
-        ),
-    ],)
-], className="w-100 h-100")
-
-#graph 1
-revenue_plot = dbc.Card([
-    dbc.CardBody([
-        html.Label(
-                "Динамика суммарных продаж с шагом одна неделя",
-                style={ 
-                    "test-align": "left",
-                    "font-size": TITLE_TEXT_SIZE, 
-                    "margin-bottom": MARGIN_BOTTOM,
+    
+            # export
+            *([dbc.Row([
+                dbc.Col([
+                    export_card
+                ])
+            ], style={
+                'margin-top': '8px',
+                'margin-bottom': '0px',
+                }
+            )] if self.export else []),
+
+            # graph 1
+            dbc.Row([
+                dbc.Col([
+                    revenue_plot
+                ])
+            ], style={
+                'margin-top': '8px',
+                'margin-bottom': '0px',
                 }
             ),
-        html.Br(),
-        dcc.Graph(
-            id='revenue_plot_id',
-            style={}
-        )
-        
-    ])
-])
-
-# graph 2
-top_categories = dbc.Card([
-    dbc.CardBody([
-        html.Label(
-                "Топ 3 категории с тремя самыми продаваемыми товарами в категории",
-                style={ 
-                    "test-align": "left",
-                    "font-size": TITLE_TEXT_SIZE, 
-                    "margin-bottom": MARGIN_BOTTOM,
+    
+            # graph 4
+            dbc.Row([
+                dbc.Col([
+                    mean_bill_per_region
+                ])
+            ], style={
+                'margin-top': '8px',
+                'margin-bottom': '0px',
                 }
             ),
-        html.Br(),
-        dcc.Graph(
-            id='top_categories_id',
-            style={}
-        )
-    ])
-])
-
-# graph 4
-mean_bill_per_region = dbc.Card([
-    dbc.CardBody([
-        html.Label(
-                "Средний чек по региону продаж (Западная Европа, США, и т.д.) за каждую неделю на всем периоде продаж",
-                style={ 
-                    "test-align": "left",
-                    "font-size": TITLE_TEXT_SIZE, 
-                    "margin-bottom": MARGIN_BOTTOM,
+    
+            # graph 3.1 and 3.2
+            dbc.Row([
+                dbc.Col([
+                    top_tables
+                ])
+            ], style={
+                'margin-top': '8px',
+                'margin-bottom': '0px',
+                }
+            ),
+    
+            # graph 2
+            dbc.Row([
+                dbc.Col([
+                    top_categories
+                ])
+            ], style={
+                'margin-top': '8px',
+                'margin-bottom': '0px',
                 }
             ),
-        html.Br(),
-        dcc.Graph(
-            id='mean_bill_per_region_id',
-            style={}
-        )
-    ])
-])
-
-# graph table 3.1
-top_shipcountries = dbc.Card([
-    dbc.CardBody([
-        html.Label("Топ стран поставки по сумме заказов за выбранный период",
-                   style={'font-size': TITLE_TEXT_SIZE,
-                          'text-align': 'left',
-                          "margin-bottom": MARGIN_BOTTOM,
-                          },
-                   ),
-        html.Br(),
-        html.Label("Страны отсортированы по прибыли. Можно изменять сортировку с помощью заголовков столбцов.",
-                   style={'font-size': TEXT_SIZE,
-                          'text-align': 'left',
-                          'color': TEXT_COLOR,
-                          "margin-bottom": MARGIN_BOTTOM,
-                          },
-                   ),
-        html.Br(),
-        dash_table.DataTable(
-            id='top-shipcountries-revenue',
-            sort_action='native',
-            sort_by=[{'column_id': "revenue", 'direction': 'desc'}],
-            columns=[{'name': columns_rus[i], 'id': i, 'type': 'numeric', 'format': Format(precision=2, scheme=Scheme.fixed,
-                                                                                       symbol=Symbol.yes,
-                                                                                       symbol_prefix=u'$')}
-                     for i in ["shipcountry", "revenue"]],
-            style_cell={
-                'width': '100px',
-                'minWidth': '100px',
-                'maxWidth': '100px',
-                'overflow': 'hidden',
-                'textOverflow': 'ellipsis',
-                'text-align': 'left',
-                'font-family': 'sans-serif',
-                'font-size': '14px',
-            },
-            style_header={
-                'backgroundColor': 'white',
-                'fontWeight': 'bold',
-                'text-align': 'left',
-                'font-family': 'sans-serif',
-                'font-size': '14px',
-            },
-            page_action='none',
-            style_table={'height': '24rem', 'overflowY': 'auto'},
-        )
 
-    ],
-        style={
-            'height': MEDIUM_CARD_HEIGHT,
-        }
-    )
-])
-
-# graph table 3.2
-top_clients = dbc.Card([
-    dbc.CardBody([
-        html.Label("Топ клиентов по сумме заказов за выбранный период",
-                   style={'font-size': TITLE_TEXT_SIZE,
-                          'text-align': 'left',
-                          "margin-bottom": MARGIN_BOTTOM,
-                          },
-                   ),
-        html.Br(),
-        html.Label("Клиенты отсортированы по прибыли. Можно изменять сортировку с помощью заголовков столбцов.",
-                   style={'font-size': TEXT_SIZE,
-                          'text-align': 'left',
-                          'color': TEXT_COLOR,
-                          "margin-bottom": MARGIN_BOTTOM,
-                          },
-                   ),
-        html.Br(),
-        dash_table.DataTable(
-            id='top-clients-revenue',
-            sort_action='native',
-            sort_by=[{'column_id': "revenue", 'direction': 'desc'}],
-            columns=[{'name': columns_rus[i], 'id': i, 'type': 'numeric', 'format': Format(precision=2, scheme=Scheme.fixed,
-                                                                                       symbol=Symbol.yes,
-                                                                                       symbol_prefix=u'$')}
-                     for i in ["customerid", "revenue"]],
-            style_cell={
-                'width': '100px',
-                'minWidth': '100px',
-                'maxWidth': '100px',
-                'overflow': 'hidden',
-                'textOverflow': 'ellipsis',
-                'text-align': 'left',
-                'font-family': 'sans-serif',
-                'font-size': '14px',
-            },
-            style_header={
-                'backgroundColor': 'white',
-                'fontWeight': 'bold',
-                'text-align': 'left',
-                'font-family': 'sans-serif',
-                'font-size': '14px',
-            },
-            page_action='none',
-            style_table={'height': '24rem', 'overflowY': 'auto'},
+            # weekly cube and anomalous weeks of clientside mode
+            *([dcc.Store(id='weekly_cube_store'), dcc.Store(id='revenue_anomalies_store')] if self.clientside else []),
+        ],
+            style={
+                'margin-left': '16px',
+                'margin-right': '16px',
+            }
         )
 
-    ],
-        style={
-            'height': MEDIUM_CARD_HEIGHT,
-        }
-    )
-])
-
-# graph 3 tables
-top_tables = dbc.CardGroup([
-    top_shipcountries,
-    top_clients
-])
-
-
-
-#######################################
-############### Layout ################
-#######################################
-
-app.layout = html.Div(children=[
-    # description
-    dbc.Row([
-        dbc.Col(description_card, 
-                style={'margin-top': '8px'}),
-    ], style={
-        'margin-top': '8px',
-        'margin-bottom': '0px',
-        }
-    ),
-    
-    # interactive forms
-    dbc.Row([
-        dbc.Col([
-            interactive_froms
-        ])
-    ], style={
-        'margin-top': '8px',
-        'margin-bottom': '0px',
-        }
-    ),
-    
-    # graph 1
-    dbc.Row([
-        dbc.Col([
-            revenue_plot
-        ])
-    ], style={
-        'margin-top': '8px',
-        'margin-bottom': '0px',
-        }
-    ),
-    
-    # graph 4
-    dbc.Row([
-        dbc.Col([
-            mean_bill_per_region
-        ])
-    ], style={
-        'margin-top': '8px',
-        'margin-bottom': '0px',
-        }
-    ),
-    
-    # graph 3.1 and 3.2
-    dbc.Row([
-        dbc.Col([
-            top_tables
-        ])
-    ], style={
-        'margin-top': '8px',
-        'margin-bottom': '0px',
-        }
-    ),
-    
-    # graph 2
-    dbc.Row([
-        dbc.Col([
-            top_categories
-        ])
-    ], style={
-        'margin-top': '8px',
-        'margin-bottom': '0px',
-        }
-    ),
-],
-    style={
-        'margin-left': '16px',
-        'margin-right': '16px',
-    }
-)
+    #######################################
+    ############# Callbacks ###############
+    #######################################
+
+    def register_callbacks(self):
+        @self.figure_callback(
+            'top_categories_id',
+            [
+                Input('date-form', "start_date"),
+                Input('date-form', "end_date"),
+                Input('region_dropdown', "value"),
+                Input('shipcountry_dropdown', "value")
+            ]
+        )
+        def update_sunburst_plot(date_start, date_end, region_value, shipcountry_value):
+            self.debounce()
+            import drawer
+            return drawer.get_sunburst_plot(self.get_data(), date_start, date_end, region_value, shipcountry_value)
+
+        @self.callback(
+            Output('top-clients-revenue', 'data'),
+            Output('top-clients-revenue', 'style_data_conditional'),
+            Output('top-clients-revenue', 'page_count'),
+            [
+                Input('date-form', "start_date"),
+                Input('date-form', "end_date"),
+                Input('category_dropdown', "value"),
+                Input('region_dropdown', "value"),
+                Input('shipcountry_dropdown', "value"),
+                Input('top-clients-revenue', 'sort_by'),
+                Input('top-clients-revenue', 'page_current'),
+                Input('top-clients-revenue', 'page_size')
+            ]
+        )
+        def update_top_clients_table(date_start, date_end, category_value, region_value, shipcountry_value, sort_by,
+                                     page_current, page_size):
+            import drawer
+            return drawer.get_top_clients_table(self.get_data(), date_start, date_end, category_value, region_value, shipcountry_value, sort_by,
+                                                page_current, page_size)
+
+        if self.export:
+            self.app.clientside_callback(
+                ClientsideFunction(namespace='northwind', function_name='export_href'),
+                Output('export_link', 'href'),
+                [
+                    Input('export_path_store', 'data'),
+                    Input('export_dataset_dropdown', "value"),
+                    Input('export_format_radio', "value"),
+                    Input('date-form', "start_date"),
+                    Input('date-form', "end_date"),
+                    Input('category_dropdown', "value"),
+                    Input('region_dropdown', "value"),
+                    Input('shipcountry_dropdown', "value")
+                ]
+            )
 
+        if self.clientside:
+            @self.callback(
+                Output('weekly_cube_store', 'data'),
+                Input('weekly_cube_store', 'id')
+            )
+            def update_weekly_cube_store(_):
+                import drawer
+                return drawer.get_clientside_cube(self.get_data())
 
-#######################################
-############# Callbacks ###############
-#######################################
+            @self.callback(
+                Output('revenue_anomalies_store', 'data'),
+                [
+                    Input('date-form', "start_date"),
+                    Input('date-form', "end_date"),
+                    Input('category_dropdown', "value"),
+                    Input('region_dropdown', "value"),
+                    Input('shipcountry_dropdown', "value")
+                ]
+            )
+            def update_revenue_anomalies(date_start, date_end, category_value, region_value, shipcountry_value):
+                import drawer
+                return drawer.get_revenue_anomalies(self.get_data(), date_start, date_end, category_value, region_value, shipcountry_value,
+                                                    self.config['engine_settings']['anomaly_method'])
+
+            self.app.clientside_callback(
+                ClientsideFunction(namespace='northwind', function_name='revenue_figure'),
+                Output('revenue_plot_id', 'figure'),
+                [
+                    Input('weekly_cube_store', 'data'),
+                    Input('revenue_anomalies_store', 'data'),
+                    Input('date-form', "start_date"),
+                    Input('date-form', "end_date"),
+                    Input('category_dropdown', "value"),
+                    Input('region_dropdown', "value"),
+                    Input('shipcountry_dropdown', "value")
+                ]
+            )
 
-@app.callback(
-    Output('revenue_plot_id', 'figure'),
-    [
-        Input('date-form', "start_date"),
-        Input('date-form', "end_date"),
-        Input('category_dropdown', "value"),
-        Input('region_dropdown', "value"),
-        Input('shipcountry_dropdown', "value")
-    ]
-)
-def update_revenue_plot(date_start, date_end, category_value, region_value, shipcountry_value):
-    return get_revenue_plot(df, date_start, date_end, category_value, region_value, shipcountry_value)
-
-@app.callback(
-    Output('top_categories_id', 'figure'),
-    [
-        Input('date-form', "start_date"),
-        Input('date-form', "end_date"),
-        Input('region_dropdown', "value"),
-        Input('shipcountry_dropdown', "value")
-    ]
-)
-def update_sunburst_plot(date_start, date_end, region_value, shipcountry_value):
-    return get_sunburst_plot(df, date_start, date_end, region_value, shipcountry_value)
-
-
-@app.callback(
-    Output('mean_bill_per_region_id', 'figure'),
-    [
-        Input('date-form', "start_date"),
-        Input('date-form', "end_date"),
-        Input('category_dropdown', "value"),
-        Input('shipcountry_dropdown', "value")
-    ]
-)
-def update_horisontal_box_plot(date_start, date_end, category_value, shipcountry_value):
-    return get_horisontal_box_plot(df, date_start, date_end, category_value, shipcountry_value)
-
-@app.callback(
-    Output('top-shipcountries-revenue', 'data'),
-    Output('top-shipcountries-revenue', 'style_data_conditional'),
-    [
-        Input('date-form', "start_date"),
-        Input('date-form', "end_date"),
-        Input('category_dropdown', "value"),
-        Input('region_dropdown', "value"),
-        Input('top-shipcountries-revenue', 'sort_by')
-    ]
-)
-def update_top_shipcountries_table(date_start, date_end, category_value, region_value, sort_by):
-    return get_top_shipcountries_table(df, date_start, date_end, category_value, region_value, sort_by)
-
-@app.callback(
-    Output('top-clients-revenue', 'data'),
-    Output('top-clients-revenue', 'style_data_conditional'),
-    [
-        Input('date-form', "start_date"),
-        Input('date-form', "end_date"),
-        Input('category_dropdown', "value"),
-        Input('region_dropdown', "value"),
-        Input('shipcountry_dropdown', "value"),
-        Input('top-clients-revenue', 'sort_by')
-    ]
-)
-def update_top_clients_table(date_start, date_end, category_value, region_value, shipcountry_value, sort_by):
-    return get_top_clients_table(df, date_start, date_end, category_value, region_value, shipcountry_value, sort_by)
+            self.app.clientside_callback(
+                ClientsideFunction(namespace='northwind', function_name='box_figure'),
+                Output('mean_bill_per_region_id', 'figure'),
+                [
+                    Input('weekly_cube_store', 'data'),
+                    Input('date-form', "start_date"),
+                    Input('date-form', "end_date"),
+                    Input('category_dropdown', "value"),
+                    Input('shipcountry_dropdown', "value")
+                ]
+            )
 
+            self.app.clientside_callback(
+                ClientsideFunction(namespace='northwind', function_name='shipcountries_table'),
+                Output('top-shipcountries-revenue', 'data'),
+                Output('top-shipcountries-revenue', 'style_data_conditional'),
+                [
+                    Input('weekly_cube_store', 'data'),
+                    Input('date-form', "start_date"),
+                    Input('date-form', "end_date"),
+                    Input('category_dropdown', "value"),
+                    Input('region_dropdown', "value")
+                ]
+            )
+        else:
+            @self.figure_callback(
+                'revenue_plot_id',
+                [
+                    Input('date-form', "start_date"),
+                    Input('date-form', "end_date"),
+                    Input('category_dropdown', "value"),
+                    Input('region_dropdown', "value"),
+                    Input('shipcountry_dropdown', "value")
+                ],
+                progress_id='revenue_plot_progress'
+            )
+            def update_revenue_plot(set_progress, date_start, date_end, category_value, region_value, shipcountry_value):
+                self.debounce()
+                import drawer
+                return drawer.get_revenue_plot(self.get_data(), date_start, date_end, category_value, region_value, shipcountry_value,
+                                               self.config['engine_settings']['anomaly_method'], set_progress,
+                                               self.config['engine_settings']['time_granularity'], self.config['engine_settings']['max_points'])
+
+            @self.figure_callback(
+                'mean_bill_per_region_id',
+                [
+                    Input('date-form', "start_date"),
+                    Input('date-form', "end_date"),
+                    Input('category_dropdown', "value"),
+                    Input('shipcountry_dropdown', "value")
+                ]
+            )
+            def update_horisontal_box_plot(date_start, date_end, category_value, shipcountry_value):
+                self.debounce()
+                import drawer
+                return drawer.get_horisontal_box_plot(self.get_data(), date_start, date_end, category_value, shipcountry_value)
+
+            @self.callback(
+                Output('top-shipcountries-revenue', 'data'),
+                Output('top-shipcountries-revenue', 'style_data_conditional'),
+                Output('top-shipcountries-revenue', 'page_count'),
+                [
+                    Input('date-form', "start_date"),
+                    Input('date-form', "end_date"),
+                    Input('category_dropdown', "value"),
+                    Input('region_dropdown', "value"),
+                    Input('top-shipcountries-revenue', 'sort_by'),
+                    Input('top-shipcountries-revenue', 'page_current'),
+                    Input('top-shipcountries-revenue', 'page_size')
+                ]
+            )
+            def update_top_shipcountries_table(date_start, date_end, category_value, region_value, sort_by, page_current, page_size):
+                import drawer
+                return drawer.get_top_shipcountries_table(self.get_data(), date_start, date_end, category_value, region_value, sort_by,
+                                                          page_current, page_size)
+
+    #######################################
+    ########### Response cache ############
+    #######################################
+
+    def get_cache_version(self):
+        """
+        Returns version of cached responses: digest of data and engine settings
+        """
+        from funcs import data_fingerprint
+        fingerprint = data_fingerprint(self.get_data())
+        if fingerprint is None:
+            return None
+        return fingerprint + json.dumps(self.config['engine_settings'], sort_keys=True)
+
+    def default_view_requests(self):
+        """
+        Returns bodies of requests of cached callbacks with initial values of layout, i.e. the default view
+        """
+        components = {}
+        stack = [self.layout()]
+        while stack:
+            component = stack.pop()
+            if getattr(component, 'id', None) is not None:
+                components[component.id] = component
+            children = getattr(component, 'children', None)
+            children = children if isinstance(children, list) else [children]
+            stack += [child for child in children if isinstance(child, Component)]
+        requests = []
+        for output, callback in self.app.callback_map.items():
+            outputs = callback['output'] if isinstance(callback['output'], list) else [callback['output']]
+            # clientside callbacks have no server function
+            if 'callback' not in callback or not all(o.component_id in CACHED_OUTPUTS for o in outputs):
+                continue
+            outputs = [{'id': o.component_id, 'property': o.component_property} for o in outputs]
+            requests.append({
+                'output': output,
+                'outputs': outputs if isinstance(callback['output'], list) else outputs[0],
+                'inputs': [dict(item, value=normalize_value(getattr(components[item['id']], item['property'], None)))
+                           for item in callback['inputs']],
+                'changedPropIds': [],
+            })
+        return requests
+
+    def warm_up(self, prewarm_cache: bool = True):
+        """
+        Loads data and modules used by callbacks and builds layout, so that the first request does not wait for them
+        :param prewarm_cache: compute responses of the default view into response cache
+        """
+        import anomaly
+        import sklearn.ensemble
+        self.layout()
+        if prewarm_cache and self.config['engine_settings']['response_cache']:
+            prewarm(self.app.server, self.default_view_requests(), BACKGROUND_INTERVAL / 1000)
+
+def create_app(config: Optional[dict] = None, warm_up: Optional[bool] = None) -> dash.Dash:
+    """
+    Returns dash app of dashboard, heavy modules and data are loaded on the first request
+    :param config: contents of config.json, it is read if None
+    :param warm_up: load data and modules in background thread right away, engine_settings.warm_up if None
+    """
+    config = load_config() if config is None else config
+    dashboard = Dashboard(config)
+    if config['engine_settings']['warm_up'] if warm_up is None else warm_up:
+        threading.Thread(target=dashboard.warm_up, daemon=True).start()
+    return dashboard.app
+
+_APP = None
+_APP_LOCK = threading.Lock()
+
+def __getattr__(name: str):
+    # app of config.json is created on first access, e.g. by `gunicorn dash_app:server` or `from dash_app import *`
+    global _APP
+    if name in ('app', 'server'):
+        with _APP_LOCK:
+            if _APP is None:
+                _APP = create_app()
+        return _APP if name == 'app' else _APP.server
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 #######################################
 ############## Run app ################
@@ -502,4 +901,4 @@ def update_top_clients_table(date_start, date_end, category_value, region_value,
 
 
 if __name__ == "__main__":
-    app.run_server(port=8050, debug=True)
\ No newline at end of file
+    create_app().run_server(port=8050, debug=True)
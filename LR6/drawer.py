@@ -1,98 +1,241 @@
 from datetime import datetime
 from funcs import *
+from anomaly import ANOMALY_SERVICE
+from metrics import METRICS
 import plotly.graph_objects as go
-import plotly.express as px
+import plotly.colors
 import pandas as pd
 import numpy as np
-from typing import Optional, List
+from typing import Callable, Optional, List
 
 TEXT_STYLE = "Arial"
 TEXT_SIZE = 12
 TEXT_COLOR = "#005ce6"
 BACKGROUND_COLOR = "#f4f4f4"
+PASTEL = plotly.colors.qualitative.Pastel
+
+# aggregation, anomaly detection and figure
+REVENUE_PLOT_STAGES = 3
+
+def data_rows(df) -> Optional[int]:
+    """
+    Returns rows of dataframe for stage metrics, None for query backend which does not load them
+    """
+    return len(df) if isinstance(df, pd.DataFrame) else None
+
+# layouts of figures are validated by plotly once, callbacks only fill trace arrays
+# of plain dict figures, so px reshaping and per-update validation are skipped
+def _layout(**kwargs) -> dict:
+    return go.Figure(layout=dict(font=dict(family=TEXT_STYLE, size=TEXT_SIZE, color=TEXT_COLOR),
+                                 plot_bgcolor=BACKGROUND_COLOR, paper_bgcolor=BACKGROUND_COLOR,
+                                 **kwargs)).to_plotly_json()['layout']
+
+REVENUE_LAYOUTS = {period: _layout(title=dict(text=f'Revenue per {period}', x=0.5),
+                                    xaxis=dict(title_text='Date'), yaxis=dict(title_text='Revenue'))
+                   for period in PERIODS}
+
+# points of revenue line, more points than pixels of the plot are not seen anyway
+REVENUE_MAX_POINTS = 1000
+
+SUNBURST_LAYOUT = _layout(title=dict(text='Top 3 categories by sum of revenue of selected time period', x=0.5, y=0.05),
+                          margin=dict(t=10, l=0, r=0, b=50), legend=dict(tracegroupgap=0),
+                          sunburstcolorway=PASTEL)
+
+BOX_LAYOUT = _layout(title=dict(text='Mean revenue per week for each region', x=0.5),
+                     xaxis=dict(title_text='revenue'), yaxis=dict(title_text='region'),
+                     legend=dict(title_text='region', tracegroupgap=0), boxmode='overlay')
+
+def revenue_values(values) -> list:
+    """
+    Returns revenue rounded to cents as list for figure json
+    """
+    return np.round(np.asarray(values, dtype=np.float64), 2).tolist()
+
+def date_values(values) -> list:
+    """
+    Returns dates as list of 'YYYY-MM-DD' strings for figure json
+    """
+    return np.datetime_as_string(np.asarray(values, dtype='datetime64[D]')).tolist()
 
 # plot 1
-def get_revenue_plot(df: pd.DataFrame, date_start: Optional[str], date_end: Optional[str], category_value: Optional[List[str]], region_value: Optional[List[str]], shipcountry_value: Optional[List[str]]):
-    filtered_df = filter_dataframe(df, date_start, date_end, category_value, region_value, shipcountry_value)
-    if len(filtered_df) != 0:
-        filtered_df  = filtered_df[['orderdate', 'revenue']].resample('W-MON', on='orderdate').sum().reset_index().sort_values('orderdate')
+def revenue_figure(weeks: pd.DataFrame, period: str = 'week', max_points: Optional[int] = None) -> dict:
+    """
+    Returns figure of revenue per period with anomalous periods marked
+    Line with more than max_points points is downsampled with LTTB, anomalous
+    points are always kept on the line and all of them are marked.
+    :param weeks: revenue per period with anomaly column, see AnomalyService.detect
+    :param max_points: maximal number of points of line, all points if None
+    """
+    anomalies = weeks.loc[weeks['anomaly'] == -1]
+    line = weeks
+    if max_points is not None and len(weeks) > max_points:
+        dates = weeks['orderdate'].to_numpy(dtype='datetime64[ns]').view(np.int64)
+        kept = lttb_indices(dates, weeks['revenue'].to_numpy(), max_points)
+        line = weeks.iloc[np.union1d(kept, np.flatnonzero(weeks['anomaly'].to_numpy() == -1))]
+    return {
+        'data': [
+            {'type': 'scatter', 'mode': 'lines', 'name': 'Revenue',
+             'x': date_values(line['orderdate']), 'y': revenue_values(line['revenue'])},
+            {'type': 'scatter', 'mode': 'markers', 'name': 'Anomaly',
+             'x': date_values(anomalies['orderdate']), 'y': revenue_values(anomalies['revenue'])},
+        ],
+        'layout': REVENUE_LAYOUTS[period],
+    }
+
+def get_revenue_plot(df: pd.DataFrame, date_start: Optional[str], date_end: Optional[str], category_value: Optional[List[str]], region_value: Optional[List[str]], shipcountry_value: Optional[List[str]],
+                     anomaly_method: str = 'isolation_forest', progress: Optional[Callable[[int], None]] = None,
+                     period: str = 'week', max_points: Optional[int] = REVENUE_MAX_POINTS):
+    """
+    :param progress: called with number of finished stages out of REVENUE_PLOT_STAGES
+    :param period: day, week or month, or 'auto' for the finest of them with at most max_points points in date range
+    :param max_points: maximal number of points of line, finer series are downsampled with LTTB
+    """
+    if period == 'auto':
+        period = choose_period(df, date_start, date_end, max_points or REVENUE_MAX_POINTS)
+    with METRICS.stage('aggregate', data_rows(df)) as stage:
+        filtered_df = revenue_per_period(df, period, date_start, date_end, category_value, region_value, shipcountry_value)
+        stage.rows(len(filtered_df))
+    if progress is not None:
+        progress(1)
     
-    # detect anomalies with IsolationForest
-    filtered_df = anomaly_detection(filtered_df)
-    fig = go.Figure()
-    fig.add_trace(go.Scatter(x=filtered_df['orderdate'], y=filtered_df['revenue'], mode='lines', name='Revenue'))
-    fig.add_trace(go.Scatter(x=filtered_df.loc[filtered_df['anomaly'] == -1, 'orderdate'], y=filtered_df.loc[filtered_df['anomaly'] == -1, 'revenue'], mode='markers', name='Anomaly'))
-    fig.update_layout(font=dict(family=TEXT_STYLE, size=TEXT_SIZE, color=TEXT_COLOR),
-                      plot_bgcolor=BACKGROUND_COLOR,
-                      paper_bgcolor=BACKGROUND_COLOR,
-                      title = 'Revenue per week',
-                      title_x = 0.5,)
-    fig.update_xaxes(title_text='Date')
-    fig.update_yaxes(title_text='Revenue')
-    return fig
+    # detect anomalies with cached IsolationForest or streaming detector
+    with METRICS.stage('model', len(filtered_df)) as stage:
+        filtered_df = ANOMALY_SERVICE.detect(df, filtered_df, category_value, region_value, shipcountry_value, anomaly_method, period)
+        stage.rows(len(filtered_df))
+    if progress is not None:
+        progress(2)
+    with METRICS.stage('figure', len(filtered_df)):
+        return revenue_figure(filtered_df, period, max_points)
 
 # plot 2
+def sunburst_figure(products: pd.DataFrame) -> dict:
+    """
+    Returns sunburst figure of categories and their products as px.sunburst with path=['categoryname', 'productname']
+    :param products: revenue of products, products with the same name in category are summed
+    """
+    products = products.groupby(['categoryname', 'productname'], sort=False, observed=True).agg({'revenue': 'sum'}).reset_index()
+    ids, labels, parents, values, colors, customdata = [], [], [], [], [], []
+    for i, (category, leaves) in enumerate(products.groupby('categoryname', sort=True, observed=True)):
+        color = PASTEL[i % len(PASTEL)]
+        ids += [f"{category}/{product}" for product in leaves['productname']] + [category]
+        labels += leaves['productname'].tolist() + [category]
+        parents += [category] * len(leaves) + ['']
+        # not rounded, rounded products could sum to more than their category and 'total' branch would not be drawn
+        values += leaves['revenue'].astype(np.float64).tolist() + [float(leaves['revenue'].sum())]
+        colors += [color] * (len(leaves) + 1)
+        customdata += [[category]] * (len(leaves) + 1)
+    return {
+        'data': [{
+            'type': 'sunburst', 'branchvalues': 'total', 'name': '',
+            'ids': ids, 'labels': labels, 'parents': parents, 'values': values,
+            'marker': {'colors': colors}, 'customdata': customdata,
+            'domain': {'x': [0.0, 1.0], 'y': [0.0, 1.0]},
+            'hovertemplate': 'labels=%{label}<br>revenue=%{value}<br>parent=%{parent}<br>id=%{id}<br>categoryname=%{customdata[0]}<extra></extra>',
+        }],
+        'layout': SUNBURST_LAYOUT,
+    }
+
 def get_sunburst_plot(df: pd.DataFrame, date_start: Optional[str], date_end: Optional[str], region_value: Optional[List[str]], shipcountry_value: Optional[List[str]]):
     """
     Return sunburst plot for top 3 categories by sum of revenue of selected time period
     In each category show top 3 products and others as a separate product by sum of revenue of selected time period
     """
-    filtered_df = filter_dataframe(df, date_start, date_end, None, region_value, shipcountry_value)
-    if len(filtered_df) != 0:
-        filtered_df = filtered_df.groupby(['categoryname', 'productname']).agg({'revenue': 'sum'}).reset_index()
-        filtered_df = filtered_df.sort_values('revenue', ascending=False)
-        top3_categories = filtered_df.groupby('categoryname').agg({'revenue': 'sum'}).reset_index().nlargest(3, 'revenue')['categoryname'].to_list()
-        filtered_df = filtered_df.loc[filtered_df['categoryname'].isin(top3_categories)]
-        filtered_df['rank'] = filtered_df.groupby('categoryname')['revenue'].rank(ascending=False)
-        filtered_df.loc[filtered_df['rank'] > 3, 'productname'] = 'Other'
-        filtered_df.sort_values(['categoryname', 'revenue'], inplace=True, ascending=False)
-    fig = px.sunburst(filtered_df, path=['categoryname', 'productname'], values='revenue', 
-                      title='Top 3 categories by sum of revenue of selected time period',
-                      color='categoryname', color_discrete_sequence=px.colors.qualitative.Pastel,)
-    fig.update_layout(margin=dict(t=10, l=0, r=0, b=50), title_y=0.05, title_x=0.5,
-                      font=dict(family=TEXT_STYLE, size=TEXT_SIZE, color=TEXT_COLOR),
-                      plot_bgcolor=BACKGROUND_COLOR, paper_bgcolor=BACKGROUND_COLOR)
-    return fig
+    with METRICS.stage('aggregate', data_rows(df)) as stage:
+        filtered_df = revenue_by(df, ['categoryname', 'productname'], date_start, date_end, None, region_value, shipcountry_value)
+        stage.rows(len(filtered_df))
+    with METRICS.stage('figure', len(filtered_df)):
+        return sunburst_figure(top_products(filtered_df))
+
+def top_products(products: pd.DataFrame) -> pd.DataFrame:
+    """
+    Returns products of top 3 categories by revenue, products after top 3 of category are named 'Other'
+    :param products: revenue per category and product, see revenue_by
+    """
+    if len(products) != 0:
+        top3_categories = products.groupby('categoryname').agg({'revenue': 'sum'}).reset_index().nlargest(3, 'revenue')['categoryname'].to_list()
+        products = products.loc[products['categoryname'].isin(top3_categories)]
+        products['rank'] = products.groupby('categoryname')['revenue'].rank(ascending=False)
+        products.loc[products['rank'] > 3, 'productname'] = 'Other'
+        products.sort_values(['categoryname', 'revenue'], inplace=True, ascending=False)
+    return products
 
 # plot 4
+def box_figure(weeks: pd.DataFrame) -> dict:
+    """
+    Returns horisontal box plot of revenue for each region as px.box with color='region'
+    Quartiles, fences and outliers are computed here, so the figure has five numbers
+    per region and outlier points instead of all weeks.
+    :param weeks: revenue per region and week, see weekly_mean_revenue_by_region
+    """
+    stats, outliers = box_statistics(weeks, 'region')
+    outliers = outliers.groupby('region', sort=False, observed=True)['revenue']
+    traces = []
+    for i, box in enumerate(stats.itertuples(index=False)):
+        color = PASTEL[i % len(PASTEL)]
+        common = {'orientation': 'h', 'name': box.region, 'legendgroup': box.region, 'marker': {'color': color},
+                  'hovertemplate': 'region=%{y}<br>revenue=%{x}<extra></extra>'}
+        traces.append(dict(common, type='box', showlegend=True, notched=False, boxpoints=False, y=[box.region],
+                           offsetgroup=box.region, alignmentgroup='True',
+                           q1=revenue_values([box.q1]), median=revenue_values([box.median]), q3=revenue_values([box.q3]),
+                           lowerfence=revenue_values([box.lowerfence]), upperfence=revenue_values([box.upperfence])))
+        if box.region in outliers.groups:
+            values = outliers.get_group(box.region)
+            traces.append(dict(common, type='scatter', mode='markers', showlegend=False,
+                               x=revenue_values(values), y=[box.region] * len(values)))
+    layout = dict(BOX_LAYOUT, yaxis=dict(BOX_LAYOUT['yaxis'], categoryorder='array',
+                                         categoryarray=stats['region'].tolist()[::-1]))
+    return {'data': traces, 'layout': layout}
+
 def get_horisontal_box_plot(df: pd.DataFrame, date_start: Optional[str], date_end: Optional[str], category_value: Optional[List[str]], shipcountry_value: Optional[List[str]]):
     """
     Count mean revenue per week for each region and show it as a horisontal box plot
     """
-    filtered_df = filter_dataframe(df, date_start, date_end, category_value, None, shipcountry_value)
-    if len(filtered_df) != 0:
-        filtered_df = filtered_df[['orderdate', 'revenue', 'region']].groupby(['region', pd.Grouper(key='orderdate', freq='W-MON')]).mean().reset_index().sort_values('orderdate')
-    fig =  px.box(filtered_df, x="revenue", y="region", orientation='h', 
-                  color='region', title='Mean revenue per week for each region',
-                  color_discrete_sequence=px.colors.qualitative.Pastel)
-    fig.update_layout(title_x=0.5, font=dict(family=TEXT_STYLE, size=TEXT_SIZE, color=TEXT_COLOR),
-                      plot_bgcolor=BACKGROUND_COLOR, paper_bgcolor=BACKGROUND_COLOR)
-    return fig
+    with METRICS.stage('aggregate', data_rows(df)) as stage:
+        filtered_df = weekly_mean_revenue_by_region(df, date_start, date_end, category_value, shipcountry_value)
+        stage.rows(len(filtered_df))
+    with METRICS.stage('figure', len(filtered_df)):
+        return box_figure(filtered_df)
 
 # plot 3 tables
-def data_bars_diverging(df: pd.DataFrame, column: str, color_above='#0074D9', color_below='#FF4136'):
-    neg_count = len(df[df[column] <= 0]) + 1
-    pos_count = len(df[df[column] > 0])
-    bounds_neg = np.linspace(0, 0.5, neg_count)
-    bounds_pos = np.linspace(0.5, 1, pos_count)
-    bounds = np.concatenate((bounds_neg, bounds_pos), axis=0)
-
-    ranges = df[column].to_list()
-    ranges.append(0)
-    ranges = sorted(ranges)
+DATA_BARS_MAX_RULES = 32
+
+def data_bars_diverging(df: pd.DataFrame, column: str, color_above='#0074D9', color_below='#FF4136',
+                        max_rules: Optional[int] = DATA_BARS_MAX_RULES, page: Optional[pd.DataFrame] = None):
+    """
+    Returns style_data_conditional with diverging data bars of column
+    Bar length is given by rank of value. Values are split into at most max_rules
+    rank buckets, so the number of rules does not grow with the number of rows.
+    :param max_rules: maximal number of style rules, one rule per row if None
+    :param page: rows shown in table, only rules matching them are returned, all rules if None
+    """
+    # sorted values with zero midpoint and bar bounds of each of them as before bucketing
+    values = np.append(df[column].to_numpy(dtype=np.float64), 0.0)
+    neg_count = int((values <= 0).sum())
+    bounds = np.concatenate((np.linspace(0, 0.5, neg_count), np.linspace(0.5, 1, len(values) - neg_count)))
+    # ranks of bucket edges, rank of zero keeps the midpoint at 50%
+    ranks = np.arange(len(values))
+    if max_rules is not None and len(values) > max_rules + 1:
+        ranks = np.unique(np.concatenate((np.linspace(0, len(values) - 1, max_rules).round().astype(int), [neg_count - 1])))
+    if len(ranks) < len(values):
+        ranges = np.partition(values, ranks)[ranks]
+    else:
+        ranges = np.sort(values)[ranks]
+    bounds = bounds[ranks] * 100
     midpoint = 0
+    rules = range(1, len(ranks))
+    if page is not None:
+        # rule i matches values in [ranges[i - 1], ranges[i]), the last one has no upper bound
+        matched = np.searchsorted(ranges, page[column].to_numpy(dtype=np.float64), side='right')
+        rules = np.unique(np.clip(matched, 1, len(ranks) - 1)) if len(ranks) > 1 else []
 
     styles = []
-    for i in range(1, len(bounds)):
-        min_bound = ranges[i - 1]
-        max_bound = ranges[i]
-        min_bound_percentage = bounds[i - 1] * 100
-        max_bound_percentage = bounds[i] * 100
+    for i in rules:
+        min_bound, max_bound = ranges[i - 1], ranges[i]
         style = {
             'if': {
                 'filter_query': (
                         '{{{column}}} >= {min_bound}' +
-                        (' && {{{column}}} < {max_bound}' if (i < len(bounds) - 1) else '')
+                        (' && {{{column}}} < {max_bound}' if (i < len(ranks) - 1) else '')
                 ).format(column=column, min_bound=min_bound, max_bound=max_bound),
                 'column_id': column
             },
@@ -100,58 +243,95 @@ def data_bars_diverging(df: pd.DataFrame, column: str, color_above='#0074D9', co
             'paddingTop': 8,
         }
         if max_bound > midpoint:
-            background = (
-                """
-                    linear-gradient(90deg,
-                    white 0%,
-                    white 50%,
-                    {color_above} 50%,
-                    {color_above} {max_bound_percentage}%,
-                    white {max_bound_percentage}%,
-                    white 100%)
-                """.format(
-                    max_bound_percentage=max_bound_percentage,
-                    color_above=color_above
-                )
-            )
+            style['background'] = ('linear-gradient(90deg, white 0%, white 50%, {color} 50%, {color} {bound}%, white {bound}%, white 100%)'
+                                   .format(color=color_above, bound=bounds[i]))
         else:
-            background = (
-                """
-                    linear-gradient(90deg,
-                    white 0%,
-                    white {min_bound_percentage}%,
-                    {color_below} {min_bound_percentage}%,
-                    {color_below} 50%,
-                    white 50%,
-                    white 100%)
-                """.format(
-                    min_bound_percentage=min_bound_percentage,
-                    color_below=color_below
-                )
-            )
-        style['background'] = background
+            style['background'] = ('linear-gradient(90deg, white 0%, white {bound}%, {color} {bound}%, {color} 50%, white 50%, white 100%)'
+                                   .format(color=color_below, bound=bounds[i - 1]))
         styles.append(style)
     return styles
 
+def get_table_page(table_df: pd.DataFrame, sort_by, page_current: int, page_size: Optional[int]):
+    """
+    Returns records and data bars of requested page of table sorted as sort_by and number of pages
+    :param table_df: all rows of table
+    :param sort_by: sort_by of DataTable, rows are sorted by revenue descending if it is empty
+    :param page_current: page_current of DataTable
+    :param page_size: page_size of DataTable, one page with all rows if None
+    """
+    column, ascending = 'revenue', False
+    if sort_by:
+        column, ascending = sort_by[0]['column_id'], sort_by[0]['direction'] == 'asc'
+    page_count = 1 if page_size is None else max(1, -(-len(table_df) // page_size))
+    with METRICS.stage('figure', len(table_df)) as stage:
+        # filters may leave fewer pages than the current one, show the last page then
+        page = select_page(table_df, column, ascending, min(page_current or 0, page_count - 1), page_size)
+        stage.rows(len(page))
+        return page.to_dict('records'), data_bars_diverging(table_df, 'revenue', page=page), page_count
+
 # plot 3.1 table top ship countries
-def get_top_shipcountries_table(df: pd.DataFrame, date_start: Optional[str], date_end: Optional[str], category_value: Optional[List[str]], region_value: Optional[List[str]], sort_by):
-    filtered_df = filter_dataframe(df, date_start, date_end, category_value, region_value, None)
-    if len(filtered_df) != 0:
-        filtered_df = filtered_df.groupby('shipcountry').agg({'revenue': 'sum'}).reset_index().sort_values('revenue', ascending=False)
-        if len(sort_by) != 0:
-            filtered_df = filtered_df.sort_values(sort_by[0]['column_id'], 
-                                                  ascending=sort_by[0]['direction'] == 'asc',
-                                                  inplace=False)
-    return filtered_df.to_dict('records'), data_bars_diverging(filtered_df, 'revenue')
+def get_top_shipcountries_table(df: pd.DataFrame, date_start: Optional[str], date_end: Optional[str], category_value: Optional[List[str]], region_value: Optional[List[str]], sort_by,
+                                page_current: int = 0, page_size: Optional[int] = None):
+    with METRICS.stage('aggregate', data_rows(df)) as stage:
+        filtered_df = revenue_by(df, ['shipcountry'], date_start, date_end, category_value, region_value, None, sort=False)
+        stage.rows(len(filtered_df))
+    return get_table_page(filtered_df, sort_by, page_current, page_size)
 
 
 # plot 3.2 table top clients
-def get_top_clients_table(df: pd.DataFrame, date_start: Optional[str], date_end: Optional[str], category_value: Optional[List[str]], region_value: Optional[List[str]], shipcountry_value: Optional[List[str]], sort_by):
-    filtered_df = filter_dataframe(df, date_start, date_end, category_value, region_value, shipcountry_value)
-    if len(filtered_df) != 0:
-        filtered_df = filtered_df.groupby('customerid').agg({'revenue': 'sum'}).reset_index().sort_values('revenue', ascending=False)
-        if len(sort_by) != 0:
-            filtered_df = filtered_df.sort_values(sort_by[0]['column_id'], 
-                                                  ascending=sort_by[0]['direction'] == 'asc',
-                                                  inplace=False)
-    return filtered_df.to_dict('records'), data_bars_diverging(filtered_df, 'revenue')
\ No newline at end of file
+def get_top_clients_table(df: pd.DataFrame, date_start: Optional[str], date_end: Optional[str], category_value: Optional[List[str]], region_value: Optional[List[str]], shipcountry_value: Optional[List[str]], sort_by,
+                          page_current: int = 0, page_size: Optional[int] = None):
+    with METRICS.stage('aggregate', data_rows(df)) as stage:
+        filtered_df = revenue_by(df, ['customerid'], date_start, date_end, category_value, region_value, shipcountry_value, sort=False)
+        stage.rows(len(filtered_df))
+    return get_table_page(filtered_df, sort_by, page_current, page_size)
+
+# clientside mode
+def get_clientside_cube(df: pd.DataFrame) -> dict:
+    """
+    Returns weekly revenue cube for clientside callbacks (assets/clientside.js)
+    Columns are dictionary encoded: weeks are numbers of weeks since first_week (day number
+    of its closing monday), categories, regions and countries are codes of sorted values.
+    Cells are sorted by week and codes, so equal codes form runs and the json compresses well.
+    Layouts of figures are shipped with the cube, so figures look as built by the server.
+    :param df: dataframe or query backend
+    """
+    with METRICS.stage('aggregate', data_rows(df)) as stage:
+        cells = weekly_revenue_cube(df)
+        stage.rows(len(cells))
+    with METRICS.stage('figure', len(cells)):
+        return _encode_cube(cells)
+
+def _encode_cube(cells: pd.DataFrame) -> dict:
+    """
+    Returns cube of get_clientside_cube from cells of weekly_revenue_cube
+    """
+    days = cells['orderdate'].to_numpy(dtype='datetime64[D]').astype(np.int64)
+    first_week = int(days.min()) if len(days) else 0
+    cube = {'first_week': first_week, 'week': (days - first_week) // 7}
+    for column_name in WeeklyCube.dimensions:
+        codes, values = pd.factorize(cells[column_name], sort=True)
+        cube[column_name] = codes
+        cube[column_name + '_values'] = values.tolist()
+    order = np.lexsort([cube[column_name] for column_name in WeeklyCube.dimensions[::-1]] + [cube['week']])
+    for column_name in ['week'] + WeeklyCube.dimensions:
+        cube[column_name] = cube[column_name][order].tolist()
+    cube['revenue'] = revenue_values(cells['revenue'].to_numpy()[order])
+    cube['count'] = cells['count'].to_numpy()[order].tolist()
+    cube['layouts'] = {'revenue': REVENUE_LAYOUTS['week'], 'box': BOX_LAYOUT}
+    cube['colors'] = PASTEL
+    return cube
+
+def get_revenue_anomalies(df: pd.DataFrame, date_start: Optional[str], date_end: Optional[str], category_value: Optional[List[str]],
+                          region_value: Optional[List[str]], shipcountry_value: Optional[List[str]],
+                          anomaly_method: str = 'isolation_forest') -> List[str]:
+    """
+    Returns anomalous weeks of revenue plot as 'YYYY-MM-DD' labels, clientside mode draws the plot itself
+    """
+    with METRICS.stage('aggregate', data_rows(df)) as stage:
+        weeks = revenue_per_period(df, 'week', date_start, date_end, category_value, region_value, shipcountry_value)
+        stage.rows(len(weeks))
+    with METRICS.stage('model', len(weeks)) as stage:
+        weeks = ANOMALY_SERVICE.detect(df, weeks, category_value, region_value, shipcountry_value, anomaly_method, 'week')
+        stage.rows(len(weeks))
+    return date_values(weeks.loc[weeks['anomaly'] == -1, 'orderdate'])
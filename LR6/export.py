@@ -0,0 +1,316 @@
+"""Streaming export of filtered order lines and aggregates behind dashboard charts"""
+
+import hashlib
+import importlib.util
+import json
+import os
+import threading
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, BinaryIO, Callable, Iterator, Optional
+
+import flask
+
+if TYPE_CHECKING:
+    # pandas is imported by data functions, installing route does not load it
+    import pandas as pd
+
+EXPORT_DIR = ".exports"
+EXPORT_PATH = "/export"
+EXPORT_CHUNK_ROWS = 100_000
+# bytes read from spool file at once by streaming response
+STREAM_BLOCK = 256 * 1024
+
+FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+def _frame_chunks(df: "pd.DataFrame", chunk_rows: int) -> Iterator["pd.DataFrame"]:
+    for start in range(0, max(len(df), 1), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+def _lines(data, chunk_rows, start_date, end_date, category, region, shipcountry):
+    from funcs import iter_filtered
+    return iter_filtered(data, start_date, end_date, category, region, shipcountry, chunk_rows)
+
+def _weekly_revenue(data, chunk_rows, start_date, end_date, category, region, shipcountry):
+    from funcs import weekly_revenue
+    return _frame_chunks(weekly_revenue(data, start_date, end_date, category, region, shipcountry), chunk_rows)
+
+def _mean_bill_per_region(data, chunk_rows, start_date, end_date, category, region, shipcountry):
+    from funcs import weekly_mean_revenue_by_region
+    return _frame_chunks(weekly_mean_revenue_by_region(data, start_date, end_date, category, shipcountry), chunk_rows)
+
+def _shipcountries(data, chunk_rows, start_date, end_date, category, region, shipcountry):
+    from funcs import revenue_by
+    return _frame_chunks(revenue_by(data, ["shipcountry"], start_date, end_date, category, region), chunk_rows)
+
+def _customers(data, chunk_rows, start_date, end_date, category, region, shipcountry):
+    from funcs import revenue_by
+    return _frame_chunks(revenue_by(data, ["customerid"], start_date, end_date, category, region, shipcountry), chunk_rows)
+
+def _products(data, chunk_rows, start_date, end_date, category, region, shipcountry):
+    from funcs import revenue_by
+    return _frame_chunks(revenue_by(data, ["categoryname", "productname"], start_date, end_date, None, region, shipcountry),
+                         chunk_rows)
+
+# exported datasets: filtered order lines and data of charts with the filters the chart uses
+DATASETS = {
+    "lines": _lines,
+    "weekly_revenue": _weekly_revenue,
+    "mean_bill_per_region": _mean_bill_per_region,
+    "shipcountries": _shipcountries,
+    "customers": _customers,
+    "products": _products,
+}
+
+def available_formats() -> list:
+    """
+    Returns formats of FORMATS that can be written, parquet requires pyarrow
+    """
+    return [fmt for fmt in FORMATS if fmt != "parquet" or importlib.util.find_spec("pyarrow") is not None]
+
+def write_csv(chunks: Iterator["pd.DataFrame"], file: BinaryIO, flush: Callable[[], None]):
+    header = True
+    for chunk in chunks:
+        file.write(chunk.to_csv(index=False, header=header, date_format="%Y-%m-%d").encode("utf-8"))
+        header = False
+        flush()
+
+def write_parquet(chunks: Iterator["pd.DataFrame"], file: BinaryIO, flush: Callable[[], None]):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    writer = None
+    try:
+        for chunk in chunks:
+            table = pa.Table.from_pandas(chunk, preserve_index=False, schema=None if writer is None else writer.schema)
+            if writer is None:
+                writer = pq.ParquetWriter(file, table.schema)
+            # every chunk is a row group, so readers may read the file by chunks too
+            writer.write_table(table)
+            flush()
+    finally:
+        if writer is not None:
+            writer.close()
+
+WRITERS = {"csv": write_csv, "parquet": write_parquet}
+
+def export_key(dataset: str, fmt: str, filters: dict, version: str) -> str:
+    """
+    Returns key of export: digest of dataset, format, normalized filters and version of data
+    """
+    from response_cache import normalize_value
+    text = json.dumps([dataset, fmt, {name: normalize_value(value) for name, value in filters.items()}, version],
+                      sort_keys=True, default=str)
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+class ExportJob:
+    """
+    Export being written into spool file, readers follow the file while it grows
+    """
+    def __init__(self, part_path: str, path: str):
+        self.part_path = part_path
+        self.path = path
+        self.size = 0
+        self.done = False
+        self.error = None
+        self._condition = threading.Condition()
+
+    def _progress(self, size: int, done: bool = False, error: Optional[BaseException] = None):
+        with self._condition:
+            self.size = size
+            self.done = done
+            self.error = error
+            self._condition.notify_all()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Waits until export is written, returns False on timeout
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: self.done, timeout)
+
+    def follow(self, start: int = 0, timeout: float = 60) -> Iterator[bytes]:
+        """
+        Returns iterator of bytes of spool file from start while it is written
+        Iterator raises if export fails or no bytes come for timeout seconds, so server aborts
+        the response without its last chunk and client sees an incomplete download.
+        :param timeout: seconds to wait for new bytes
+        """
+        # file is opened right away, it may be renamed when job finishes but the opened file is still read
+        try:
+            file = open(self.part_path, "rb")
+        except FileNotFoundError:
+            file = open(self.path, "rb")
+        return self._follow(file, start, timeout)
+
+    def _follow(self, file: BinaryIO, start: int, timeout: float) -> Iterator[bytes]:
+        with file:
+            file.seek(start)
+            position = start
+            while True:
+                with self._condition:
+                    self._condition.wait_for(lambda: self.done or self.size > position, timeout)
+                    size, done, error = self.size, self.done, self.error
+                if error is not None:
+                    raise RuntimeError(f"export {self.path} failed") from error
+                if size <= position and not done:
+                    raise TimeoutError(f"export {self.path} wrote nothing for {timeout} seconds")
+                while position < size:
+                    block = file.read(min(STREAM_BLOCK, size - position))
+                    position += len(block)
+                    yield block
+                if done:
+                    return
+
+class ExportService:
+    """
+    Writes exports into spool files by a thread pool of its own
+
+    Export is computed chunk by chunk from a generator and written to disk, so
+    memory does not grow with its size and callbacks do not wait for exports in
+    a busy thread pool. Requests stream the file while it is written. Written files
+    are keyed by export_key, they are served with ranges for resumed downloads
+    and reused by all server processes until data changes, the oldest files are
+    removed when there are more than max_files of them.
+    """
+    def __init__(self, directory: str = EXPORT_DIR, max_workers: int = 1, max_files: int = 32,
+                 chunk_rows: int = EXPORT_CHUNK_ROWS, part_timeout: float = 3600):
+        """
+        :param directory: directory of spool files, it is created if it does not exist
+        :param max_workers: number of exports written at once, others wait in queue
+        :param max_files: maximal number of written exports kept
+        :param part_timeout: seconds since the last write after which part file of no job of this process
+                             is removed, e.g. one left by a killed worker
+        """
+        self.directory = directory
+        self.max_files = max_files
+        self.part_timeout = part_timeout
+        self.chunk_rows = chunk_rows
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix="export")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def path(self, key: str, fmt: str) -> str:
+        return os.path.join(self.directory, f"{key}.{fmt}")
+
+    def submit(self, key: str, fmt: str, chunks: Callable[[], Iterator["pd.DataFrame"]]) -> ExportJob:
+        """
+        Returns running or new job writing export, chunks is called by the export thread
+        """
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is None:
+                os.makedirs(self.directory, exist_ok=True)
+                path = self.path(key, fmt)
+                # part file of each process, processes exporting the same key replace file by identical one
+                job = self._jobs[key] = ExportJob(f"{path}.{os.getpid()}.part", path)
+                open(job.part_path, "wb").close()
+                self._executor.submit(self._write, key, job, fmt, chunks)
+        return job
+
+    def _write(self, key: str, job: ExportJob, fmt: str, chunks: Callable[[], Iterator["pd.DataFrame"]]):
+        try:
+            with open(job.part_path, "r+b") as file:
+                def flush():
+                    file.flush()
+                    job._progress(file.tell())
+                WRITERS[fmt](chunks(), file, flush)
+                flush()
+            os.replace(job.part_path, job.path)
+            job._progress(job.size, done=True)
+        except Exception as error:
+            warnings.warn(f"export {job.path} failed: {error}")
+            try:
+                os.remove(job.part_path)
+            except OSError:
+                pass
+            job._progress(job.size, done=True, error=error)
+        finally:
+            with self._lock:
+                self._jobs.pop(key, None)
+            self._evict()
+
+    def _evict(self):
+        try:
+            with self._lock:
+                running = {job.part_path for job in self._jobs.values()}
+            paths, stale = [], []
+            for name in os.listdir(self.directory):
+                path = os.path.join(self.directory, name)
+                if not name.endswith(".part"):
+                    paths.append(path)
+                elif path not in running and time.time() - os.path.getmtime(path) > self.part_timeout:
+                    stale.append(path)
+            paths.sort(key=os.path.getmtime, reverse=True)
+            for path in paths[self.max_files:] + stale:
+                os.remove(path)
+        except OSError as error:
+            warnings.warn(f"exports were not evicted: {error}")
+
+def request_filters(args) -> dict:
+    """
+    Returns filters of export request, list filters are repeated query arguments as in ?region=A&region=B
+    """
+    return {
+        "start_date": args.get("start_date") or None,
+        "end_date": args.get("end_date") or None,
+        "category": args.getlist("category") or None,
+        "region": args.getlist("region") or None,
+        "shipcountry": args.getlist("shipcountry") or None,
+    }
+
+def install_export(server: flask.Flask, service: ExportService, get_data: Callable, get_version: Callable[[], Optional[str]],
+                   path: str = EXPORT_PATH, max_streams: int = 4, wait_seconds: float = 30):
+    """
+    Adds route <path>/<dataset>.<format>?start_date=&end_date=&category=&region=&shipcountry= to flask server
+    Response streams export while it is written. Written export is sent with ETag and
+    Accept-Ranges, so interrupted downloads are resumed by range requests.
+    :param get_data: returns order data of callbacks
+    :param get_version: returns version of data, None disables reuse of written exports
+    :param max_streams: requests streaming or waiting for exports being written at once in the process,
+                        further ones get 503 so that downloads do not take all threads serving callbacks
+    :param wait_seconds: range request of export being written waits for it at most this long
+    """
+    streams = threading.BoundedSemaphore(max_streams)
+
+    @server.route(f"{path}/<dataset>.<fmt>")
+    def export_route(dataset: str, fmt: str):
+        if dataset not in DATASETS or fmt not in FORMATS:
+            flask.abort(404)
+        if fmt not in available_formats():
+            return flask.Response(f"{fmt} export requires pyarrow", status=501, mimetype="text/plain")
+        filters = request_filters(flask.request.args)
+        version = get_version()
+        key = export_key(dataset, fmt, filters, version if version is not None else time.time_ns())
+        download_name = f"{dataset}.{fmt}"
+        if not os.path.exists(service.path(key, fmt)):
+            # streams and waits for export being written hold request thread, their number is limited
+            if not streams.acquire(blocking=False):
+                return flask.Response("too many exports", status=503, headers={"Retry-After": "5"}, mimetype="text/plain")
+            try:
+                data = get_data()
+                job = service.submit(key, fmt, lambda: DATASETS[dataset](data, service.chunk_rows, **filters))
+                if flask.request.range is None:
+                    response = flask.Response(job.follow(), mimetype=FORMATS[fmt])
+                    response.headers["Content-Disposition"] = f'attachment; filename="{download_name}"'
+                    response.headers["Accept-Ranges"] = "bytes"
+                    response.set_etag(key)
+                    response.call_on_close(streams.release)
+                    return response
+                # ranges need size of the whole file
+                written = job.wait(wait_seconds)
+            except BaseException:
+                streams.release()
+                raise
+            streams.release()
+            if not written:
+                return flask.Response("export is being written", status=503, headers={"Retry-After": "5"},
+                                      mimetype="text/plain")
+            if job.error is not None:
+                return flask.Response(f"export failed: {job.error}", status=500, mimetype="text/plain")
+        # conditional response handles Range and If-Range, X-Sendfile is used if server enables it
+        return flask.send_file(os.path.abspath(service.path(key, fmt)), mimetype=FORMATS[fmt],
+                               as_attachment=True, download_name=download_name, etag=key, conditional=True)
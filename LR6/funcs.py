@@ -1,13 +1,134 @@
 """Utils and CRUD functions"""
 
+import atexit
+import copy
+import hashlib
+import itertools
+import os
 import sqlite3
+import threading
+import warnings
+import weakref
+import numpy as np
 import pandas as pd
-from typing import Optional, List
+from collections import OrderedDict
+from contextlib import closing
+from typing import Iterator, Optional, List, Tuple, Union
 from datetime import datetime
-from sklearn.ensemble import IsolationForest
+from urllib.request import pathname2url
+from pandas.api.types import union_categoricals
+
+from snapshot import load_snapshot, save_snapshot
+from mapreduce import MAP_REDUCE_ENGINE, DAY_NS, WEEK_NS, MONDAY_NS, week_labels
+from metrics import METRICS
 
 PATH = "northwind.db"
 
+class ConnectionPool:
+    """
+    Read-only connections to SQLite database, one per thread
+
+    Connections are opened with URI mode=ro and query_only, so readers never take
+    write locks, and are kept open, so sqlite3 reuses their prepared statements.
+    Connections of finished threads are closed when a new one is opened, all of
+    them are closed by close(). Connections inherited by forked process are not
+    used, the child opens its own.
+    """
+    def __init__(self, path: str = PATH, mmap_size: int = 256 * 2**20, cache_size: int = 64 * 2**20,
+                 cached_statements: int = 128, timeout: float = 5):
+        """
+        :param path: path to database
+        :param mmap_size: bytes of database file read through memory map
+        :param cache_size: bytes of page cache of each connection
+        :param cached_statements: prepared statements kept by each connection
+        :param timeout: seconds to wait for lock held by writer
+        """
+        self.path = path
+        self.uri = f"file:{pathname2url(os.path.abspath(path))}?mode=ro"
+        self.pragmas = [f"PRAGMA mmap_size={int(mmap_size)}", f"PRAGMA cache_size={-int(cache_size) // 1024}",
+                        "PRAGMA temp_store=MEMORY", "PRAGMA query_only=1"]
+        self.cached_statements = cached_statements
+        self.timeout = timeout
+        self._local = threading.local()
+        # thread ident -> (thread, connection) of all open connections
+        self._connections = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def connection(self) -> sqlite3.Connection:
+        """
+        Returns read-only connection of current thread, it must not be closed or shared with other threads
+        """
+        if self._pid != os.getpid():
+            self._after_fork()
+        con = getattr(self._local, "connection", None)
+        if con is None:
+            con = sqlite3.connect(self.uri, uri=True, timeout=self.timeout, cached_statements=self.cached_statements,
+                                  check_same_thread=False)
+            for pragma in self.pragmas:
+                con.execute(pragma)
+            with self._lock:
+                for ident, (thread, finished) in list(self._connections.items()):
+                    if not thread.is_alive():
+                        finished.close()
+                        del self._connections[ident]
+                self._connections[threading.get_ident()] = (threading.current_thread(), con)
+            self._local.connection = con
+        return con
+
+    def _after_fork(self):
+        # connections of parent process are left to it, closing them here could break its transactions
+        with self._lock:
+            self._connections = {}
+            self._local = threading.local()
+            self._pid = os.getpid()
+
+    def close(self):
+        """
+        Closes all connections, threads open new ones on their next call
+        """
+        with self._lock:
+            for _, con in self._connections.values():
+                con.close()
+            self._connections.clear()
+            self._local = threading.local()
+
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
+
+def get_pool(path: str = PATH) -> ConnectionPool:
+    """
+    Returns shared connection pool of database
+    """
+    key = os.path.abspath(path)
+    with _POOLS_LOCK:
+        if key not in _POOLS:
+            _POOLS[key] = ConnectionPool(path)
+        return _POOLS[key]
+
+def close_pools():
+    """
+    Closes connections of all pools, registered to run at exit
+    """
+    with _POOLS_LOCK:
+        for pool in _POOLS.values():
+            pool.close()
+
+atexit.register(close_pools)
+
+def enable_wal(path: str = PATH) -> bool:
+    """
+    Switches database to write-ahead log, so a writer loading new orders does not block readers
+    The mode is stored in database file, it needs write access once.
+    :return: database is in WAL mode
+    """
+    try:
+        with closing(sqlite3.connect(path)) as con:
+            return con.execute("PRAGMA journal_mode=WAL").fetchone()[0].lower() == "wal"
+    except sqlite3.OperationalError as error:
+        warnings.warn(f"{path} was not switched to WAL mode: {error}")
+        return False
+
 columns_rus = {
     'shipcountry': 'Страна поставки', 
     'customerid': 'Идентификатор клиента', 
@@ -21,9 +142,7 @@ columns_rus = {
     'categoryid': 'Идентификатор категории'
 }
 
-def get_dataframe(path = PATH) -> pd.DataFrame:
-    con=sqlite3.Connection(path)
-    df=pd.read_sql('''with revenues as (SELECT
+ORDERS_QUERY = '''with revenues as (SELECT
     shipcountry,
     customerid,
     orders.orderid,
@@ -32,6 +151,7 @@ def get_dataframe(path = PATH) -> pd.DataFrame:
     (unitprice*quantity*(1-discount)) as revenue
     from orders,"order details"
     on orders.orderid="order details".orderid
+    {where}
     group by orderdate,shipcountry,customerid,orders.orderid, productid)
     SELECT 
     shipcountry,
@@ -47,12 +167,626 @@ def get_dataframe(path = PATH) -> pd.DataFrame:
     FROM revenues
     INNER JOIN products on products.ProductID=revenues.ProductID
     INNER JOIN suppliers on suppliers.SupplierID=products.SupplierID
-    INNER JOIN categories on categories.CategoryID=products.CategoryID;''',con=con)
-    df.region.fillna("Unknown (None)", inplace=True)
+    INNER JOIN categories on categories.CategoryID=products.CategoryID;'''
+
+def read_orders(con: sqlite3.Connection, where: str = "", params: tuple = ()) -> pd.DataFrame:
+    """
+    Returns order lines in database order
+    :param con: database connection
+    :param where: WHERE clause over orders and "order details" tables
+    :param params: parameters of where clause
+    """
+    df=pd.read_sql(ORDERS_QUERY.format(where=where), con=con, params=params)
+    df["region"] = df["region"].fillna("Unknown (None)")
     df["orderdate"] = pd.to_datetime(df["orderdate"])
-    df = df.sort_values("orderdate")
     return df
 
+COMPACT_CATEGORICAL_COLUMNS = ["shipcountry", "customerid", "productname", "region", "categoryname"]
+COMPACT_INTEGER_COLUMNS = ["orderid", "productid", "categoryid"]
+
+def compact_schema(df: pd.DataFrame, float32_revenue: bool = False) -> pd.DataFrame:
+    """
+    Returns order lines with dictionary encoded string dimensions and downcast numbers
+    :param df: order lines
+    :param float32_revenue: store revenue as float32 (about 7 significant digits), sums of it are
+                            off by cents, so the dashboard keeps float64 revenue
+    """
+    df = df.copy(deep=False)
+    for column_name in COMPACT_CATEGORICAL_COLUMNS:
+        df[column_name] = df[column_name].astype("category")
+    for column_name in COMPACT_INTEGER_COLUMNS:
+        df[column_name] = pd.to_numeric(df[column_name], downcast="integer")
+    if float32_revenue:
+        df["revenue"] = df["revenue"].astype(np.float32)
+    return df
+
+# upper bound of rows of ORDERS_QUERY with the same where clause, inner joins and grouping only drop rows
+ORDERS_COUNT_QUERY = '''SELECT count(*) from orders,"order details"
+    on orders.orderid="order details".orderid
+    {where}'''
+
+# columns of ORDERS_QUERY in order
+ORDER_COLUMNS = ["shipcountry", "customerid", "orderid", "orderdate", "productid", "revenue",
+                 "productname", "region", "categoryname", "categoryid"]
+
+LOAD_CHUNK_ROWS = 100_000
+
+def load_orders(con: sqlite3.Connection, where: str = "", params: tuple = (), compact: bool = False,
+                chunk_rows: int = LOAD_CHUNK_ROWS) -> pd.DataFrame:
+    """
+    Returns order lines sorted by orderdate, same as sorted read_orders, with peak memory close to the result
+    Query is read by chunks into columns preallocated for the upper bound of rows. Strings
+    are dictionary encoded while reading, so every distinct value is stored once, and
+    rows are sorted one column at a time. Both statements run in one read transaction.
+    :param con: database connection
+    :param where: WHERE clause over orders and "order details" tables
+    :param params: parameters of where clause
+    :param compact: return string columns as categoricals, see compact_schema
+    :param chunk_rows: rows fetched at once
+    """
+    con.execute("BEGIN")
+    try:
+        n_rows = con.execute(ORDERS_COUNT_QUERY.format(where=where), params).fetchone()[0]
+        numbers = {column_name: np.empty(n_rows, dtype=np.int64) for column_name in COMPACT_INTEGER_COLUMNS}
+        numbers["revenue"] = np.empty(n_rows, dtype=np.float64)
+        codes = {column_name: np.empty(n_rows, dtype=np.int32) for column_name in COMPACT_CATEGORICAL_COLUMNS}
+        # value -> code of every string column, in order of first occurrence
+        dictionaries = {column_name: {} for column_name in COMPACT_CATEGORICAL_COLUMNS}
+        dates = None
+        length = 0
+        for chunk in pd.read_sql(ORDERS_QUERY.format(where=where), con=con, params=params, chunksize=chunk_rows):
+            start, length = length, length + len(chunk)
+            chunk_dates = pd.to_datetime(chunk["orderdate"], format="ISO8601").to_numpy()
+            if dates is None:
+                # unit of dates is the one pd.to_datetime gives, as in read_orders
+                dates = np.empty(n_rows, dtype=chunk_dates.dtype)
+            dates[start:length] = chunk_dates
+            for column_name, values in numbers.items():
+                values[start:length] = chunk[column_name].to_numpy()
+            chunk["region"] = chunk["region"].fillna("Unknown (None)")
+            for column_name, dictionary in dictionaries.items():
+                chunk_codes, uniques = pd.factorize(chunk[column_name])
+                # the last item maps missing values (code -1) to -1
+                mapping = np.array([dictionary.setdefault(value, len(dictionary)) for value in uniques] + [-1], dtype=np.int32)
+                codes[column_name][start:length] = mapping[chunk_codes]
+    finally:
+        con.rollback()
+
+    if dates is None:
+        dates = np.empty(0, dtype="datetime64[ns]")
+    columns = dict(numbers, **codes, orderdate=dates)
+    for values in columns.values():
+        values.resize(length, refcheck=False)
+    if length > 1 and (dates[1:] < dates[:-1]).any():
+        order = np.argsort(dates, kind="stable")
+        for values in columns.values():
+            values[:] = values[order]
+        del order
+
+    for column_name, dictionary in dictionaries.items():
+        # categories are sorted as astype("category") sorts them
+        categories = np.array(list(dictionary), dtype=object)
+        rank = np.argsort(categories)
+        recode = np.empty(len(categories) + 1, dtype=np.int32)
+        recode[rank] = np.arange(len(categories), dtype=np.int32)
+        recode[-1] = -1
+        column_codes = codes.pop(column_name)
+        column = pd.Categorical.from_codes(recode[column_codes], categories=pd.Index(categories[rank], dtype="str"))
+        del column_codes
+        columns[column_name] = column if compact else pd.array(column.astype(object), dtype="str")
+    return pd.DataFrame({column_name: columns.pop(column_name) for column_name in ORDER_COLUMNS}, copy=False)
+
+def decode_categoricals(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Returns dataframe with categorical columns converted to dtype of their categories
+    Used for small aggregated results, so that plots and tables get plain values.
+    """
+    for column_name in df.columns:
+        if isinstance(df[column_name].dtype, pd.CategoricalDtype):
+            df[column_name] = df[column_name].astype(df[column_name].cat.categories.dtype)
+    return df
+
+def concat_orders(head: pd.DataFrame, tail: pd.DataFrame) -> pd.DataFrame:
+    """
+    Returns concatenation of order lines keeping categorical columns categorical
+    """
+    columns = {}
+    for column_name in head.columns:
+        if isinstance(head[column_name].dtype, pd.CategoricalDtype):
+            columns[column_name] = union_categoricals([head[column_name].array, tail[column_name].astype("category").array])
+        else:
+            columns[column_name] = pd.concat([head[column_name], tail[column_name]], ignore_index=True)
+    return pd.DataFrame(columns)
+
+def get_dataframe(path = PATH, use_snapshot: bool = True, compact: bool = False) -> pd.DataFrame:
+    """
+    Returns indexed order lines sorted by orderdate
+    :param path: path to database
+    :param use_snapshot: load columns from memory-mapped snapshot next to database
+                         if it matches database file, save snapshot otherwise
+    :param compact: use compact_schema
+    """
+    df = load_snapshot(path, compact) if use_snapshot else None
+    if df is None:
+        # read by chunks, full read_sql result and its copies did not fit memory of workers for large databases
+        df = load_orders(get_pool(path).connection(), compact=compact)
+        if compact:
+            df = compact_schema(df)
+        if use_snapshot:
+            save_snapshot(df, path, compact)
+    build_indexes(df)
+    return df
+
+def parse_date(value) -> np.int64:
+    """
+    Returns date as int64 nanoseconds, the representation used by DateIndex
+    :param value: date string (e.g. '2016-01-01'), datetime or numpy datetime64
+    """
+    return np.datetime64(value, 'ns').astype(np.int64)
+
+def sql_date(value) -> str:
+    """
+    Returns date in the text format of Orders.OrderDate
+    """
+    timestamp = pd.Timestamp(int(parse_date(value)))
+    if timestamp == timestamp.normalize():
+        return timestamp.strftime("%Y-%m-%d")
+    return timestamp.strftime("%Y-%m-%d %H:%M:%S")
+
+class DateIndex:
+    """
+    Sorted int64 copy of a datetime column of a dataframe sorted by this column
+    Date range filter is two binary searches and a positional slice of the dataframe
+    """
+    def __init__(self, df: pd.DataFrame, column_name: str = "orderdate"):
+        """
+        :param df: dataframe sorted by column_name
+        :param column_name: name of datetime column
+        """
+        self.column_name = column_name
+        self.keys = df[column_name].to_numpy(dtype="datetime64[ns]").view(np.int64)
+        if len(self.keys) > 1 and (np.diff(self.keys) < 0).any():
+            raise ValueError(f"dataframe is not sorted by '{column_name}'")
+
+    def positions(self, start_date=None, end_date=None) -> Tuple[int, int]:
+        """
+        Returns [start, stop) row positions of rows with start_date <= date <= end_date
+        """
+        start = 0 if start_date is None else int(np.searchsorted(self.keys, parse_date(start_date), side="left"))
+        stop = len(self.keys) if end_date is None else int(np.searchsorted(self.keys, parse_date(end_date), side="right"))
+        return start, max(start, stop)
+
+    def slice(self, df: pd.DataFrame, start_date=None, end_date=None) -> pd.DataFrame:
+        """
+        Returns rows of indexed dataframe in date range, positional slice does not copy data
+        """
+        start, stop = self.positions(start_date, end_date)
+        return df.iloc[start:stop]
+
+    def replace_tail(self, start: int, tail: pd.DataFrame) -> "DateIndex":
+        """
+        Returns index of dataframe with rows from start replaced by tail
+        :param tail: rows sorted by date, the first one is not earlier than row start
+        """
+        index = copy.copy(self)
+        index.keys = np.concatenate((self.keys[:start], tail[self.column_name].to_numpy(dtype="datetime64[ns]").view(np.int64)))
+        if start > 0 and len(index.keys) > start and index.keys[start] < index.keys[start - 1]:
+            raise ValueError("tail is earlier than rows before it")
+        return index
+
+class CategoryIndex:
+    """
+    Inverted index of a categorical column: sorted row ids of every value
+    Multiselect filter is a union of row id lists of selected values.
+    """
+    def __init__(self, df: pd.DataFrame, column_name: str):
+        """
+        :param df: dataframe to index
+        :param column_name: name of column to index
+        """
+        self.column_name = column_name
+        codes, uniques = pd.factorize(df[column_name])
+        # stable sort keeps row ids of each value ascending, missing values (code -1) come first
+        order = np.argsort(codes, kind="stable")
+        counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+        row_dtype = np.int32 if len(df) < 2**31 else np.int64
+        self.row_ids = order[len(order) - counts.sum():].astype(row_dtype)
+        self.offsets = np.concatenate(([0], np.cumsum(counts)))
+        self.codes = {value: code for code, value in enumerate(uniques)}
+
+    def rows(self, values: List[str], start: int = 0, stop: Optional[int] = None) -> np.ndarray:
+        """
+        Returns sorted ids of rows in [start, stop) with column value in values
+        """
+        parts = []
+        for value in set(values):
+            code = self.codes.get(value)
+            if code is None:
+                continue
+            ids = self.row_ids[self.offsets[code]:self.offsets[code + 1]]
+            if start > 0 or stop is not None:
+                ids = ids[np.searchsorted(ids, start):np.searchsorted(ids, len(self.row_ids) if stop is None else stop)]
+            parts.append(ids)
+        if len(parts) == 0:
+            return np.empty(0, dtype=self.row_ids.dtype)
+        if len(parts) == 1:
+            return parts[0]
+        # values are disjoint, union is a sort of concatenation
+        return np.sort(np.concatenate(parts))
+
+    def replace_tail(self, start: int, tail: pd.DataFrame) -> "CategoryIndex":
+        """
+        Returns index of dataframe with rows from start replaced by tail
+        Row ids of tail are inserted at the end of their values, no full sort is done.
+        """
+        index = copy.copy(self)
+        # drop ids of replaced rows, offsets of kept ids are counted by cumulative sum
+        kept = self.row_ids < start
+        kept_offsets = np.concatenate(([0], np.cumsum(kept)))[self.offsets]
+        row_ids = self.row_ids[kept]
+
+        codes, uniques = pd.factorize(tail[self.column_name])
+        index.codes = dict(self.codes)
+        for value in uniques:
+            index.codes.setdefault(value, len(index.codes))
+        tail_codes = np.array([index.codes[value] for value in uniques], dtype=np.int64)[codes[codes >= 0]]
+        tail_ids = (start + np.flatnonzero(codes >= 0)).astype(row_ids.dtype)
+
+        # new values are appended after all kept ids
+        value_ends = np.concatenate((kept_offsets[1:], np.full(len(index.codes) - len(self.codes), len(row_ids))))
+        order = np.argsort(tail_codes, kind="stable")
+        index.row_ids = np.insert(row_ids, value_ends[tail_codes[order]], tail_ids[order])
+        counts = np.diff(np.concatenate((kept_offsets, value_ends[len(self.codes):])))
+        counts += np.bincount(tail_codes, minlength=len(index.codes))
+        index.offsets = np.concatenate(([0], np.cumsum(counts)))
+        return index
+
+class WeeklyCube:
+    """
+    Revenue of order lines aggregated by week and dimension columns
+    Cells keep sum, count and sum of squares of revenue, so weekly sums and means
+    of any selection of dimension values are computed without line items.
+    """
+    dimensions = ["categoryname", "region", "shipcountry"]
+
+    def __init__(self, df: pd.DataFrame):
+        """
+        :param df: dataframe to aggregate
+        """
+        self.cells = self._aggregate_lines(df, self.dimensions).sort_values(["orderdate"] + self.dimensions, ignore_index=True)
+        self.date_index = DateIndex(self.cells, "orderdate")
+
+    @staticmethod
+    def _aggregate_lines(lines: pd.DataFrame, by: List[str]) -> pd.DataFrame:
+        lines = pd.DataFrame({
+            "orderdate": week_labels(lines["orderdate"].to_numpy(dtype="datetime64[ns]").view(np.int64)).view("datetime64[ns]"),
+            **{column_name: lines[column_name].array for column_name in by},
+            "revenue": lines["revenue"].to_numpy(dtype=np.float64),
+        })
+        lines["revenue_sq"] = lines["revenue"]**2
+        return lines.groupby(by + ["orderdate"], sort=False, observed=True).agg(
+            revenue=("revenue", "sum"), count=("revenue", "size"), revenue_sq=("revenue_sq", "sum")).reset_index()
+
+    def replace_tail(self, df: pd.DataFrame, date_index: DateIndex, changed_from) -> "WeeklyCube":
+        """
+        Returns cube of df where only rows since changed_from differ from dataframe of this cube
+        Weeks starting from the week of changed_from are aggregated again from df.
+        :param date_index: DateIndex of df
+        :param changed_from: earliest changed date
+        """
+        cube = copy.copy(self)
+        first_week = week_labels(np.array([parse_date(changed_from)]))[0]
+        lines = df.iloc[np.searchsorted(date_index.keys, first_week - WEEK_NS, "right"):]
+        cells = self._aggregate_lines(lines, self.dimensions).sort_values(["orderdate"] + self.dimensions)
+        kept_cells = self.cells.iloc[:np.searchsorted(self.date_index.keys, first_week, "left")]
+        cube.cells = pd.concat([kept_cells, cells[kept_cells.columns]], ignore_index=True)
+        cube.date_index = DateIndex(cube.cells, "orderdate")
+        return cube
+
+    def rollup(self, df: pd.DataFrame, start_date: Optional[str] = None, end_date: Optional[str] = None,
+               category: Optional[List[str]] = None, region: Optional[List[str]] = None,
+               shipcountry: Optional[List[str]] = None, by: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        Returns revenue sum, count and sum of squares per week of filtered order lines
+        Weeks cut by the date range are aggregated from line items of df.
+        :param df: dataframe the cube was built from
+        :param by: dimension columns to keep besides orderdate
+        :return: dataframe with columns by + [orderdate, revenue, count, revenue_sq] sorted by them
+        """
+        by = [] if by is None else by
+        dimension_filter = (category, region, shipcountry)
+        parts = []
+        if start_date is None or end_date is None:
+            parts.append(filter_dataframe(self.cells, None, None, *dimension_filter))
+        else:
+            start, end = parse_date(start_date), parse_date(end_date)
+            # labels of the first and the last week lying inside [start, end]
+            first_week = week_labels(np.array([start + WEEK_NS]))[0]
+            last_week = week_labels(np.array([end]))[0]
+            if last_week != end:
+                last_week -= WEEK_NS
+            keys = get_indexes(df)["orderdate"].keys
+            if first_week > last_week:
+                edges = [(np.searchsorted(keys, start, "left"), np.searchsorted(keys, end, "right"))]
+            else:
+                weeks = self.date_index.keys
+                cells = self.cells.iloc[np.searchsorted(weeks, first_week, "left"):np.searchsorted(weeks, last_week, "right")]
+                parts.append(filter_dataframe(cells, None, None, *dimension_filter))
+                edges = [(np.searchsorted(keys, start, "left"), np.searchsorted(keys, first_week - WEEK_NS, "right")),
+                         (np.searchsorted(keys, last_week, "right"), np.searchsorted(keys, end, "right"))]
+            for edge_start, edge_stop in edges:
+                if edge_start < edge_stop:
+                    lines = filter_dataframe(df.iloc[edge_start:edge_stop], None, None, *dimension_filter)
+                    parts.append(self._aggregate_lines(lines, by))
+        columns = by + ["orderdate", "revenue", "count", "revenue_sq"]
+        if len(parts) == 0:
+            return self.cells.iloc[:0][columns]
+        cells = pd.concat([part[columns] for part in parts], ignore_index=True)
+        return cells.groupby(by + ["orderdate"], sort=True, observed=True).agg(
+            revenue=("revenue", "sum"), count=("count", "sum"), revenue_sq=("revenue_sq", "sum")).reset_index()
+
+def round_cents(values) -> np.ndarray:
+    """
+    Returns money amounts as float64 rounded to cents
+    Sums of float revenue (differences of prefix sums most of all) carry noise in the last digits,
+    it is rounded off first, so that sums ending in half a cent are rounded the same way by every path.
+    """
+    return np.round(np.round(np.asarray(values, dtype=np.float64), 6), 2)
+
+class DayPrefixSums:
+    """
+    Cumulative revenue and count of order lines per day for every cell (combination of columns)
+    Entries are sorted by cell and day, revenue of a cell in any range of days is the
+    difference of two cumulative sums found by binary search on (cell, day) keys.
+    """
+    def __init__(self, lines: pd.DataFrame, columns: List[str]):
+        """
+        :param lines: order lines to aggregate
+        :param columns: columns of cells
+        """
+        self.columns = columns
+        days = lines["orderdate"].to_numpy(dtype="datetime64[ns]").view(np.int64) // DAY_NS
+        self.first_day = int(days.min()) if len(days) else 0
+        self.n_days = int(days.max()) - self.first_day + 1 if len(days) else 1
+        # mixed radix number of codes of columns identifies cell, digits are rows of parts,
+        # parts are compacted into one when the number could overflow together with days
+        cell_keys = np.zeros(len(lines), dtype=np.int64)
+        parts = []
+        for column_name in columns:
+            codes, uniques = pd.factorize(lines[column_name], use_na_sentinel=False)
+            if np.prod([len(part) for part in parts], dtype=float) * len(uniques) * self.n_days >= 2**62:
+                radix, cell_keys = np.unique(cell_keys, return_inverse=True)
+                parts = [self._decode(radix, parts)]
+            cell_keys = cell_keys * len(uniques) + codes
+            parts.append(pd.DataFrame({column_name: uniques}))
+        # entries are sorted by cell and day
+        entry_keys, entry_of_line = np.unique(cell_keys * self.n_days + (days - self.first_day), return_inverse=True)
+        revenue = np.bincount(entry_of_line, weights=lines["revenue"].to_numpy(dtype=np.float64), minlength=len(entry_keys))
+        count = np.bincount(entry_of_line, minlength=len(entry_keys)).astype(np.int64)
+        entry_cells = entry_keys // self.n_days
+        cell_starts = np.flatnonzero(np.diff(entry_cells, prepend=-1) != 0)
+        self.cells = self._decode(entry_cells[cell_starts], parts)
+        self.offsets = np.append(cell_starts, len(entry_keys))
+        counts = np.diff(self.offsets)
+        self.keys = np.repeat(np.arange(len(cell_starts)), counts) * self.n_days + entry_keys % self.n_days
+        # cumulative sums restart in every cell, so they stay small relative to cell totals
+        self.revenue = np.cumsum(revenue)
+        self.revenue -= np.repeat(self.revenue[cell_starts] - revenue[cell_starts], counts)
+        self.count = np.cumsum(count)
+        self.count -= np.repeat(self.count[cell_starts] - count[cell_starts], counts)
+
+    @staticmethod
+    def _decode(keys: np.ndarray, parts: List[pd.DataFrame]) -> pd.DataFrame:
+        """
+        Returns values of columns of mixed radix keys
+        """
+        digits = []
+        for part in reversed(parts):
+            digits.append(part.iloc[keys % len(part)].reset_index(drop=True))
+            keys = keys // len(part)
+        return pd.concat(digits[::-1], axis=1)
+
+    def totals(self, cells: np.ndarray, start_day: Optional[int], end_day: Optional[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns revenue and count of order lines of cells in days [start_day, end_day]
+        :param cells: positions of cells in self.cells
+        :param start_day: the first day, None for no bound
+        :param end_day: the last day, None for no bound
+        """
+        start = 0 if start_day is None else min(max(start_day - self.first_day, 0), self.n_days)
+        end = self.n_days - 1 if end_day is None else min(max(end_day - self.first_day, -1), self.n_days - 1)
+        last = np.searchsorted(self.keys, cells * self.n_days + end, "right") - 1
+        before = np.searchsorted(self.keys, cells * self.n_days + start, "left") - 1
+        # entries found before the first entry of cell belong to previous cells
+        in_last, in_before = last >= self.offsets[cells], before >= self.offsets[cells]
+        revenue = np.where(in_last, self.revenue[last], 0.0) - np.where(in_before, self.revenue[before], 0.0)
+        count = np.where(in_last, self.count[last], 0) - np.where(in_before, self.count[before], 0)
+        return revenue, count
+
+class PrefixSumIndex:
+    """
+    Revenue of any date range grouped by columns without scanning order lines
+    Day prefix sums of all rows are kept together with prefix sums of the tail of
+    dataframe starting from split day, replace_tail rebuilds only the tail part,
+    the whole index is rebuilt when the tail grows over max_tail_share of rows.
+    Date ranges are answered exactly only when dates of orders and bounds of range
+    are whole days, see covers.
+    """
+    max_tail_share = 0.1
+
+    def __init__(self, df: pd.DataFrame, columns: List[str], date_index: Optional[DateIndex] = None):
+        """
+        :param df: dataframe sorted by orderdate
+        :param columns: columns to group by and to filter by
+        :param date_index: DateIndex of df
+        """
+        date_index = DateIndex(df, "orderdate") if date_index is None else date_index
+        self.columns = columns
+        self.whole_days = bool((date_index.keys % DAY_NS == 0).all())
+        self.main = DayPrefixSums(df, columns)
+        self.split_day = self.main.first_day + self.main.n_days
+        self.tail = None
+
+    def covers(self, by: List[str], start_date=None, end_date=None, category: Optional[List[str]] = None,
+               region: Optional[List[str]] = None, shipcountry: Optional[List[str]] = None) -> bool:
+        """
+        Checks that revenue_by with these arguments can be answered by index
+        """
+        filtered = [column_name for column_name, values in zip(["categoryname", "region", "shipcountry"],
+                                                              [category, region, shipcountry]) if values]
+        if not set(by + filtered) <= set(self.columns) or not self.whole_days:
+            return False
+        if start_date is None or end_date is None:
+            return True
+        return all(parse_date(value) % DAY_NS == 0 for value in (start_date, end_date))
+
+    def revenue_by(self, by: List[str], start_date=None, end_date=None, category: Optional[List[str]] = None,
+                   region: Optional[List[str]] = None, shipcountry: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        Returns sum of revenue of filtered order lines grouped by columns as revenue_by, rows are not sorted
+        Work is proportional to the number of cells, not to the number of order lines.
+        """
+        start_day = end_day = None
+        if start_date is not None and end_date is not None:
+            start_day, end_day = parse_date(start_date) // DAY_NS, parse_date(end_date) // DAY_NS
+        parts = [(self.main, start_day, end_day if end_day is not None and end_day < self.split_day else self.split_day - 1)]
+        if self.tail is not None:
+            parts.append((self.tail, start_day if start_day is not None and start_day > self.split_day else self.split_day, end_day))
+        results = []
+        for prefix_sums, first, last in parts:
+            mask = np.ones(len(prefix_sums.cells), dtype=bool)
+            for column_name, values in zip(["categoryname", "region", "shipcountry"], [category, region, shipcountry]):
+                if values:
+                    mask &= prefix_sums.cells[column_name].isin(values).to_numpy()
+            cells = np.flatnonzero(mask)
+            revenue, count = prefix_sums.totals(cells, first, last)
+            result = prefix_sums.cells.iloc[cells][by].assign(revenue=revenue, count=count)
+            results.append(result.loc[count > 0])
+        result = concat_orders(*results) if len(results) > 1 else results[0]
+        result = result.groupby(by, sort=False, observed=True).agg({"revenue": "sum"}).reset_index()
+        result["revenue"] = round_cents(result["revenue"])
+        return result
+
+    def replace_tail(self, df: pd.DataFrame, date_index: DateIndex, changed_from) -> "PrefixSumIndex":
+        """
+        Returns index of df where only rows since changed_from differ from dataframe of this index
+        :param date_index: DateIndex of df
+        :param changed_from: earliest changed date
+        """
+        split_day = min(self.split_day, parse_date(changed_from) // DAY_NS)
+        tail_start = int(np.searchsorted(date_index.keys, split_day * DAY_NS, "left"))
+        if len(df) - tail_start > self.max_tail_share * len(df):
+            return PrefixSumIndex(df, self.columns, date_index)
+        index = copy.copy(self)
+        index.whole_days = bool((date_index.keys[tail_start:] % DAY_NS == 0).all()) and self.whole_days
+        index.split_day = split_day
+        index.tail = DayPrefixSums(df.iloc[tail_start:], self.columns) if tail_start < len(df) else None
+        return index
+
+# columns of prefix sum indexes: groups of revenue_by in dashboard and columns of dropdown filters
+PREFIX_SUM_COLUMNS = [
+    ["categoryname", "productname", "region", "shipcountry"],
+    ["shipcountry", "categoryname", "region"],
+    ["customerid", "categoryname", "region", "shipcountry"],
+]
+
+INDEXED_COLUMNS = ["categoryname", "region", "shipcountry", "customerid"]
+
+# indexes of dataframes returned by get_dataframe, keyed by id of dataframe
+_INDEXES = {}
+
+# versions of indexed dataframes, every loaded or refreshed dataframe gets a new one
+_VERSIONS = itertools.count(1)
+
+def _register_indexes(df: pd.DataFrame, indexes: dict):
+    indexes["version"] = next(_VERSIONS)
+    key = id(df)
+    _INDEXES[key] = (weakref.ref(df, lambda _: _INDEXES.pop(key, None)), indexes)
+
+def build_indexes(df: pd.DataFrame) -> dict:
+    """
+    Builds indexes used by filter_dataframe and attaches them to dataframe
+    Indexes are dropped together with dataframe. Derived dataframes (copies,
+    filtered results) have no indexes and are filtered by full scan.
+    :return: dict of indexes
+    """
+    indexes = {"orderdate": DateIndex(df, "orderdate")}
+    for column_name in INDEXED_COLUMNS:
+        indexes[column_name] = CategoryIndex(df, column_name)
+    indexes["weekly_cube"] = WeeklyCube(df)
+    indexes["prefix_sums"] = [PrefixSumIndex(df, columns, indexes["orderdate"]) for columns in PREFIX_SUM_COLUMNS]
+    _register_indexes(df, indexes)
+    return indexes
+
+def replace_tail(df: pd.DataFrame, start: int, tail: pd.DataFrame) -> pd.DataFrame:
+    """
+    Returns indexed dataframe with rows of indexed df from start replaced by tail
+    Indexes of df are updated incrementally instead of being rebuilt.
+    :param df: indexed dataframe sorted by orderdate
+    :param start: position of the first replaced row
+    :param tail: rows sorted by orderdate, not earlier than rows before start
+    """
+    indexes = get_indexes(df)
+    result = concat_orders(df.iloc[:start], tail)
+    date_index = indexes["orderdate"].replace_tail(start, tail)
+    result_indexes = {"orderdate": date_index}
+    for column_name in INDEXED_COLUMNS:
+        result_indexes[column_name] = indexes[column_name].replace_tail(start, tail)
+    # the earliest date of removed and added rows
+    changed = np.concatenate((indexes["orderdate"].keys[start:start + 1], date_index.keys[start:start + 1]))
+    cube = indexes["weekly_cube"]
+    prefix_sums = indexes["prefix_sums"]
+    if len(changed) != 0:
+        changed_from = np.datetime64(int(changed.min()), "ns")
+        cube = cube.replace_tail(result, date_index, changed_from)
+        prefix_sums = [index.replace_tail(result, date_index, changed_from) for index in prefix_sums]
+    result_indexes["weekly_cube"] = cube
+    result_indexes["prefix_sums"] = prefix_sums
+    _register_indexes(result, result_indexes)
+    return result
+
+def data_version(df: pd.DataFrame) -> Optional[int]:
+    """
+    Returns version of order data, it changes when data is reloaded or refreshed
+    :param df: indexed dataframe or query backend
+    :return: version or None if data is not versioned (e.g. filtered dataframe)
+    """
+    if not isinstance(df, pd.DataFrame):
+        return df.data_version()
+    indexes = get_indexes(df)
+    return None if indexes is None else indexes["version"]
+
+def data_fingerprint(df: pd.DataFrame) -> Optional[str]:
+    """
+    Returns digest of order data, unlike data_version it is the same in every process
+    holding the same data, so it can version caches shared between server processes
+    :param df: indexed dataframe or query backend
+    :return: digest or None if data is not versioned
+    """
+    if not isinstance(df, pd.DataFrame):
+        return str(df.data_version())
+    indexes = get_indexes(df)
+    if indexes is None:
+        return None
+    if "fingerprint" not in indexes:
+        # every value of every column is hashed, so renamed products or orders moved to another
+        # country change it too, it is computed once per loaded or refreshed dataframe
+        digest = hashlib.blake2b(digest_size=16)
+        for column_name in df.columns:
+            digest.update(f"{column_name}:{df[column_name].dtype}".encode())
+            digest.update(pd.util.hash_pandas_object(df[column_name], index=False).to_numpy().tobytes())
+        indexes["fingerprint"] = digest.hexdigest()
+    return indexes["fingerprint"]
+
+def get_indexes(df: pd.DataFrame) -> Optional[dict]:
+    """
+    Returns indexes built for this dataframe or None
+    """
+    entry = _INDEXES.get(id(df))
+    if entry is None or entry[0]() is not df:
+        return None
+    return entry[1]
+
 def filter_dataframe_by_cat_column(df: pd.DataFrame, column_name: str, 
                                    allowed_value: List[str]) -> pd.DataFrame:
     """
@@ -62,6 +796,9 @@ def filter_dataframe_by_cat_column(df: pd.DataFrame, column_name: str,
     :param allowed_value: list of allowed values
     :return: filtered dataframe
     """
+    indexes = get_indexes(df)
+    if indexes is not None and column_name in indexes:
+        return df.iloc[indexes[column_name].rows(allowed_value)]
     return df.loc[df[column_name].isin(allowed_value)]
 
 def filter_dataframe_by_ordinal_column(df: pd.DataFrame, 
@@ -76,15 +813,13 @@ def filter_dataframe_by_ordinal_column(df: pd.DataFrame,
     :param allowed_lower_value: lower bound of allowed values
     :return: filtered dataframe
     """
-    if allowed_upper_value is not None:
-        return df.loc[df[column_name] <= allowed_upper_value]
-    if allowed_lower_value is not None:
-        return df.loc[df[column_name] >= allowed_lower_value]
     if allowed_lower_value is None and allowed_upper_value is None:
         raise TypeError("missing 1 requred positional argument 'allowed_upper_value' or 'allowed_lower_value'")
-    
-    # to prevent type error
-    return df.copy()
+    if allowed_upper_value is not None:
+        df = df.loc[df[column_name] <= allowed_upper_value]
+    if allowed_lower_value is not None:
+        df = df.loc[df[column_name] >= allowed_lower_value]
+    return df
     
 def filter_dataframe(df: pd.DataFrame, 
                      start_date: Optional[str] = None, end_date: Optional[str] = None, category: Optional[List[str]] = None,
@@ -99,6 +834,12 @@ def filter_dataframe(df: pd.DataFrame,
     :param shipcountry: list of shipcountries to filter
     :return: filtered dataframe
     """
+    if not isinstance(df, pd.DataFrame):
+        # query backend (sql_backend.SqlOrders) filters in database
+        return df.filter(start_date, end_date, category, region, shipcountry)
+    indexes = get_indexes(df)
+    if indexes is not None:
+        return filter_indexed_dataframe(df, indexes, start_date, end_date, category, region, shipcountry)
     if start_date is not None and end_date is not None:
         df = filter_dataframe_by_ordinal_column(df, "orderdate", 
                                                 datetime.strptime(end_date, '%Y-%m-%d'), 
@@ -113,16 +854,562 @@ def filter_dataframe(df: pd.DataFrame,
         if len(shipcountry) != 0:
             df = filter_dataframe_by_cat_column(df, "shipcountry", shipcountry)
     return df
+
+def filter_indexed_dataframe(df: pd.DataFrame, indexes: dict,
+                             start_date: Optional[str] = None, end_date: Optional[str] = None, category: Optional[List[str]] = None,
+                             region: Optional[List[str]] = None, shipcountry: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Filters dataframe using its indexes, rows are the same as in filter_dataframe
+    Date range gives positional bounds, selected values of each column give sorted
+    row ids inside these bounds and columns are combined by intersection.
+    :param indexes: indexes returned by build_indexes for df
+    """
+    return df.iloc[filtered_rows(df, indexes, start_date, end_date, category, region, shipcountry)]
+
+def filtered_rows(df: pd.DataFrame, indexes: dict,
+                  start_date: Optional[str] = None, end_date: Optional[str] = None, category: Optional[List[str]] = None,
+                  region: Optional[List[str]] = None, shipcountry: Optional[List[str]] = None) -> Union[slice, np.ndarray]:
+    """
+    Returns positions of rows of filter_indexed_dataframe: slice of date range or sorted row ids
+    """
+    start, stop = 0, len(df)
+    if start_date is not None and end_date is not None:
+        start, stop = indexes["orderdate"].positions(start_date, end_date)
+    rows = None
+    for column_name, values in (("categoryname", category), ("region", region), ("shipcountry", shipcountry)):
+        if values is None or len(values) == 0:
+            continue
+        column_rows = indexes[column_name].rows(values, start, stop)
+        rows = column_rows if rows is None else np.intersect1d(rows, column_rows, assume_unique=True)
+    return slice(start, stop) if rows is None else rows
+
+def iter_filtered(df: pd.DataFrame, start_date: Optional[str] = None, end_date: Optional[str] = None,
+                  category: Optional[List[str]] = None, region: Optional[List[str]] = None,
+                  shipcountry: Optional[List[str]] = None, chunk_rows: int = LOAD_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """
+    Yields order lines of filter_dataframe by chunks of at most chunk_rows rows, at least one chunk is yielded
+    Only positions of filtered rows are held, so memory does not grow with the number of them.
+    :param df: dataframe or query backend
+    """
+    if not isinstance(df, pd.DataFrame):
+        yield from df.iter_filter(start_date, end_date, category, region, shipcountry, chunk_rows)
+        return
+    indexes = get_indexes(df)
+    if indexes is None:
+        df = filter_dataframe(df, start_date, end_date, category, region, shipcountry)
+        rows = range(len(df))
+    else:
+        rows = filtered_rows(df, indexes, start_date, end_date, category, region, shipcountry)
+        if isinstance(rows, slice):
+            rows = range(rows.start, rows.stop)
+    for start in range(0, max(len(rows), 1), chunk_rows):
+        positions = rows[start:start + chunk_rows]
+        if isinstance(positions, range):
+            positions = slice(positions.start, positions.stop)
+        yield decode_categoricals(df.iloc[positions])
+
+FilterKey = Tuple[Optional[str], Optional[str], Optional[Tuple[str, ...]],
+                  Optional[Tuple[str, ...]], Optional[Tuple[str, ...]]]
+
+def normalize_filter_key(start_date: Optional[str] = None, end_date: Optional[str] = None,
+                         category: Optional[List[str]] = None, region: Optional[List[str]] = None,
+                         shipcountry: Optional[List[str]] = None) -> FilterKey:
+    """
+    Returns hashable key describing the same filter as filter_dataframe arguments
+    Date range is applied only if both bounds are given, empty lists mean no filter.
+    :return: (start_date, end_date, category, region, shipcountry) tuple
+    """
+    if start_date is None or end_date is None:
+        start_date, end_date = None, None
+    def _values(values):
+        if values is None or len(values) == 0:
+            return None
+        return tuple(sorted(set(values)))
+    return (start_date, end_date, _values(category), _values(region), _values(shipcountry))
+
+def _is_superset_key(parent: FilterKey, child: FilterKey) -> bool:
+    """
+    Checks that rows of parent filter contain all rows of child filter,
+    i.e. every dimension of parent is either not filtered or equal to child one
+    """
+    if parent[:2] != (None, None) and parent[:2] != child[:2]:
+        return False
+    return all(p is None or p == c for p, c in zip(parent[2:], child[2:]))
+
+class FilterCache:
+    """
+    LRU cache of filter_dataframe results shared by dashboard callbacks
+    
+    Results are keyed by normalized filter key. On a miss the smallest cached
+    superset result (e.g. the one without category filter) is filtered further
+    instead of scanning the whole dataframe, indexed dataframes are filtered
+    directly through their indexes.
+    Returned dataframes are shared between callers and must not be modified inplace.
+    """
+    def __init__(self, max_entries: int = 64, max_bytes: int = 256 * 2**20):
+        """
+        :param max_entries: maximal number of cached results
+        :param max_bytes: memory ceiling for all cached results
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._nbytes = 0
+        self._source = None
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+
+    def filter(self, df: pd.DataFrame,
+               start_date: Optional[str] = None, end_date: Optional[str] = None, category: Optional[List[str]] = None,
+               region: Optional[List[str]] = None, shipcountry: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        Same as filter_dataframe but reuses results of previous calls on the same dataframe
+        """
+        key = normalize_filter_key(start_date, end_date, category, region, shipcountry)
+        with self._lock:
+            if self._source is None or self._source() is not df:
+                # dataframe was replaced, old results are stale
+                self._entries.clear()
+                self._nbytes = 0
+                self._source = weakref.ref(df)
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key][0]
+            parent_key, parent = None, df
+            # indexed dataframe is filtered in time proportional to selected rows,
+            # refining a cached superset is cheaper only for unindexed ones
+            indexed = get_indexes(df) is not None
+            for cached_key, (cached_df, _) in self._entries.items():
+                if not indexed and _is_superset_key(cached_key, key) and len(cached_df) < len(parent):
+                    parent_key, parent = cached_key, cached_df
+
+        if (not indexed and parent_key is None
+                and key[:2] != (None, None) and key[2:] != (None, None, None)):
+            # share the date range slice between callbacks with different dropdown filters
+            parent_key = key[:2] + (None, None, None)
+            parent = self.filter(df, *parent_key)
+        if parent_key is None:
+            result = filter_dataframe(df, *key)
+        else:
+            # apply only dimensions which are not filtered in parent result
+            residual = [None if p is not None else c for p, c in zip(parent_key, key)]
+            residual[:2] = key[:2] if parent_key[:2] == (None, None) else (None, None)
+            result = filter_dataframe(parent, *residual)
+
+        # object columns share values with source dataframe, so shallow size is what the entry costs
+        nbytes = int(result.memory_usage(index=True, deep=False).sum())
+        with self._lock:
+            if self._source() is df and key not in self._entries and nbytes <= self.max_bytes:
+                self._entries[key] = (result, nbytes)
+                self._nbytes += nbytes
+                while len(self._entries) > self.max_entries or self._nbytes > self.max_bytes:
+                    _, (_, evicted_nbytes) = self._entries.popitem(last=False)
+                    self._nbytes -= evicted_nbytes
+        return result
+
+FILTER_CACHE = FilterCache()
+
+def cached_filter_dataframe(df: pd.DataFrame,
+                            start_date: Optional[str] = None, end_date: Optional[str] = None, category: Optional[List[str]] = None,
+                            region: Optional[List[str]] = None, shipcountry: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Filters dataframe by given parameters using shared FILTER_CACHE
+    Result must not be modified inplace.
+    """
+    with METRICS.stage("filter", len(df)) as stage:
+        result = FILTER_CACHE.filter(df, start_date, end_date, category, region, shipcountry)
+        stage.rows(len(result))
+    return result
     
+def map_reduce(df: pd.DataFrame, by: List[str], period: Optional[str] = None,
+               start_date: Optional[str] = None, end_date: Optional[str] = None, category: Optional[List[str]] = None,
+               region: Optional[List[str]] = None, shipcountry: Optional[List[str]] = None) -> Optional[pd.DataFrame]:
+    """
+    Returns revenue sum, count and sum of squares per group of filtered order lines computed by MAP_REDUCE_ENGINE
+    :param df: indexed dataframe
+    :param period: day, week or month, orderdate labels are a group column then
+    :return: dataframe with columns by, orderdate if period, revenue, count, revenue_sq in arbitrary order,
+             None if engine is disabled or date range has too few rows for it
+    """
+    indexes = get_indexes(df)
+    if indexes is None or MAP_REDUCE_ENGINE.processes <= 1:
+        return None
+    if any(pd.api.types.is_numeric_dtype(df[column_name].dtype) for column_name in by):
+        # engine groups by codes of string and categorical columns
+        return None
+    start, stop = 0, len(df)
+    if start_date is not None and end_date is not None:
+        start, stop = indexes["orderdate"].positions(start_date, end_date)
+    if not MAP_REDUCE_ENGINE.accepts(stop - start):
+        return None
+    filters = {column_name: values for column_name, values in
+               (("categoryname", category), ("region", region), ("shipcountry", shipcountry))
+               if values is not None and len(values) != 0}
+    return MAP_REDUCE_ENGINE.aggregate(df, start, stop, by, period, filters)
+
+def unique_values(df: pd.DataFrame, column_name: str) -> np.ndarray:
+    """
+    Returns unique values of column
+    :param df: dataframe or query backend
+    """
+    if not isinstance(df, pd.DataFrame):
+        return df.unique(column_name)
+    return df[column_name].unique()
+
+def _fill_missing_weeks(weeks: pd.Series, freq: str = "7D") -> pd.DataFrame:
+    """
+    Adds zero revenue for weeks (or periods of freq) without orders between the first and the last one
+    """
+    if len(weeks) != 0:
+        weeks = weeks.reindex(pd.date_range(weeks.index[0], weeks.index[-1], freq=freq), fill_value=0.0)
+    return weeks.rename_axis("orderdate").reset_index()
+
+def weekly_revenue(df: pd.DataFrame,
+                   start_date: Optional[str] = None, end_date: Optional[str] = None, category: Optional[List[str]] = None,
+                   region: Optional[List[str]] = None, shipcountry: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Returns sum of revenue per week (W-MON) of filtered order lines, weeks without orders have zero revenue
+    :param df: dataframe or query backend
+    :return: dataframe with columns orderdate, revenue sorted by orderdate
+    """
+    if not isinstance(df, pd.DataFrame):
+        return _fill_missing_weeks(df.weekly_revenue(start_date, end_date, category, region, shipcountry))
+    indexes = get_indexes(df)
+    if indexes is None:
+        filtered_df = cached_filter_dataframe(df, start_date, end_date, category, region, shipcountry)
+        if len(filtered_df) == 0:
+            return pd.DataFrame({"orderdate": pd.Series(dtype="datetime64[ns]"), "revenue": pd.Series(dtype=np.float64)})
+        return filtered_df[['orderdate', 'revenue']].resample('W-MON', on='orderdate').sum().reset_index().sort_values('orderdate')
+    weeks = indexes["weekly_cube"].rollup(df, start_date, end_date, category, region, shipcountry)
+    return _fill_missing_weeks(weeks.set_index("orderdate")["revenue"])
+
+# periods of revenue time series and their pandas frequencies, periods are labeled
+# as in weekly_revenue: week by its closing monday, month by its first day
+PERIODS = {"day": "D", "week": "W-MON", "month": "MS"}
+PERIOD_DAYS = {"day": 1, "week": 7, "month": 30.44}
+
+def revenue_per_period(df: pd.DataFrame, period: str = "week",
+                       start_date: Optional[str] = None, end_date: Optional[str] = None, category: Optional[List[str]] = None,
+                       region: Optional[List[str]] = None, shipcountry: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Returns sum of revenue per day, week or month of filtered order lines, periods without orders have zero revenue
+    Weeks are rolled up from weekly cube, days and months are resampled from filtered order lines.
+    :param df: dataframe or query backend
+    :param period: one of PERIODS
+    :return: dataframe with columns orderdate, revenue sorted by orderdate
+    """
+    if period == "week":
+        return weekly_revenue(df, start_date, end_date, category, region, shipcountry)
+    if period not in PERIODS:
+        raise ValueError(f"unknown period '{period}', expected one of {list(PERIODS)}")
+    if not isinstance(df, pd.DataFrame):
+        return _fill_missing_weeks(df.revenue_per_period(period, start_date, end_date, category, region, shipcountry),
+                                   PERIODS[period])
+    periods = map_reduce(df, [], period, start_date, end_date, category, region, shipcountry)
+    if periods is not None:
+        return _fill_missing_weeks(periods.set_index("orderdate")["revenue"].sort_index(), PERIODS[period])
+    filtered_df = cached_filter_dataframe(df, start_date, end_date, category, region, shipcountry)
+    if len(filtered_df) == 0:
+        return pd.DataFrame({"orderdate": pd.Series(dtype="datetime64[ns]"), "revenue": pd.Series(dtype=np.float64)})
+    return filtered_df[['orderdate', 'revenue']].resample(PERIODS[period], on='orderdate').sum().reset_index()
+
+def order_date_range(df: pd.DataFrame) -> Tuple[Optional[pd.Timestamp], Optional[pd.Timestamp]]:
+    """
+    Returns the first and the last order date or (None, None) if there are no orders
+    :param df: dataframe or query backend
+    """
+    if not isinstance(df, pd.DataFrame):
+        return df.order_date_range()
+    if len(df) == 0:
+        return None, None
+    indexes = get_indexes(df)
+    if indexes is None:
+        return df["orderdate"].min(), df["orderdate"].max()
+    keys = indexes["orderdate"].keys
+    return pd.Timestamp(int(keys[0])), pd.Timestamp(int(keys[-1]))
+
+def choose_period(df: pd.DataFrame, start_date: Optional[str] = None, end_date: Optional[str] = None,
+                  max_points: int = 1000) -> str:
+    """
+    Returns the finest of day, week and month with at most max_points periods in date range
+    Month is returned if all of them have more periods.
+    :param df: dataframe or query backend, its date range is used if start_date or end_date is None
+    """
+    if start_date is None or end_date is None:
+        start_date, end_date = order_date_range(df)
+        if start_date is None:
+            return "week"
+    days = (parse_date(end_date) - parse_date(start_date)) / (24 * 3600 * 10**9) + 1
+    for period in ("day", "week"):
+        if days / PERIOD_DAYS[period] <= max_points:
+            return period
+    return "month"
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Returns positions of points kept by Largest-Triangle-Three-Buckets downsampling
+    The first and the last points are kept, points between them are split into n_out - 2
+    buckets and from each bucket the point forming the largest triangle with the point
+    kept from the previous bucket and the mean of the next bucket is kept.
+    :param x: increasing coordinates of points
+    :return: sorted positions, all positions if there are no more than n_out points
+    """
+    n = len(x)
+    if n <= n_out or n_out < 3:
+        return np.arange(n)
+    x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    counts = np.diff(edges)
+    # means of buckets, the last bucket is followed by the last point
+    next_x = np.append(np.add.reduceat(x[:n - 1], edges[:-1])[1:] / counts[1:], x[-1])
+    next_y = np.append(np.add.reduceat(y[:n - 1], edges[:-1])[1:] / counts[1:], y[-1])
+    kept = np.empty(n_out, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(n_out - 2):
+        start, stop = edges[bucket], edges[bucket + 1]
+        area = np.abs((x[previous] - next_x[bucket]) * (y[start:stop] - y[previous])
+                      - (x[previous] - x[start:stop]) * (next_y[bucket] - y[previous]))
+        previous = start + int(np.argmax(area))
+        kept[bucket + 1] = previous
+    return kept
+
+def weekly_mean_revenue_by_region(df: pd.DataFrame,
+                                  start_date: Optional[str] = None, end_date: Optional[str] = None,
+                                  category: Optional[List[str]] = None,
+                                  shipcountry: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Returns mean revenue of order line per week (W-MON) for each region of filtered order lines
+    :param df: dataframe or query backend
+    :return: dataframe with columns region, orderdate, revenue sorted by orderdate
+    """
+    if not isinstance(df, pd.DataFrame):
+        return df.weekly_mean_revenue_by_region(start_date, end_date, category, shipcountry).sort_values("orderdate")
+    indexes = get_indexes(df)
+    if indexes is None:
+        filtered_df = cached_filter_dataframe(df, start_date, end_date, category, None, shipcountry)
+        filtered_df = filtered_df[['orderdate', 'revenue', 'region']].groupby(['region', pd.Grouper(key='orderdate', freq='W-MON')], observed=True).mean().reset_index().sort_values('orderdate')
+        return decode_categoricals(filtered_df)
+    weeks = indexes["weekly_cube"].rollup(df, start_date, end_date, category, None, shipcountry, by=["region"])
+    weeks["revenue"] = weeks["revenue"] / weeks["count"]
+    return decode_categoricals(weeks[["region", "orderdate", "revenue"]].sort_values("orderdate"))
+
+def weekly_revenue_cube(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Returns revenue sum and count of order lines per week (W-MON), category, region and ship country
+    :param df: dataframe or query backend
+    :return: dataframe with columns categoryname, region, shipcountry, orderdate, revenue, count
+    """
+    columns = WeeklyCube.dimensions + ["orderdate", "revenue", "count"]
+    if not isinstance(df, pd.DataFrame):
+        return df.weekly_revenue_cube()[columns]
+    indexes = get_indexes(df)
+    cells = WeeklyCube._aggregate_lines(df, WeeklyCube.dimensions) if indexes is None else indexes["weekly_cube"].cells
+    return decode_categoricals(cells[columns])
+
+def box_statistics(df: pd.DataFrame, by: str, column: str = 'revenue') -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Returns statistics of box plot of column for each group computed as plotly.js does
+    Quartiles are interpolated as quartilemethod='linear' of plotly (numpy method 'hazen'),
+    fences are the most extreme values within 1.5 IQR from quartiles, values outside
+    of fences are outliers. All groups are computed at once on values sorted by group.
+    :param by: column with groups
+    :return: dataframe with columns by, q1, median, q3, lowerfence, upperfence in order of
+             appearance of groups and dataframe of outliers with columns by, column
+    """
+    df = df.loc[df[column].notna(), [by, column]]
+    codes, groups = pd.factorize(df[by])
+    values = df[column].to_numpy(dtype=np.float64)
+    order = np.lexsort((values, codes))
+    values, codes = values[order], codes[order]
+    counts = np.bincount(codes, minlength=len(groups))
+    starts = np.cumsum(counts) - counts
+
+    def quantile(q: float) -> np.ndarray:
+        position = np.clip(q * counts - 0.5, 0, counts - 1)
+        low = np.floor(position).astype(np.int64)
+        high = np.minimum(low + 1, counts - 1)
+        fraction = position - low
+        return values[starts + low] * (1 - fraction) + values[starts + high] * fraction
+
+    q1, median, q3 = quantile(0.25), quantile(0.5), quantile(0.75)
+    # values are sorted in groups, so number of values below bound is position of first value above it
+    below = np.bincount(codes, weights=values < (2.5 * q1 - 1.5 * q3)[codes], minlength=len(groups)).astype(np.int64)
+    not_above = np.bincount(codes, weights=values <= (2.5 * q3 - 1.5 * q1)[codes], minlength=len(groups)).astype(np.int64)
+    lowerfence = np.minimum(q1, values[starts + np.minimum(below, counts - 1)])
+    upperfence = np.maximum(q3, values[starts + np.maximum(not_above - 1, 0)])
+    stats = pd.DataFrame({by: groups, 'q1': q1, 'median': median, 'q3': q3,
+                          'lowerfence': lowerfence, 'upperfence': upperfence})
+    is_outlier = (values < lowerfence[codes]) | (values > upperfence[codes])
+    outliers = pd.DataFrame({by: groups.take(codes[is_outlier]), column: values[is_outlier]})
+    return stats, outliers
+
+def revenue_by(df: pd.DataFrame, by: List[str],
+               start_date: Optional[str] = None, end_date: Optional[str] = None, category: Optional[List[str]] = None,
+               region: Optional[List[str]] = None, shipcountry: Optional[List[str]] = None,
+               limit: Optional[int] = None, sort: bool = True) -> pd.DataFrame:
+    """
+    Returns sum of revenue of filtered order lines grouped by columns
+    :param df: dataframe or query backend
+    :param by: columns to group by
+    :param limit: number of top rows to return, all rows if None
+    :param sort: sort rows by revenue, rows are in arbitrary order if False and limit is None
+    :return: dataframe with columns by + [revenue] sorted by revenue descending
+    """
+    if not isinstance(df, pd.DataFrame):
+        return df.revenue_by(by, start_date, end_date, category, region, shipcountry, limit, sort)
+    indexes = get_indexes(df)
+    prefix_sums = [] if indexes is None else [index for index in indexes["prefix_sums"]
+                                              if index.covers(by, start_date, end_date, category, region, shipcountry)]
+    if len(prefix_sums) != 0:
+        # the index with the fewest cells
+        index = min(prefix_sums, key=lambda index: len(index.main.cells))
+        filtered_df = index.revenue_by(by, start_date, end_date, category, region, shipcountry)
+    else:
+        filtered_df = map_reduce(df, by, None, start_date, end_date, category, region, shipcountry)
+        if filtered_df is not None:
+            filtered_df = filtered_df[by + ['revenue']]
+        else:
+            filtered_df = cached_filter_dataframe(df, start_date, end_date, category, region, shipcountry)
+            filtered_df = filtered_df.groupby(by, observed=True, sort=False).agg({'revenue': 'sum'}).reset_index()
+    # index, map reduce and scan give the same values
+    filtered_df['revenue'] = round_cents(filtered_df['revenue'])
+    filtered_df = decode_categoricals(filtered_df)
+    if limit is not None:
+        filtered_df = select_page(filtered_df, 'revenue', ascending=False, page_size=limit)
+    elif sort:
+        filtered_df = filtered_df.sort_values('revenue', ascending=False)
+    return filtered_df
+
+def select_page(df: pd.DataFrame, column: str, ascending: bool = True,
+                page_current: int = 0, page_size: Optional[int] = None) -> pd.DataFrame:
+    """
+    Returns rows of one page of dataframe sorted by column
+    Rows up to the end of the page are found with np.argpartition and only they are
+    sorted, the rest of dataframe is not ordered. Ties are in order of rows.
+    :param column: column to sort by, strings are compared as in sort_values
+    :param page_current: number of page starting from 0
+    :param page_size: number of rows on page, the whole dataframe is one page if None
+    """
+    stop = len(df) if page_size is None else min(len(df), (page_current + 1) * page_size)
+    start = min(stop, page_current * page_size) if page_size is not None else 0
+    if stop == 0:
+        return df.iloc[:0]
+    keys = df[column].to_numpy()
+    if not pd.api.types.is_numeric_dtype(keys.dtype):
+        # ranks of strings, so that descending order is negation as for numbers
+        keys = pd.factorize(keys, sort=True)[0]
+    if not ascending:
+        keys = -keys
+    if stop < len(keys):
+        positions = np.argpartition(keys, stop - 1)[:stop]
+        # ties with the last row of page may be left out by argpartition, take them in order of rows
+        positions = np.concatenate((positions[keys[positions] < keys[positions].max()],
+                                    np.flatnonzero(keys == keys[positions].max())))[:stop]
+    else:
+        positions = np.arange(len(keys))
+    positions = np.sort(positions)
+    positions = positions[np.argsort(keys[positions], kind='stable')]
+    return df.iloc[positions[start:stop]]
+
+class OrdersLoader:
+    """
+    Keeps indexed order dataframe up to date with database without reloading it
+    
+    High-water marks are the last loaded orderid and orderdate. Refresh loads orders
+    with greater orderid and all orders since the last orderdate (they could have
+    been added or changed since the previous load), replaces the tail of the dataframe
+    with them and updates indexes incrementally. Orders changed before the last
+    orderdate are not detected.
+    """
+    def __init__(self, path: str = PATH, compact: bool = False):
+        """
+        :param path: path to northwind database
+        :param compact: use compact_schema
+        """
+        self.path = path
+        self.compact = compact
+        self.df = get_dataframe(path, compact=compact)
+        self._lock = threading.Lock()
+        # guards timer and stopped flag, refresh holds _lock for the whole load
+        self._timer_lock = threading.Lock()
+        self._timer = None
+        self._stopped = True
+
+    def refresh(self) -> int:
+        """
+        Loads new orders, callers holding the previous dataframe are not affected
+        :return: change of number of order lines
+        """
+        with self._lock:
+            df = self.df
+            if len(df) == 0:
+                self.df = get_dataframe(self.path, compact=self.compact)
+                return len(self.df)
+            last_orderdate = df["orderdate"].iloc[-1]
+            tail = read_orders(get_pool(self.path).connection(), "where orders.orderid > ? or orders.orderdate >= ?",
+                               (int(df["orderid"].max()), sql_date(last_orderdate)))
+            tail = tail.sort_values("orderdate", kind="stable", ignore_index=True)
+            if self.compact:
+                tail = compact_schema(tail)
+            start = int(np.searchsorted(get_indexes(df)["orderdate"].keys, parse_date(last_orderdate), "left"))
+            if len(tail) != 0 and tail["orderdate"].iloc[0] < last_orderdate:
+                # orders were added in the past, rows have to be sorted again
+                result = concat_orders(df.iloc[:start], tail)
+                result = result.sort_values("orderdate", kind="stable", ignore_index=True)
+                build_indexes(result)
+            else:
+                result = replace_tail(df, start, tail)
+            self.df = result
+            return len(result) - len(df)
+
+    def start(self, interval: float):
+        """
+        Refreshes dataframe every interval seconds in a daemon thread
+        Failed refresh (e.g. database is locked by writer) is reported and retried on the next interval.
+        """
+        with self._timer_lock:
+            self._stopped = False
+            self._schedule(interval)
+
+    def _schedule(self, interval: float):
+        self._timer = threading.Timer(interval, self._run, (interval,))
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _run(self, interval: float):
+        try:
+            self.refresh()
+        except Exception as error:
+            warnings.warn(f"orders of {self.path} were not refreshed: {error}")
+        finally:
+            with self._timer_lock:
+                # refresh running while stop() was called does not schedule the next one
+                if not self._stopped:
+                    self._schedule(interval)
+
+    def stop(self):
+        with self._timer_lock:
+            self._stopped = True
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
 def anomaly_detection(df: pd.DataFrame, 
-                      contamination: float = 0.07) -> pd.DataFrame:
+                      contamination: float = 0.07, random_state: Optional[int] = 0) -> pd.DataFrame:
     """
     Returns dataframe with anomaly column
     
     :param df: dataframe to detect anomalies
     :param contamination: contamination parameter for IsolationForest
+    :param random_state: seed of IsolationForest, fixed for reproducible anomalies
     :return: dataframe with anomaly column
     """
+    from sklearn.ensemble import IsolationForest
     df = df.copy()
-    df["anomaly"] = IsolationForest(contamination=contamination).fit_predict(df[["revenue"]])
+    df["anomaly"] = IsolationForest(contamination=contamination, random_state=random_state).fit_predict(df[["revenue"]])
     return df
\ No newline at end of file
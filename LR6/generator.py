@@ -0,0 +1,199 @@
+"""Synthetic Northwind databases of any number of order lines for benchmarks"""
+
+import argparse
+import os
+import sqlite3
+import numpy as np
+import pandas as pd
+from contextlib import closing
+from typing import Tuple
+
+from funcs import PATH
+
+# named sizes of generated databases, number of order lines
+SIZES = {"10k": 10_000, "1m": 1_000_000, "10m": 10_000_000}
+
+# relative number of orders per weekday, monday first
+WEEKDAY_WEIGHTS = np.array([1.1, 1.05, 1.0, 1.0, 1.1, 0.6, 0.4])
+DISCOUNTS = np.array([0.0, 0.05, 0.1, 0.15, 0.2, 0.25])
+DISCOUNT_WEIGHTS = np.array([0.6, 0.1, 0.1, 0.08, 0.07, 0.05])
+LINES_PER_ORDER = 2.6
+# tables with synthetic rows, other tables are copied from source database
+GENERATED_TABLES = ["Order Details", "Orders"]
+INSERT_CHUNK = 500_000
+
+def zipf_weights(rng: np.random.Generator, n: int, exponent: float) -> np.ndarray:
+    """
+    Returns probabilities of n items proportional to rank^-exponent, ranks are shuffled
+    """
+    weights = np.arange(1, n + 1, dtype=np.float64) ** -exponent
+    return rng.permutation(weights / weights.sum())
+
+def day_weights(rng: np.random.Generator, days: np.ndarray, growth: float = 1.0,
+                promo_share: float = 0.01) -> np.ndarray:
+    """
+    Returns probabilities of order dates: yearly trend, december peak, quiet weekends and rare promo days
+    :param days: datetime64[D] dates
+    :param growth: relative growth of orders per day over the whole range
+    :param promo_share: share of days with three times more orders, they are anomalous weeks of revenue plot
+    """
+    t = np.linspace(0, 1, len(days))
+    day_of_year = (days - days.astype("datetime64[Y]")).astype(np.int64)
+    weekday = (days.astype(np.int64) + 3) % 7  # 1970-01-01 is thursday
+    weights = (1 + growth * t) * (1 + 0.3 * np.cos(2 * np.pi * (day_of_year - 350) / 365)) * WEEKDAY_WEIGHTS[weekday]
+    weights[rng.random(len(days)) < promo_share] *= 3
+    return weights / weights.sum()
+
+def generate_customers(rng: np.random.Generator, customers: pd.DataFrame, orders: pd.DataFrame,
+                       n_customers: int) -> pd.DataFrame:
+    """
+    Returns customers of source database and synthetic copies of them up to n_customers
+    Copies keep country and address of the customer they are made from, customers with
+    more orders in source database are copied more often, so countries keep their skew.
+    """
+    n_extra = n_customers - len(customers)
+    if n_extra <= 0:
+        return customers
+    counts = orders["CustomerID"].value_counts().reindex(customers["CustomerID"], fill_value=0).to_numpy() + 1
+    extra = customers.iloc[rng.choice(len(customers), n_extra, p=counts / counts.sum())].reset_index(drop=True)
+    numbers = pd.Series(np.arange(1, n_extra + 1)).astype(str).str.zfill(7)
+    extra["CustomerID"] = "C" + numbers
+    extra["CompanyName"] = extra["CompanyName"] + " #" + numbers
+    return pd.concat([customers, extra], ignore_index=True)
+
+def generate_lines(rng: np.random.Generator, n_lines: int, product_weights: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns order numbers and product positions of n_lines order lines, sorted by order number
+    Products of an order are distinct as (OrderID, ProductID) is the key of order details.
+    """
+    n_products = len(product_weights)
+    orders, products = [], []
+    n_orders = 0
+    remaining = n_lines
+    while remaining > 0:
+        sizes = np.minimum(1 + rng.poisson(LINES_PER_ORDER - 1, max(int(remaining / LINES_PER_ORDER), 1)), n_products)
+        line_orders = np.repeat(np.arange(n_orders, n_orders + len(sizes)), sizes)
+        keys = np.unique(line_orders * n_products + rng.choice(n_products, len(line_orders), p=product_weights))
+        keys = keys[:remaining]
+        orders.append(keys // n_products)
+        products.append(keys % n_products)
+        n_orders = int(orders[-1][-1]) + 1
+        remaining -= len(keys)
+    return np.concatenate(orders), np.concatenate(products)
+
+def generate_orders(source_path: str, n_lines: int, seed: int = 0, start_date: str = "2016-01-01",
+                    years: int = 3) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """
+    Returns customers, orders and order details of n_lines synthetic order lines
+    Products, suppliers, categories and employees are those of source database.
+    Customers, products and countries are zipf skewed, order dates follow day_weights.
+    :param source_path: path to northwind database
+    :param start_date: date of the first order
+    :param years: length of order date range in years
+    """
+    rng = np.random.default_rng(seed)
+    with closing(sqlite3.connect(source_path)) as con:
+        customers = pd.read_sql('SELECT * FROM Customers ORDER BY CustomerID', con)
+        source_orders = pd.read_sql('SELECT CustomerID FROM Orders', con)
+        products = pd.read_sql('SELECT ProductID, UnitPrice FROM Products ORDER BY ProductID', con)
+        employees = pd.read_sql('SELECT EmployeeID FROM Employees ORDER BY EmployeeID', con)["EmployeeID"].to_numpy()
+        shippers = pd.read_sql('SELECT ShipperID FROM Shippers ORDER BY ShipperID', con)["ShipperID"].to_numpy()
+
+    customers = generate_customers(rng, customers, source_orders, max(len(customers), n_lines // 100))
+    line_orders, line_products = generate_lines(rng, n_lines, zipf_weights(rng, len(products), 0.8))
+    n_orders = int(line_orders[-1]) + 1 if len(line_orders) else 0
+
+    start = np.datetime64(start_date, "D")
+    days = np.arange(start, np.datetime64(pd.Timestamp(start_date) + pd.DateOffset(years=years), "D"))
+    order_dates = np.sort(rng.choice(days, n_orders, p=day_weights(rng, days)))
+    order_customers = customers.iloc[rng.choice(len(customers), n_orders, p=zipf_weights(rng, len(customers), 1.1))]
+    orders = pd.DataFrame({
+        "OrderID": np.arange(1, n_orders + 1),
+        "CustomerID": order_customers["CustomerID"].to_numpy(),
+        "EmployeeID": rng.choice(employees, n_orders, p=zipf_weights(rng, len(employees), 0.5)),
+        "OrderDate": order_dates.astype(str),
+        "RequiredDate": (order_dates + 28).astype(str),
+        "ShippedDate": (order_dates + rng.integers(1, 15, n_orders)).astype(str),
+        "ShipVia": rng.choice(shippers, n_orders),
+        "Freight": np.round(rng.lognormal(3, 1, n_orders), 2),
+        "ShipName": order_customers["CompanyName"].to_numpy(),
+        "ShipAddress": order_customers["Address"].to_numpy(),
+        "ShipCity": order_customers["City"].to_numpy(),
+        "ShipRegion": order_customers["Region"].to_numpy(),
+        "ShipPostalCode": order_customers["PostalCode"].to_numpy(),
+        "ShipCountry": order_customers["Country"].to_numpy(),
+    })
+    details = pd.DataFrame({
+        "OrderID": line_orders + 1,
+        "ProductID": products["ProductID"].to_numpy()[line_products],
+        "UnitPrice": products["UnitPrice"].to_numpy(dtype=np.float64)[line_products],
+        "Quantity": 1 + np.round(rng.gamma(2, 12, n_lines)).astype(np.int64),
+        "Discount": rng.choice(DISCOUNTS, n_lines, p=DISCOUNT_WEIGHTS),
+    })
+    return customers, orders, details
+
+def insert_rows(con: sqlite3.Connection, table: str, df: pd.DataFrame):
+    """
+    Inserts rows of dataframe into table by chunks, columns are in table order
+    """
+    statement = f'INSERT INTO [{table}] VALUES ({", ".join("?" * len(df.columns))})'
+    for start in range(0, len(df), INSERT_CHUNK):
+        chunk = df.iloc[start:start + INSERT_CHUNK]
+        con.executemany(statement, zip(*(chunk[column_name].tolist() for column_name in df.columns)))
+
+def generate_database(path: str, n_lines: int, source_path: str = PATH, seed: int = 0,
+                      start_date: str = "2016-01-01", years: int = 3) -> str:
+    """
+    Writes Northwind database with n_lines synthetic order lines, see generate_orders
+    Schema, views and other tables are copied from source database.
+    :param path: path to new database, existing file is replaced
+    :return: path
+    """
+    customers, orders, details = generate_orders(source_path, n_lines, seed, start_date, years)
+    if os.path.exists(path):
+        os.remove(path)
+    with closing(sqlite3.connect(source_path)) as source, closing(sqlite3.connect(path)) as con:
+        source.backup(con)
+    with closing(sqlite3.connect(path)) as con:
+        con.execute("PRAGMA journal_mode=OFF")
+        con.execute("PRAGMA synchronous=OFF")
+        with con:
+            # indexes are created again after rows are inserted, it is faster than updating them
+            indexes = con.execute("SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL "
+                                  "AND tbl_name IN ('Orders', 'Order Details', 'Customers')").fetchall()
+            for name, _ in indexes:
+                con.execute(f"DROP INDEX [{name}]")
+            for table in GENERATED_TABLES + ["Customers"]:
+                con.execute(f"DELETE FROM [{table}]")
+            insert_rows(con, "Customers", customers)
+            insert_rows(con, "Orders", orders)
+            insert_rows(con, "Order Details", details)
+            for _, statement in indexes:
+                con.execute(statement)
+        con.execute("VACUUM")
+    return path
+
+def database_path(size: str, directory: str = ".benchmark_data", seed: int = 0) -> str:
+    """
+    Returns path of generated database of named size, it is generated if it does not exist
+    :param size: one of SIZES or number of order lines
+    """
+    n_lines = SIZES[size] if size in SIZES else int(size)
+    path = os.path.join(directory, f"northwind.{n_lines}.{seed}.db")
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        generate_database(path + ".tmp", n_lines, seed=seed)
+        os.replace(path + ".tmp", path)
+    return path
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("size", help=f"number of order lines or one of {list(SIZES)}")
+    parser.add_argument("--output", help="path to database, northwind.<lines>.db by default")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--start-date", default="2016-01-01")
+    parser.add_argument("--years", type=int, default=3)
+    args = parser.parse_args()
+    n_lines = SIZES[args.size] if args.size in SIZES else int(args.size)
+    print(generate_database(args.output or f"northwind.{n_lines}.db", n_lines, seed=args.seed,
+                            start_date=args.start_date, years=args.years))
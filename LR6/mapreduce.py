@@ -0,0 +1,287 @@
+"""Map-reduce aggregation of order lines by a pool of processes over shared memory"""
+
+import atexit
+import threading
+import weakref
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Optional, List, Dict, Tuple
+
+DAY_NS = 24 * 3600 * 10**9
+WEEK_NS = 7 * DAY_NS
+MONDAY_NS = np.datetime64("1970-01-05", "ns").astype(np.int64)
+
+def week_labels(dates_ns: np.ndarray) -> np.ndarray:
+    """
+    Returns W-MON week labels of int64 nanosecond dates as resample does:
+    week labelled by monday L contains dates in (L - 7 days, L]
+    """
+    return MONDAY_NS - ((MONDAY_NS - dates_ns) // WEEK_NS) * WEEK_NS
+
+def period_labels(dates_ns: np.ndarray, period: str) -> np.ndarray:
+    """
+    Returns int64 nanosecond labels of day, week or month of dates as resample with PERIODS frequencies
+    """
+    if period == "day":
+        return dates_ns - dates_ns % DAY_NS
+    if period == "week":
+        return week_labels(dates_ns)
+    if period == "month":
+        return dates_ns.view("datetime64[ns]").astype("datetime64[M]").astype("datetime64[ns]").view(np.int64)
+    raise ValueError(f"unknown period '{period}'")
+
+# (shared memory name, dtype, length) of column
+ColumnSpec = Tuple[str, str, int]
+
+def aggregate_rows(columns: Dict[str, np.ndarray], by: List[str], period: Optional[str] = None,
+                   filters: Optional[Dict[str, np.ndarray]] = None) -> pd.DataFrame:
+    """
+    Returns partial aggregate of rows: sum, count and sum of squares of revenue per group
+    Partial aggregates of disjoint rows are merged by summing them per group.
+    :param columns: orderdate as int64 nanoseconds, revenue and integer codes of other columns
+    :param by: columns with codes to group by, rows with missing value (code -1) are dropped as by groupby
+    :param period: one of period_labels periods, orderdate label is a group column then
+    :param filters: allowed codes of columns as boolean lookup table, its last item is for code -1
+    :return: dataframe with columns by (codes), orderdate (labels) if period, revenue, count, revenue_sq
+    """
+    mask = None
+    for column_name, allowed in (filters or {}).items():
+        column_mask = allowed[columns[column_name]]
+        mask = column_mask if mask is None else mask & column_mask
+    for column_name in by:
+        column_mask = columns[column_name] >= 0
+        mask = column_mask if mask is None else mask & column_mask
+    def _values(column_name):
+        return columns[column_name] if mask is None else columns[column_name][mask]
+    keys = {column_name: _values(column_name) for column_name in by}
+    if period is not None:
+        keys["orderdate"] = period_labels(_values("orderdate"), period)
+    revenue = _values("revenue").astype(np.float64)
+    if len(keys) == 0:
+        return pd.DataFrame({"revenue": [revenue.sum()], "count": [len(revenue)], "revenue_sq": [revenue @ revenue]})
+    lines = pd.DataFrame({**keys, "revenue": revenue, "revenue_sq": revenue**2})
+    return lines.groupby(list(keys), sort=False).agg(
+        revenue=("revenue", "sum"), count=("revenue", "size"), revenue_sq=("revenue_sq", "sum")).reset_index()
+
+# shared memory blocks attached by worker process, least recently used ones are closed
+_ATTACHED = OrderedDict()
+MAX_ATTACHED = 32
+
+def _close(block: shared_memory.SharedMemory):
+    try:
+        block.close()
+    except BufferError:
+        # arrays of block are still used, it is unmapped when they are released
+        pass
+
+def _attach(spec: ColumnSpec) -> np.ndarray:
+    name, dtype, length = spec
+    if name in _ATTACHED:
+        _ATTACHED.move_to_end(name)
+    else:
+        block = shared_memory.SharedMemory(name)
+        _ATTACHED[name] = (block, np.ndarray(length, dtype=dtype, buffer=block.buf))
+        while len(_ATTACHED) > MAX_ATTACHED:
+            _close(_ATTACHED.popitem(last=False)[1][0])
+    return _ATTACHED[name][1]
+
+def aggregate_partition(specs: Dict[str, ColumnSpec], start: int, stop: int, by: List[str],
+                        period: Optional[str], filters: Dict[str, np.ndarray]) -> pd.DataFrame:
+    """
+    Returns aggregate_rows of rows [start, stop) of shared columns, runs in worker process
+    """
+    columns = {column_name: _attach(spec)[start:stop] for column_name, spec in specs.items()}
+    return aggregate_rows(columns, by, period, filters)
+
+class SharedColumns:
+    """
+    Columns of dataframe copied into shared memory, workers attach them by name
+    Datetime columns are stored as int64 nanoseconds, string and categorical
+    columns as integer codes with their categories kept here.
+    """
+    def __init__(self, df: pd.DataFrame):
+        """
+        :param df: dataframe, its columns are copied on first use
+        """
+        self._df = weakref.ref(df)
+        self.length = len(df)
+        self.blocks = {}
+        self.specs = {}
+        self.arrays = {}
+        self.categories = {}
+        self._lock = threading.Lock()
+
+    def column(self, column_name: str) -> ColumnSpec:
+        """
+        Returns spec of shared column, column is copied if it is not shared yet
+        """
+        with self._lock:
+            if column_name not in self.specs:
+                self._share(column_name, self._df()[column_name])
+            return self.specs[column_name]
+
+    def _share(self, column_name: str, column: pd.Series):
+        if pd.api.types.is_datetime64_dtype(column.dtype):
+            values = column.to_numpy(dtype="datetime64[ns]").view(np.int64)
+        elif isinstance(column.dtype, pd.CategoricalDtype):
+            values = column.cat.codes.to_numpy()
+            self.categories[column_name] = column.cat.categories
+        elif pd.api.types.is_numeric_dtype(column.dtype):
+            values = column.to_numpy()
+        else:
+            values, self.categories[column_name] = pd.factorize(column)
+            values = values.astype(np.int32)
+        block = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+        array = np.ndarray(len(values), dtype=values.dtype, buffer=block.buf)
+        array[:] = values
+        self.blocks[column_name] = block
+        self.arrays[column_name] = array
+        self.specs[column_name] = (block.name, values.dtype.str, len(values))
+
+    def allowed(self, column_name: str, values: List[str]) -> np.ndarray:
+        """
+        Returns boolean lookup table of codes of column with values, see aggregate_rows
+        """
+        self.column(column_name)
+        categories = self.categories[column_name]
+        allowed = np.zeros(len(categories) + 1, dtype=bool)
+        codes = categories.get_indexer(list(set(values)))
+        allowed[codes[codes >= 0]] = True
+        return allowed
+
+    def close(self):
+        """
+        Releases shared memory, workers keep attached blocks until they close them
+        """
+        with self._lock:
+            self.arrays.clear()
+            for block in self.blocks.values():
+                _close(block)
+                block.unlink()
+            self.blocks.clear()
+            self.specs.clear()
+
+class MapReduceEngine:
+    """
+    Aggregation of order lines split into date range partitions and computed by a process pool
+    Dataframe must be sorted by orderdate, so consecutive rows are date ranges. Its columns
+    are copied to shared memory once per dataframe, workers aggregate their partitions
+    into partial sums, counts and sums of squares, which are merged here. Callers use
+    accepts() to keep small inputs in process, where pandas is faster than the round trip.
+    """
+    def __init__(self, processes: int = 1, min_rows: int = 500_000, partitions_per_process: int = 2):
+        """
+        :param processes: number of worker processes, 1 disables the pool
+        :param min_rows: minimal number of rows aggregated by the pool
+        :param partitions_per_process: partitions of rows per process, more of them even out slow workers
+        """
+        self.processes = processes
+        self.min_rows = min_rows
+        self.partitions_per_process = partitions_per_process
+        self._pool = None
+        # shared columns of dataframes, keyed by id of dataframe
+        self._shared = {}
+        self._lock = threading.Lock()
+
+    def start(self, processes: int):
+        """
+        Sets number of worker processes, the pool itself is started on first use
+        """
+        self.shutdown()
+        self.processes = processes
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(cancel_futures=True)
+                self._pool = None
+
+    def accepts(self, n_rows: int) -> bool:
+        """
+        Checks that n_rows rows are worth aggregating by the pool
+        """
+        return self.processes > 1 and n_rows >= self.min_rows
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # workers are forked as jobs of background callbacks, so the main module of
+                # server is not imported again, they read dataframes only from shared memory
+                self._pool = ProcessPoolExecutor(self.processes)
+            return self._pool
+
+    def shared_columns(self, df: pd.DataFrame) -> SharedColumns:
+        """
+        Returns shared columns of dataframe, they are released together with dataframe
+        """
+        key = id(df)
+        with self._lock:
+            entry = self._shared.get(key)
+            if entry is None or entry[0]() is not df:
+                shared = SharedColumns(df)
+                weakref.finalize(df, self._release, key, shared)
+                entry = self._shared[key] = (weakref.ref(df), shared)
+            return entry[1]
+
+    def _release(self, key: int, shared: SharedColumns):
+        shared.close()
+        with self._lock:
+            if key in self._shared and self._shared[key][1] is shared:
+                del self._shared[key]
+
+    def partitions(self, start: int, stop: int) -> List[Tuple[int, int]]:
+        """
+        Returns [start, stop) ranges of rows of partitions
+        """
+        edges = np.linspace(start, stop, max(self.processes, 1) * self.partitions_per_process + 1).astype(np.int64)
+        return [(int(left), int(right)) for left, right in zip(edges[:-1], edges[1:]) if left < right]
+
+    def aggregate(self, df: pd.DataFrame, start: int, stop: int, by: List[str], period: Optional[str] = None,
+                  filters: Optional[Dict[str, List[str]]] = None) -> pd.DataFrame:
+        """
+        Returns sum, count and sum of squares of revenue per group of rows [start, stop) of dataframe
+        :param df: dataframe sorted by orderdate
+        :param by: string or categorical columns to group by
+        :param period: day, week or month, orderdate labels are a group column then
+        :param filters: allowed values of columns, rows with other values are skipped
+        :return: dataframe with columns by, orderdate if period, revenue, count, revenue_sq,
+                 groups are in arbitrary order
+        """
+        shared = self.shared_columns(df)
+        for column_name in by:
+            shared.column(column_name)
+            if column_name not in shared.categories:
+                raise ValueError(f"column '{column_name}' is not string or categorical")
+        filters = {column_name: shared.allowed(column_name, values) for column_name, values in (filters or {}).items()}
+        names = set(by) | set(filters) | {"revenue"} | ({"orderdate"} if period is not None else set())
+        specs = {column_name: shared.column(column_name) for column_name in names}
+        if self.processes > 1:
+            pool = self._get_pool()
+            futures = [pool.submit(aggregate_partition, specs, left, right, by, period, filters)
+                       for left, right in self.partitions(start, stop)]
+            parts = [future.result() for future in futures]
+        else:
+            columns = {column_name: shared.arrays[column_name] for column_name in names}
+            parts = [aggregate_rows({column_name: values[left:right] for column_name, values in columns.items()},
+                                    by, period, filters)
+                     for left, right in self.partitions(start, stop)]
+        keys = by + (["orderdate"] if period is not None else [])
+        if len(parts) == 0:
+            parts = [aggregate_rows({column_name: shared.arrays[column_name][:0] for column_name in names}, by, period)]
+        result = pd.concat(parts, ignore_index=True)
+        if len(keys) == 0:
+            result = result.sum().to_frame().T.astype({"revenue": np.float64, "revenue_sq": np.float64})
+        elif len(parts) > 1:
+            result = result.groupby(keys, sort=False).sum().reset_index()
+        for column_name in by:
+            result[column_name] = shared.categories[column_name].take(result[column_name].to_numpy())
+        if period is not None:
+            result["orderdate"] = result["orderdate"].to_numpy(dtype=np.int64).view("datetime64[ns]")
+        result["count"] = result["count"].astype(np.int64)
+        return result
+
+MAP_REDUCE_ENGINE = MapReduceEngine()
+atexit.register(MAP_REDUCE_ENGINE.shutdown)
@@ -0,0 +1,246 @@
+"""Stage timing of dashboard callbacks exposed in Prometheus text format"""
+
+import bisect
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import Callable, List, Optional, Tuple
+
+STAGES = ["filter", "aggregate", "model", "figure", "serialize"]
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROWS_BUCKETS = (10, 100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+SLOW_CALLBACK_LOGGER = logging.getLogger("dashboard.slow_callbacks")
+
+class Histogram:
+    """
+    Prometheus histogram with one series per label values
+    """
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...], buckets: Tuple[float, ...]):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # label values -> [counts per bucket (not cumulative), sum, count]
+        self._series = OrderedDict()
+
+    def observe(self, label_values: Tuple[str, ...], value: float):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+        position = bisect.bisect_left(self.buckets, value)
+        if position < len(self.buckets):
+            series[0][position] += 1
+        series[1] += value
+        series[2] += 1
+
+    def exposition(self) -> List[str]:
+        """
+        Returns lines of histogram in Prometheus text format
+        """
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for label_values, (counts, total, count) in self._series.items():
+            labels = ",".join(f'{label}="{_escape(value)}"' for label, value in zip(self.labels, label_values))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f"{self.name}_sum{{{labels}}} {total}")
+            lines.append(f"{self.name}_count{{{labels}}} {count}")
+        return lines
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+class _NullStage:
+    """
+    Stage of disabled metrics or of code running outside of callback, it records nothing
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def rows(self, rows_out: Optional[int]):
+        pass
+
+NULL_STAGE = _NullStage()
+
+class _CallbackRun:
+    # callback running in current thread: its stages and the stack of open ones
+    __slots__ = ("name", "inputs", "start", "end", "stages", "stack")
+
+    def __init__(self, name: str, inputs: tuple):
+        self.name = name
+        self.inputs = inputs
+        self.start = time.perf_counter()
+        self.end = None
+        self.stages = []
+        self.stack = []
+
+class _Stage:
+    __slots__ = ("metrics", "run", "name", "rows_in", "rows_out", "start", "children")
+
+    def __init__(self, metrics: "CallbackMetrics", run: _CallbackRun, name: str, rows_in: Optional[int]):
+        self.metrics = metrics
+        self.run = run
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.children = 0.0
+
+    def __enter__(self):
+        self.run.stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        self.run.stack.pop()
+        if self.run.stack:
+            self.run.stack[-1].children += elapsed
+        # nested stages (e.g. filter inside aggregate) are not counted twice
+        self.metrics._record(self.run, self.name, elapsed - self.children, self.rows_in, self.rows_out)
+        return False
+
+    def rows(self, rows_out: Optional[int]):
+        """
+        Sets number of rows of stage output
+        """
+        self.rows_out = rows_out
+
+class CallbackMetrics:
+    """
+    Durations and row counts of stages of dashboard callbacks
+
+    Callbacks are wrapped by timed(), code inside them marks its stages with
+    `with METRICS.stage("aggregate", len(df)) as stage: ...; stage.rows(len(result))`.
+    Stage time excludes nested stages. Serialization of callback output by dash is
+    the serialize stage, it is measured by install_metrics hooks. Stages outside of
+    timed callbacks and all stages of disabled metrics cost one attribute check.
+    Callbacks running as background jobs are measured in the job process and are
+    not exposed.
+    """
+    def __init__(self, enabled: bool = False, slow_callback_ms: float = 0):
+        """
+        :param enabled: record stages of timed callbacks
+        :param slow_callback_ms: callbacks slower than this are logged with their inputs, 0 disables the log
+        """
+        self.enabled = enabled
+        self.slow_callback_ms = slow_callback_ms
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.stage_seconds = Histogram("dashboard_callback_stage_seconds", "Duration of callback stage without nested stages",
+                                       ("callback", "stage"), SECONDS_BUCKETS)
+        self.stage_rows_in = Histogram("dashboard_callback_stage_rows_in", "Rows of stage input",
+                                       ("callback", "stage"), ROWS_BUCKETS)
+        self.stage_rows_out = Histogram("dashboard_callback_stage_rows_out", "Rows of stage output",
+                                        ("callback", "stage"), ROWS_BUCKETS)
+        self.callback_seconds = Histogram("dashboard_callback_seconds", "Duration of callback including serialization",
+                                          ("callback",), SECONDS_BUCKETS)
+
+    def configure(self, enabled: bool, slow_callback_ms: float = 0):
+        self.enabled = enabled
+        self.slow_callback_ms = slow_callback_ms
+
+    def timed(self, name: str) -> Callable:
+        """
+        Decorator of callback function, its stages are recorded with callback label name
+        """
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                run = _CallbackRun(name, args)
+                self._local.run = run
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self._local.run = None
+                    run.end = time.perf_counter()
+                    # finished in request thread, serialize stage and total are recorded after response is built
+                    self._local.finished = run
+            return wrapper
+        return decorator
+
+    def stage(self, name: str, rows_in: Optional[int] = None):
+        """
+        Returns context manager measuring stage of running callback
+        :param name: one of STAGES
+        :param rows_in: rows of stage input, None if unknown (e.g. query backend)
+        """
+        if not self.enabled:
+            return NULL_STAGE
+        run = getattr(self._local, "run", None)
+        if run is None:
+            return NULL_STAGE
+        return _Stage(self, run, name, rows_in)
+
+    def _record(self, run: _CallbackRun, stage: str, seconds: float, rows_in: Optional[int], rows_out: Optional[int]):
+        run.stages.append((stage, seconds, rows_in, rows_out))
+        with self._lock:
+            self.stage_seconds.observe((run.name, stage), seconds)
+            if rows_in is not None:
+                self.stage_rows_in.observe((run.name, stage), rows_in)
+            if rows_out is not None:
+                self.stage_rows_out.observe((run.name, stage), rows_out)
+
+    def finish_request(self, response_size: Optional[int] = None):
+        """
+        Records serialize stage and duration of callback finished in current request thread
+        :param response_size: bytes of serialized response, logged for slow callbacks
+        """
+        run = getattr(self._local, "finished", None)
+        if run is None:
+            return
+        self._local.finished = None
+        self._record(run, "serialize", time.perf_counter() - run.end, None, None)
+        total = time.perf_counter() - run.start
+        with self._lock:
+            self.callback_seconds.observe((run.name,), total)
+        if 0 < self.slow_callback_ms <= total * 1000:
+            stages = {}
+            for stage, seconds, _, _ in run.stages:
+                stages[stage] = round(stages.get(stage, 0) + seconds * 1000, 1)
+            inputs = [value for value in run.inputs if not callable(value)]
+            SLOW_CALLBACK_LOGGER.warning("slow callback %s: %.0f ms, stages %s, response %s bytes, inputs %s",
+                                         run.name, total * 1000, stages, response_size,
+                                         json.dumps(inputs, default=str, ensure_ascii=False))
+
+    def exposition(self) -> str:
+        """
+        Returns all histograms in Prometheus text format
+        """
+        with self._lock:
+            lines = []
+            for histogram in (self.callback_seconds, self.stage_seconds, self.stage_rows_in, self.stage_rows_out):
+                lines += histogram.exposition()
+        return "\n".join(lines) + "\n"
+
+METRICS = CallbackMetrics()
+
+def install_metrics(server, metrics: CallbackMetrics = METRICS, path: str = "/metrics"):
+    """
+    Adds route with metrics in Prometheus text format to flask server and measures serialization of callbacks
+    :param server: flask server of dash app
+    """
+    import flask
+
+    @server.after_request
+    def finish_callback(response: flask.Response) -> flask.Response:
+        if metrics.enabled:
+            metrics.finish_request(response.content_length)
+        return response
+
+    @server.route(path)
+    def metrics_route():
+        return flask.Response(metrics.exposition(), content_type=CONTENT_TYPE)
@@ -0,0 +1,168 @@
+"""Cache of serialized callback responses shared by server processes"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import warnings
+from contextlib import closing
+from datetime import date
+from typing import Callable, Iterable, Optional, Tuple
+
+import flask
+
+# next to cache of background callbacks, directories of caches are ignored by git
+CACHE_PATH = os.path.join(".response_cache", "responses.cache.db")
+
+CACHE_SCHEMA = 'CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, etag TEXT, body BLOB, created REAL)'
+
+UPDATE_COMPONENT_PATH = "_dash-update-component"
+
+def normalize_value(value):
+    """
+    Returns input value in the form equal values of filters have
+    Multi dropdown values are sorted, empty ones are None as in normalize_filter_key.
+    """
+    if isinstance(value, list) and all(isinstance(item, str) for item in value):
+        return sorted(set(value)) or None
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+def response_key(payload: dict, version: str) -> str:
+    """
+    Returns cache key of callback request: its outputs, normalized inputs and version of data
+    :param payload: json body of _dash-update-component request
+    :param version: version of data and settings used by callbacks
+    """
+    inputs = sorted((f"{item['id']}.{item['property']}", normalize_value(item.get('value')))
+                    for item in payload.get("inputs", []) + payload.get("state", []))
+    text = json.dumps([payload["output"], inputs, version], sort_keys=True, default=str)
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+def output_ids(payload: dict) -> set:
+    outputs = payload.get("outputs", [])
+    if isinstance(outputs, dict):
+        outputs = [outputs]
+    return {output["id"] for output in outputs}
+
+class ResponseCache:
+    """
+    Callback responses stored in SQLite database, so all server processes share them
+    Entries are keyed by response_key and carry ETag of their body. The oldest
+    entries are evicted when there are more than max_entries of them.
+    """
+    def __init__(self, path: str = CACHE_PATH, max_entries: int = 512):
+        """
+        :param path: path to cache database, it is created if it does not exist
+        :param max_entries: maximal number of cached responses
+        """
+        self.path = path
+        self.max_entries = max_entries
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with closing(self._connect()) as con, con:
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute(CACHE_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=5)
+
+    def get(self, key: str) -> Optional[Tuple[str, bytes]]:
+        """
+        Returns (etag, body) of cached response or None
+        """
+        with closing(self._connect()) as con:
+            return con.execute("SELECT etag, body FROM responses WHERE key = ?", (key,)).fetchone()
+
+    def put(self, key: str, body: bytes) -> str:
+        """
+        Stores response body and returns its ETag
+        """
+        etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+        with closing(self._connect()) as con, con:
+            con.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)", (key, etag, body, time.time()))
+            con.execute("DELETE FROM responses WHERE key IN "
+                        "(SELECT key FROM responses ORDER BY created DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+        return etag
+
+    def clear(self):
+        with closing(self._connect()) as con, con:
+            con.execute("DELETE FROM responses")
+
+def install_response_cache(server: flask.Flask, cache: ResponseCache, get_version: Callable[[], Optional[str]],
+                           cached_outputs: Iterable[str]):
+    """
+    Serves responses of callbacks from cache before dash computes them
+    Responses carry ETag of their body, cached ones are answered with 304 to requests with
+    matching If-None-Match. Dash renderer does not send it, HTTP caches and scripted clients do.
+    Responses of callbacks computed by dash are stored, background callbacks are stored
+    when their job result is polled.
+    :param server: flask server of dash app
+    :param get_version: returns version of data and settings, None disables caching
+    :param cached_outputs: ids of components whose callbacks are cached
+    """
+    cached_outputs = set(cached_outputs)
+
+    @server.before_request
+    def serve_cached_response():
+        if not flask.request.path.endswith(UPDATE_COMPONENT_PATH) or flask.request.method != "POST":
+            return None
+        payload = flask.request.get_json(silent=True)
+        if not payload or "output" not in payload or not output_ids(payload) <= cached_outputs:
+            return None
+        version = get_version()
+        if version is None:
+            return None
+        key = response_key(payload, version)
+        flask.g.response_cache_key = key
+        try:
+            entry = cache.get(key)
+        except sqlite3.Error as error:
+            warnings.warn(f"response cache is not available: {error}")
+            return None
+        if entry is None:
+            return None
+        etag, body = entry
+        if etag in flask.request.if_none_match:
+            response = flask.Response(status=304)
+        else:
+            response = flask.Response(body, mimetype="application/json")
+        response.set_etag(etag)
+        flask.g.response_cache_key = None
+        return response
+
+    @server.after_request
+    def store_response(response: flask.Response) -> flask.Response:
+        key = flask.g.pop("response_cache_key", None)
+        if key is None or response.status_code != 200:
+            return response
+        body = response.get_data()
+        # first request of background callback returns job, only results are stored
+        if b'"response"' not in body:
+            return response
+        try:
+            response.set_etag(cache.put(key, body))
+        except sqlite3.Error as error:
+            warnings.warn(f"response cache is not available: {error}")
+        return response
+
+def prewarm(server: flask.Flask, requests: Iterable[dict], interval: float = 0.25, timeout: float = 60):
+    """
+    Requests callbacks through test client, so their responses are stored in cache
+    Background callbacks are polled until their jobs finish.
+    :param requests: json bodies of _dash-update-component requests
+    :param interval: poll interval of background callbacks in seconds
+    :param timeout: maximal wait of one background callback in seconds
+    """
+    client = server.test_client()
+    for payload in requests:
+        data = client.post("/" + UPDATE_COMPONENT_PATH, json=payload).get_json(silent=True) or {}
+        deadline = time.monotonic() + timeout
+        while "cacheKey" in data and time.monotonic() < deadline:
+            time.sleep(interval)
+            poll = client.post(f"/{UPDATE_COMPONENT_PATH}?cacheKey={data['cacheKey']}&job={data['job']}", json=payload)
+            result = poll.get_json(silent=True) or {}
+            if "response" in result:
+                break
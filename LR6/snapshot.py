@@ -0,0 +1,129 @@
+"""Columnar on-disk snapshot of order dataframe"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import warnings
+import numpy as np
+import pandas as pd
+from typing import Optional
+
+SNAPSHOT_VERSION = 3
+
+def snapshot_dir(path: str, compact: bool = False) -> str:
+    """
+    Returns directory of snapshot of database, it is stored next to database file
+    :param compact: snapshot of dataframe with compact schema
+    """
+    return path + (".compact" if compact else "") + ".snapshot"
+
+def file_checksum(path: str, chunk_size: int = 2**20) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def wal_stat(path: str) -> Optional[list]:
+    """
+    Returns [mtime_ns, size] of write-ahead log of database or None if there is no log
+    Rows committed in WAL mode stay in the log until checkpoint, database file does not change.
+    """
+    try:
+        stat = os.stat(path + "-wal")
+    except FileNotFoundError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+def save_snapshot(df: pd.DataFrame, path: str, compact: bool = False):
+    """
+    Saves dataframe as one .npy file per column next to database
+    Datetime columns are stored as int64 in their own unit, string and categorical
+    columns as codes with categories in meta.json. Snapshot is written to a
+    temporary directory and renamed, so readers never see a partial snapshot.
+    :param df: dataframe loaded from database
+    :param path: path to database
+    :param compact: dataframe has compact schema
+    """
+    stat = os.stat(path)
+    meta = {
+        "version": SNAPSHOT_VERSION,
+        "mtime_ns": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "checksum": file_checksum(path),
+        "wal": wal_stat(path),
+        "length": len(df),
+        "columns": {},
+    }
+    target = snapshot_dir(path, compact)
+    tmp = tempfile.mkdtemp(prefix=os.path.basename(target) + ".", dir=os.path.dirname(os.path.abspath(target)))
+    try:
+        for column_name in df.columns:
+            column = df[column_name]
+            column_meta = {"dtype": str(column.dtype)}
+            if pd.api.types.is_datetime64_dtype(column.dtype):
+                values = column.to_numpy().view(np.int64)
+                column_meta["kind"] = "datetime"
+            elif isinstance(column.dtype, pd.CategoricalDtype):
+                values = column.cat.codes.to_numpy()
+                column_meta["kind"] = "categorical"
+                column_meta["categories"] = column.cat.categories.tolist()
+            elif pd.api.types.is_numeric_dtype(column.dtype):
+                values = column.to_numpy()
+                column_meta["kind"] = "numeric"
+            else:
+                codes, categories = pd.factorize(column)
+                values = codes.astype(np.int32)
+                column_meta["kind"] = "codes"
+                column_meta["categories"] = categories.tolist()
+            np.save(os.path.join(tmp, column_name + ".npy"), values, allow_pickle=False)
+            meta["columns"][column_name] = column_meta
+        with open(os.path.join(tmp, "meta.json"), "w") as f:
+            json.dump(meta, f)
+        if os.path.exists(target):
+            shutil.rmtree(target, ignore_errors=True)
+        os.rename(tmp, target)
+    except OSError as error:
+        shutil.rmtree(tmp, ignore_errors=True)
+        warnings.warn(f"snapshot of {path} was not saved: {error}")
+
+def _is_valid(meta: dict, path: str) -> bool:
+    if meta.get("version") != SNAPSHOT_VERSION or wal_stat(path) != meta["wal"]:
+        return False
+    stat = os.stat(path)
+    if stat.st_mtime_ns == meta["mtime_ns"] and stat.st_size == meta["size"]:
+        return True
+    # database was touched or copied, contents decide
+    return stat.st_size == meta["size"] and file_checksum(path) == meta["checksum"]
+
+def load_snapshot(path: str, compact: bool = False) -> Optional[pd.DataFrame]:
+    """
+    Returns dataframe from snapshot of database or None if there is no valid snapshot
+    Numeric, datetime and codes of categorical columns are memory-mapped read-only, so
+    processes loading the same snapshot share their pages. String columns are decoded
+    into a private copy of every process, compact schema keeps them shared as categoricals.
+    Columns have the dtypes of the saved dataframe.
+    :param path: path to database
+    :param compact: load snapshot of dataframe with compact schema
+    """
+    directory = snapshot_dir(path, compact)
+    try:
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+        if not _is_valid(meta, path):
+            return None
+        columns = {}
+        for column_name, column_meta in meta["columns"].items():
+            values = np.load(os.path.join(directory, column_name + ".npy"), mmap_mode="r", allow_pickle=False)
+            if column_meta["kind"] == "datetime":
+                values = values.view(column_meta["dtype"])
+            elif column_meta["kind"] == "categorical":
+                values = pd.Categorical.from_codes(values, column_meta["categories"])
+            elif column_meta["kind"] == "codes":
+                values = pd.Categorical.from_codes(values, column_meta["categories"]).astype(column_meta["dtype"])
+            columns[column_name] = values
+    except (OSError, ValueError, KeyError):
+        return None
+    return pd.DataFrame(columns, copy=False)
@@ -0,0 +1,267 @@
+"""Query backend computing filters and aggregations inside SQLite database"""
+
+import os
+import sqlite3
+import warnings
+import numpy as np
+import pandas as pd
+from contextlib import closing
+from typing import Iterator, Optional, List, Tuple
+
+from funcs import PATH, sql_date, get_pool, round_cents
+
+# order lines with the same columns as get_dataframe, filter conditions are placed
+# into the inner WHERE so that index on orders.OrderDate is used
+ORDER_LINES_QUERY = '''SELECT
+    orders.ShipCountry as shipcountry,
+    orders.CustomerID as customerid,
+    orders.OrderID as orderid,
+    orders.OrderDate as orderdate,
+    details.ProductID as productid,
+    (details.UnitPrice*details.Quantity*(1-details.Discount)) as revenue,
+    products.ProductName as productname,
+    coalesce(suppliers.Region, 'Unknown (None)') as region,
+    categories.CategoryName as categoryname,
+    categories.CategoryID as categoryid
+    FROM orders
+    INNER JOIN "order details" as details on details.OrderID=orders.OrderID
+    INNER JOIN products on products.ProductID=details.ProductID
+    INNER JOIN suppliers on suppliers.SupplierID=products.SupplierID
+    INNER JOIN categories on categories.CategoryID=products.CategoryID'''
+
+# filterable columns of order lines and expressions they are computed from
+FILTER_EXPRESSIONS = {
+    "orderdate": "orders.OrderDate",
+    "categoryname": "categories.CategoryName",
+    "region": "coalesce(suppliers.Region, 'Unknown (None)')",
+    "shipcountry": "orders.ShipCountry",
+    "customerid": "orders.CustomerID",
+}
+
+INDEXES = [
+    'CREATE INDEX IF NOT EXISTS orders_orderdate ON orders (OrderDate)',
+    'CREATE INDEX IF NOT EXISTS orders_shipcountry_orderdate ON orders (ShipCountry, OrderDate)',
+    'CREATE INDEX IF NOT EXISTS products_categoryid ON products (CategoryID)',
+]
+
+# monday closing the W-MON week of the date, same label as resample('W-MON') for dates without time
+WEEK_EXPRESSION = "date(orderdate, 'weekday 1')"
+
+# labels of periods of revenue_per_period, same as resample with PERIODS frequencies
+PERIOD_EXPRESSIONS = {
+    "day": "date(orderdate)",
+    "week": WEEK_EXPRESSION,
+    "month": "date(orderdate, 'start of month')",
+}
+
+class OrdersQuery:
+    """
+    Builder of parameterized query over order lines
+    Example:
+        OrdersQuery().where_in("region", ["Europe"]).group_by("shipcountry").select("sum(revenue) as revenue").compile()
+    """
+    def __init__(self):
+        self.conditions = []
+        self.params = []
+        self.columns = []
+        self.groups = []
+        self.orders = []
+        self.limit_value = None
+
+    def where_date(self, start_date: Optional[str] = None, end_date: Optional[str] = None) -> "OrdersQuery":
+        """
+        Keeps order lines with start_date <= orderdate <= end_date, both bounds are required as in filter_dataframe
+        """
+        if start_date is not None and end_date is not None:
+            self.conditions.append(f"{FILTER_EXPRESSIONS['orderdate']} between ? and ?")
+            self.params += [sql_date(start_date), sql_date(end_date)]
+        return self
+
+    def where_in(self, column_name: str, values: Optional[List[str]]) -> "OrdersQuery":
+        """
+        Keeps order lines with column value in values, None or empty list means no filter
+        """
+        if values is not None and len(values) != 0:
+            values = sorted(set(values))
+            self.conditions.append(f"{FILTER_EXPRESSIONS[column_name]} in ({', '.join('?' * len(values))})")
+            self.params += values
+        return self
+
+    def where(self, start_date: Optional[str] = None, end_date: Optional[str] = None, category: Optional[List[str]] = None,
+              region: Optional[List[str]] = None, shipcountry: Optional[List[str]] = None) -> "OrdersQuery":
+        """
+        Applies the same filters as filter_dataframe
+        """
+        return (self.where_date(start_date, end_date)
+                .where_in("categoryname", category)
+                .where_in("region", region)
+                .where_in("shipcountry", shipcountry))
+
+    def select(self, *columns: str) -> "OrdersQuery":
+        self.columns += columns
+        return self
+
+    def group_by(self, *columns: str) -> "OrdersQuery":
+        self.groups += columns
+        return self
+
+    def order_by(self, *columns: str) -> "OrdersQuery":
+        self.orders += columns
+        return self
+
+    def limit(self, limit: Optional[int]) -> "OrdersQuery":
+        self.limit_value = limit
+        return self
+
+    def compile(self) -> Tuple[str, list]:
+        """
+        Returns sql text and its parameters
+        """
+        query = ORDER_LINES_QUERY
+        if len(self.conditions) != 0:
+            query += "\n    WHERE " + " and ".join(self.conditions)
+        sql = f"SELECT {', '.join(self.groups + self.columns) or '*'} FROM ({query})"
+        params = list(self.params)
+        if len(self.groups) != 0:
+            # group by expressions, their aliases may shadow columns of order lines
+            sql += f" GROUP BY {', '.join(column.split(' as ')[0] for column in self.groups)}"
+        if len(self.orders) != 0:
+            sql += f" ORDER BY {', '.join(self.orders)}"
+        if self.limit_value is not None:
+            sql += " LIMIT ?"
+            params.append(int(self.limit_value))
+        return sql, params
+
+def ensure_indexes(path: str = PATH):
+    """
+    Creates indexes used by OrdersQuery filters if database is writable
+    """
+    try:
+        with closing(sqlite3.connect(path)) as con, con:
+            for statement in INDEXES:
+                con.execute(statement)
+    except sqlite3.OperationalError as error:
+        warnings.warn(f"indexes for {path} were not created: {error}")
+
+class SqlOrders:
+    """
+    Order lines stored in database, used by funcs and drawer instead of dataframe
+    Filters and aggregations are executed by SQLite, only their results are loaded.
+    """
+    def __init__(self, path: str = PATH, create_indexes: bool = True):
+        """
+        :param path: path to northwind database
+        :param create_indexes: create indexes on filtered columns
+        """
+        self.path = path
+        if create_indexes:
+            ensure_indexes(path)
+
+    def data_version(self) -> int:
+        """
+        Returns modification time of database files, used as version of data
+        """
+        version = os.stat(self.path).st_mtime_ns
+        if os.path.exists(self.path + "-wal"):
+            version = max(version, os.stat(self.path + "-wal").st_mtime_ns)
+        return version
+
+    def read(self, query: OrdersQuery) -> pd.DataFrame:
+        sql, params = query.compile()
+        df = pd.read_sql(sql, con=get_pool(self.path).connection(), params=params)
+        if "orderdate" in df.columns:
+            df["orderdate"] = pd.to_datetime(df["orderdate"])
+        if "revenue" in df.columns:
+            df["revenue"] = df["revenue"].astype(np.float64)
+        return df
+
+    def unique(self, column_name: str) -> np.ndarray:
+        """
+        Returns distinct values of column in order of their first order date
+        """
+        query = (OrdersQuery().group_by(column_name).select("min(orderdate) as first_orderdate")
+                 .order_by("first_orderdate", column_name))
+        return self.read(query)[column_name].to_numpy()
+
+    def filter(self, start_date: Optional[str] = None, end_date: Optional[str] = None, category: Optional[List[str]] = None,
+               region: Optional[List[str]] = None, shipcountry: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        Returns filtered order lines sorted by orderdate, see filter_dataframe
+        """
+        return self.read(OrdersQuery().where(start_date, end_date, category, region, shipcountry).order_by("orderdate"))
+
+    def iter_filter(self, start_date: Optional[str] = None, end_date: Optional[str] = None,
+                    category: Optional[List[str]] = None, region: Optional[List[str]] = None,
+                    shipcountry: Optional[List[str]] = None, chunk_rows: int = 100_000) -> Iterator[pd.DataFrame]:
+        """
+        Yields filtered order lines sorted by orderdate by chunks of chunk_rows rows, see funcs.iter_filtered
+        Pooled connection of the thread consuming the generator reads the chunks.
+        """
+        sql, params = OrdersQuery().where(start_date, end_date, category, region, shipcountry).order_by("orderdate").compile()
+        for chunk in pd.read_sql(sql, con=get_pool(self.path).connection(), params=params, chunksize=chunk_rows):
+            chunk["orderdate"] = pd.to_datetime(chunk["orderdate"])
+            chunk["revenue"] = chunk["revenue"].astype(np.float64)
+            yield chunk
+
+    def weekly_revenue(self, start_date: Optional[str] = None, end_date: Optional[str] = None, category: Optional[List[str]] = None,
+                       region: Optional[List[str]] = None, shipcountry: Optional[List[str]] = None) -> pd.Series:
+        """
+        Returns sum of revenue per W-MON week of filtered order lines, indexed by week
+        """
+        return self.revenue_per_period("week", start_date, end_date, category, region, shipcountry)
+
+    def revenue_per_period(self, period: str, start_date: Optional[str] = None, end_date: Optional[str] = None,
+                           category: Optional[List[str]] = None, region: Optional[List[str]] = None,
+                           shipcountry: Optional[List[str]] = None) -> pd.Series:
+        """
+        Returns sum of revenue per period of filtered order lines, indexed by period
+        :param period: one of PERIOD_EXPRESSIONS
+        """
+        query = (OrdersQuery().where(start_date, end_date, category, region, shipcountry)
+                 .group_by(f"{PERIOD_EXPRESSIONS[period]} as orderdate").select("sum(revenue) as revenue").order_by("orderdate"))
+        return self.read(query).set_index("orderdate")["revenue"]
+
+    def order_date_range(self) -> Tuple[Optional[pd.Timestamp], Optional[pd.Timestamp]]:
+        """
+        Returns the first and the last order date or (None, None) if there are no orders
+        """
+        first, last = self.read(OrdersQuery().select("min(orderdate) as first", "max(orderdate) as last")).iloc[0]
+        if first is None:
+            return None, None
+        return pd.Timestamp(first), pd.Timestamp(last)
+
+    def weekly_mean_revenue_by_region(self, start_date: Optional[str] = None, end_date: Optional[str] = None,
+                                      category: Optional[List[str]] = None,
+                                      shipcountry: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        Returns mean revenue of order line per W-MON week for each region, sorted by region and week
+        """
+        query = (OrdersQuery().where(start_date, end_date, category, None, shipcountry)
+                 .group_by("region", f"{WEEK_EXPRESSION} as orderdate").select("avg(revenue) as revenue")
+                 .order_by("region", "orderdate"))
+        return self.read(query)
+
+    def weekly_revenue_cube(self) -> pd.DataFrame:
+        """
+        Returns revenue sum and count of order lines per W-MON week, category, region and ship country
+        """
+        query = (OrdersQuery().group_by("categoryname", "region", "shipcountry", f"{WEEK_EXPRESSION} as orderdate")
+                 .select("sum(revenue) as revenue", "count(*) as count"))
+        return self.read(query)
+
+    def revenue_by(self, by: List[str], start_date: Optional[str] = None, end_date: Optional[str] = None,
+                   category: Optional[List[str]] = None, region: Optional[List[str]] = None,
+                   shipcountry: Optional[List[str]] = None, limit: Optional[int] = None, sort: bool = True) -> pd.DataFrame:
+        """
+        Returns sum of revenue of filtered order lines grouped by columns, sorted by revenue descending
+        :param limit: number of top rows to return, all rows if None
+        :param sort: sort rows by revenue, rows are in arbitrary order if False and limit is None
+        """
+        query = (OrdersQuery().where(start_date, end_date, category, region, shipcountry)
+                 .group_by(*by).select("sum(revenue) as revenue").limit(limit))
+        if sort or limit is not None:
+            query.order_by("revenue desc")
+        df = self.read(query)
+        # same values as revenue_by of dataframe
+        df["revenue"] = round_cents(df["revenue"])
+        return df
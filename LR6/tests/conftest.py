@@ -0,0 +1,14 @@
+import os
+import sys
+
+import pytest
+
+LR6_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, LR6_DIR)
+
+@pytest.fixture(scope="session", autouse=True)
+def lr6_cwd():
+    # modules open northwind.db and config.json relative to LR6, module fixtures copy it too
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.chdir(LR6_DIR)
+        yield
@@ -0,0 +1,34 @@
+import threading
+
+import flask
+import pandas as pd
+import pytest
+
+import export
+
+
+@pytest.mark.filterwarnings("ignore:export")
+def test_failed_export_aborts_streamed_response(monkeypatch, tmp_path):
+    first_chunk_read = threading.Event()
+
+    def failing_dataset(data, chunk_rows, **filters):
+        yield pd.DataFrame({"revenue": range(1000)})
+        first_chunk_read.wait(10)
+        raise OSError("disk is gone")
+
+    monkeypatch.setitem(export.DATASETS, "lines", failing_dataset)
+    server = flask.Flask(__name__)
+    export.install_export(server, export.ExportService(str(tmp_path)), lambda: None, lambda: "version")
+
+    response = server.test_client().get("/export/lines.csv", buffered=False)
+    assert response.status_code == 200
+    blocks = iter(response.response)
+    assert next(blocks).startswith(b"revenue\n")
+    first_chunk_read.set()
+    # server aborts the connection, client does not get the last chunk of a complete body
+    with pytest.raises(RuntimeError, match="failed"):
+        for _ in blocks:
+            pass
+    response.close()
+    # part file of failed export is removed, nothing is left to serve as complete
+    assert not list(tmp_path.iterdir())
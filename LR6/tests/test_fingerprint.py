@@ -0,0 +1,26 @@
+import shutil
+import sqlite3
+
+import pytest
+
+import funcs
+
+@pytest.fixture
+def database(tmp_path):
+    path = str(tmp_path / "northwind.db")
+    shutil.copy(funcs.PATH, path)
+    return path
+
+@pytest.mark.parametrize("statement", [
+    "UPDATE products SET ProductName = 'Chai Latte' WHERE ProductID = 1",
+    "UPDATE categories SET CategoryName = 'Drinks' WHERE CategoryID = 1",
+    "UPDATE orders SET ShipCountry = 'Poland' WHERE OrderID = (SELECT min(OrderID) FROM orders WHERE ShipCountry = 'France')",
+    "UPDATE suppliers SET Region = 'Western Europe' WHERE Region IS NULL AND SupplierID = "
+    "(SELECT min(SupplierID) FROM suppliers WHERE Region IS NULL)",
+])
+def test_fingerprint_changes_with_dimension_columns(database, statement):
+    before = funcs.data_fingerprint(funcs.get_dataframe(database, use_snapshot=False))
+    assert before == funcs.data_fingerprint(funcs.get_dataframe(database, use_snapshot=False))
+    with sqlite3.connect(database) as con:
+        assert con.execute(statement).rowcount == 1
+    assert funcs.data_fingerprint(funcs.get_dataframe(database, use_snapshot=False)) != before
@@ -0,0 +1,48 @@
+import shutil
+import sqlite3
+import threading
+import time
+
+import pytest
+
+import funcs
+
+@pytest.fixture
+def loader(tmp_path):
+    path = str(tmp_path / "northwind.db")
+    shutil.copy(funcs.PATH, path)
+    loader = funcs.OrdersLoader(path)
+    yield loader
+    loader.stop()
+
+def test_refresh_error_is_reported_and_retried(loader, monkeypatch):
+    calls = []
+    def refresh():
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            raise sqlite3.OperationalError("database is locked")
+        return 0
+    monkeypatch.setattr(loader, "refresh", refresh)
+    with pytest.warns(UserWarning, match="database is locked"):
+        loader.start(0.01)
+        deadline = time.monotonic() + 5
+        while len(calls) < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+    assert len(calls) >= 3
+
+def test_stop_during_refresh_ends_refreshing(loader, monkeypatch):
+    started, release = threading.Event(), threading.Event()
+    calls = []
+    def refresh():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 0
+    monkeypatch.setattr(loader, "refresh", refresh)
+    loader.start(0.01)
+    assert started.wait(5)
+    loader.stop()
+    release.set()
+    time.sleep(0.1)
+    assert len(calls) == 1
+    assert loader._timer is None
@@ -0,0 +1,40 @@
+import flask
+
+from response_cache import ResponseCache, install_response_cache, UPDATE_COMPONENT_PATH
+
+PAYLOAD = {
+    "output": "table.data",
+    "outputs": {"id": "table", "property": "data"},
+    "inputs": [{"id": "dropdown", "property": "value", "value": ["b", "a"]}],
+    "changedPropIds": [],
+}
+
+def make_server(tmp_path):
+    server = flask.Flask(__name__)
+    calls = []
+
+    @server.route("/" + UPDATE_COMPONENT_PATH, methods=["POST"])
+    def update_component():
+        calls.append(1)
+        return flask.Response('{"response": {"table": {"data": [1, 2]}}}', mimetype="application/json")
+
+    install_response_cache(server, ResponseCache(str(tmp_path / "responses.cache.db")), lambda: "version", ["table"])
+    return server.test_client(), calls
+
+def test_cached_response_with_matching_etag_is_not_modified(tmp_path):
+    client, calls = make_server(tmp_path)
+    first = client.post("/" + UPDATE_COMPONENT_PATH, json=PAYLOAD)
+    etag = first.headers["ETag"]
+    assert first.status_code == 200 and etag
+
+    cached = client.post("/" + UPDATE_COMPONENT_PATH, json=PAYLOAD)
+    assert cached.status_code == 200
+    assert cached.headers["ETag"] == etag and cached.data == first.data
+
+    not_modified = client.post("/" + UPDATE_COMPONENT_PATH, json=PAYLOAD, headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert not_modified.data == b""
+
+    changed = client.post("/" + UPDATE_COMPONENT_PATH, json=PAYLOAD, headers={"If-None-Match": '"other"'})
+    assert changed.status_code == 200 and changed.data == first.data
+    assert len(calls) == 1
@@ -0,0 +1,28 @@
+import shutil
+
+import pandas as pd
+import pytest
+
+import funcs
+from sql_backend import SqlOrders
+
+FILTERS = [
+    {},
+    {"start_date": "2017-01-01", "end_date": "2017-12-31"},
+    {"start_date": "2016-07-04", "end_date": "2018-05-06", "region": ["Western Europe", "North America"]},
+    {"category": ["Beverages", "Seafood"], "shipcountry": ["USA", "Germany", "UK"]},
+]
+
+@pytest.fixture(scope="module")
+def backends(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("db") / "northwind.db")
+    shutil.copy(funcs.PATH, path)
+    return funcs.get_dataframe(path, use_snapshot=False), SqlOrders(path)
+
+@pytest.mark.parametrize("by", [["customerid"], ["shipcountry"], ["categoryname", "productname"]])
+@pytest.mark.parametrize("filters", FILTERS)
+def test_revenue_by_matches_dataframe(backends, by, filters):
+    df, sql_orders = backends
+    expected = funcs.revenue_by(df, by, **filters).sort_values(by, ignore_index=True)
+    result = funcs.revenue_by(sql_orders, by, **filters).sort_values(by, ignore_index=True)
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False, check_exact=True)
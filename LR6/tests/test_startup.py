@@ -0,0 +1,11 @@
+from benchmark import STARTUP_BUDGET, import_times, total_import_time
+
+# loaded on the first request or by warm up, not when server workers import the app
+LAZY_MODULES = ["sklearn", "jupyter_dash", "funcs"]
+
+def test_import_dash_app_is_light_and_within_budget():
+    times = import_times("import dash_app")
+    imported = {module.strip() for _, module in times}
+    for name in LAZY_MODULES:
+        assert not any(module == name or module.startswith(name + ".") for module in imported), name
+    assert total_import_time(times) <= STARTUP_BUDGET